@@ -1,5 +1,9 @@
 from .SensorDeviceWidget import SensorDeviceWidget
 from .DataViewer import DataViewerWindow
+from .SyncView import SyncViewWindow
+from .SessionCoordinator import SessionCoordinator
+from .DeviceTable import DeviceTable
+from .FramePacer import FramePacer
 from .themes import BLEConnectTheme
 from bleak import BleakClient, BleakScanner, BLEDevice, AdvertisementData
 import dearpygui.dearpygui as dpg
@@ -10,7 +14,10 @@ import argparse
 from threading import Thread
 import asyncio
 from .SensorDevice import SensorDevice
-from .config import BG_LOOP
+from .ScanPolicy import ScanPolicy
+from .DeviceRegistry import DeviceRegistry
+from .Housekeeping import HousekeepingScheduler
+from .config import BG_LOOP, SCAN_ACTIVE_WINDOW, SCAN_PASSIVE_WINDOW, SCAN_IDLE_INTERVAL, CONNECT_KNOWN_DEVICES, ADV_CAPTURE_MODE, SYNC_ENABLED
 
 
 class BLEConnect:
@@ -24,12 +31,18 @@ class BLEConnect:
         self.exer_sensors_table = "exer_sensors_table"
         self.exer_sensors_row = "exer_sensors_row"
         self.scan_loading = "ble_scan_loading"
-        self.filter_tag = "devices_filter"
         self.menubar = True
         self.stop_event = asyncio.Event()
         self.themes = None
         self.separate_sensors_windows = True
         self.graph_viewer: DataViewerWindow = None
+        self.sync_view: SyncViewWindow = None
+        self.session = SessionCoordinator(self)
+        self.device_table = DeviceTable(self)
+        self.frame_pacer = FramePacer()
+        self.scan_policy = ScanPolicy()
+        self.registry = DeviceRegistry()
+        self.housekeeping = HousekeepingScheduler()
 
         def bleak_thread(loop):
             asyncio.set_event_loop(loop)
@@ -37,17 +50,43 @@ class BLEConnect:
         t = Thread(target=bleak_thread, args=(BG_LOOP,))
         t.start()
         asyncio.run_coroutine_threadsafe(self.ble_scan(), BG_LOOP)
+        self.housekeeping.start()
 
     async def ble_scan(self):
+        while not self.stop_event.is_set():
+            if ADV_CAPTURE_MODE:
+                # Samples only arrive through advertisements, never stop listening
+                await self.scan_window(SCAN_ACTIVE_WINDOW, scanning_mode="passive")
+            elif self.scan_policy.all_targets_connected([d.device for d in self.devices.values()]):
+                # Everything we want is connected: only listen now and then to keep RSSI/last seen fresh
+                await self.scan_window(SCAN_PASSIVE_WINDOW, scanning_mode="passive")
+                await self.wait_for_stop(SCAN_IDLE_INTERVAL)
+            else:
+                await self.scan_window(SCAN_ACTIVE_WINDOW, scanning_mode="active")
+
+    async def scan_window(self, duration: float, scanning_mode: str = "active"):
         dpg.configure_item(self.scan_loading, show=True)
-        async with BleakScanner(self.on_device_detected) as scanner:
-            # Important! Wait for an event to trigger stop, otherwise scannerwill stop immediately.
-            await self.stop_event.wait()
+        try:
+            async with BleakScanner(self.on_device_detected, service_uuids=self.scan_policy.service_uuids(), scanning_mode=scanning_mode) as scanner:
+                # Important! Wait for an event to trigger stop, otherwise scannerwill stop immediately.
+                await self.wait_for_stop(duration)
+        except Exception as e:
+            if scanning_mode == "active":
+                raise e
+            # Passive scanning is not supported by every backend (e.g. CoreBluetooth), fall back to a short active scan
+            print(f"Passive scanning not available ({e}), using active scanning instead")
+            await self.scan_window(duration, scanning_mode="active")
         dpg.configure_item(self.scan_loading, show=False)
 
+    async def wait_for_stop(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
     def on_device_click(self, sender, app_data, device):
         for d in self.devices.values():
-            d.set_selected(d.click_handler == sender)
+            d.set_selected(d is device)
 
     def on_device_detected(self, ble_device: BLEDevice, data: AdvertisementData):
         if not dpg.is_dearpygui_running():
@@ -55,15 +94,46 @@ class BLEConnect:
         if ble_device.address not in self.devices:
             sensor_device: SensorDevice = SensorDevice(ble_device=ble_device, ad_data=data)
             # print(f"New Device detected: {sensor_device}")
-            device_ui = SensorDeviceWidget(self, sensor_device, self.filter_tag, self.device_info_tag, self.exer_sensors_row, self.separate_sensors_windows)
-            device_ui.on_click = self.on_device_click
-            sensor_device.widget = device_ui
-            self.devices[ble_device.address] = device_ui
+            self.add_device(sensor_device)
+            self.frame_pacer.notify_data()
         else:
             sensor_device = self.devices[ble_device.address].device
+            if sensor_device.is_capturing:
+                self.devices[ble_device.address].on_advertisement(data)
+                return
+            if self.scan_policy.is_classified(ble_device.address):
+                # Already classified, advertisements are only useful for their RSSI
+                if self.scan_policy.should_update_rssi(ble_device.address):
+                    self.devices[ble_device.address].on_rssi_update(data)
+                return
+            if sensor_device.is_updating:
+                return
             # self.devices[device.address].device.update(data)
             asyncio.run_coroutine_threadsafe(sensor_device.update(data), BG_LOOP)
 
+    def add_device(self, sensor_device: SensorDevice):
+        device_ui = SensorDeviceWidget(self, sensor_device, self.device_table, self.device_info_tag, self.exer_sensors_row, self.separate_sensors_windows)
+        device_ui.on_click = self.on_device_click
+        sensor_device.widget = device_ui
+        sensor_device.scan_policy = self.scan_policy
+        sensor_device.registry = self.registry
+        sensor_device.housekeeping = self.housekeeping
+        self.devices[sensor_device.address] = device_ui
+        self.device_table.mark_dirty()
+        return device_ui
+
+    def connect_known_devices(self):
+        # Sensors seen in previous sessions are classified from the registry and connected without waiting for the scanner
+        for known in self.registry.known_devices():
+            if known.address in self.devices:
+                continue
+            print(f"Connecting to known device {known.name} ({known.address})")
+            sensor_device = SensorDevice(address=known.address, name=known.name)
+            device_ui = self.add_device(sensor_device)
+            sensor_device.preclassify(known)
+            device_ui.on_accepted_device()
+            asyncio.run_coroutine_threadsafe(sensor_device.connect(), BG_LOOP)
+
     async def run(self):
         dpg.create_viewport(title="ExerWatch BLE-Connect", width=1000, height=800)
         dpg.setup_dearpygui()
@@ -71,18 +141,32 @@ class BLEConnect:
         self.themes = BLEConnectTheme()
         self.make_devices_window("devices_list_window", False)
         self.graph_viewer = DataViewerWindow(self).show()
+        if SYNC_ENABLED:
+            self.sync_view = SyncViewWindow(self)
+        if CONNECT_KNOWN_DEVICES and not ADV_CAPTURE_MODE:
+            self.connect_known_devices()
         # dpg.show_debug()
         # dpg.show_item_registry()
         # self.run_scan(None)
 
+        self.frame_pacer.make_handlers()
         dpg.show_viewport(maximized=True)
 
         # dpg.start_dearpygui()  # below replaces, start_dearpygui()
         while dpg.is_dearpygui_running():
+            self.frame_pacer.begin_frame()
             jobs = dpg.get_callback_queue()  # retrieves and clears queue
             dpg.run_callbacks(jobs)
+            self.device_table.update()
+            if self.sync_view is not None:
+                self.sync_view.update()
+            self.frame_pacer.update_status()
             dpg.render_dearpygui_frame()
+            self.frame_pacer.end_frame()
+            # Sleeps until data or input arrives, between FRAME_MAX_FPS and FRAME_MIN_FPS
+            self.frame_pacer.wait()
         dpg.destroy_context()
+        self.registry.save()
 
         BG_LOOP.call_soon_threadsafe(BG_LOOP.stop)
 
@@ -96,6 +180,7 @@ class BLEConnect:
                     with dpg.menu(label="View"):
                         dpg.add_menu_item(label="Save Layout", callback=lambda: dpg.save_init_file("custom_layout.ini"))
                         dpg.add_menu_item(label="Show Demo", callback=lambda: self.toggle_demo())
+                    self.frame_pacer.make_status_text()
 
             # self.exer_sensors_row = dpg.add_child_window(label="ExerWatch Sensors", no_close=False, no_collapse=False, autosize=True, pos=(0, 0))
             if not self.separate_sensors_windows:
@@ -103,10 +188,11 @@ class BLEConnect:
 
             with dpg.group(horizontal=True) as grp:
                 with dpg.child_window(tag=self.devices_list_id, height=600, width=600, resizable_x=True):
+                    self.session.make_controls()
                     with dpg.group(horizontal=True):
                         dpg.add_loading_indicator(circle_count=5, tag=self.scan_loading, show=True, radius=2, color=(255, 255, 255, 255))
-                        dpg.add_input_text(label="Name filter (inc, -exc)", user_data=self.filter_tag, callback=lambda sender, app_data, user_data: dpg.set_value(user_data, dpg.get_value(sender)))
-                    dpg.add_filter_set(tag=self.filter_tag)
+                        dpg.add_input_text(label="Name filter (inc, -exc)", callback=self.device_table.set_filter)
+                    self.device_table.make_widget()
                 with dpg.child_window(tag=self.device_info_tag, auto_resize_y=True, auto_resize_x=True, resizable_x=True, resizable_y=True):
                     dpg.add_text("Click on a device to see details")
         if primary:
@@ -0,0 +1,88 @@
+import time
+from collections import deque
+import numpy as np
+
+# Added to time.monotonic() to get wall clock timestamps that stay monotonic within a session
+MONOTONIC_TO_EPOCH = time.time() - time.monotonic()
+
+
+class ClockModel:
+    """
+    Online linear fit of host arrival time against the device sample index,
+    host_time = intercept + period * index. BLE delivers samples in batches per
+    connection event, so arrival times are late by a varying amount: outliers
+    are rejected against the current fit and the line is moved down to the
+    earliest arrivals of the window, the closest to the sampling instants.
+    """
+
+    def __init__(self, window: int = 3000, min_points: int = 20, refit_every: int = 25, reject_sigma: float = 4.0, max_rejects: int = 50):
+        self.window = window
+        self.min_points = min_points
+        self.refit_every = refit_every
+        self.reject_sigma = reject_sigma
+        self.max_rejects = max_rejects  # consecutive rejections before the model is rebuilt, e.g. after a clock step
+        self.reset()
+
+    def reset(self):
+        self.points = deque(maxlen=self.window)
+        self.period: float = None
+        self.intercept: float = None
+        self.offset = 0.0
+        self.scale = 0.0
+        self.pending = 0
+        self.rejects = 0
+        self.rejected = 0
+
+    @property
+    def is_ready(self):
+        return self.period is not None
+
+    def add(self, index: int, host_time: float):
+        if self.is_ready:
+            residual = host_time - (self.intercept + self.period * index)
+            # BLE jitter is a few ms, the floor keeps a perfect fit from rejecting everything
+            if abs(residual) > self.reject_sigma * max(self.scale, 1e-3):
+                self.rejects += 1
+                self.rejected += 1
+                if self.rejects > self.max_rejects:
+                    self.reset()
+                    self.points.append((index, host_time))
+                return False
+        self.rejects = 0
+        self.points.append((index, host_time))
+        self.pending += 1
+        if len(self.points) >= self.min_points and (not self.is_ready or self.pending >= self.refit_every):
+            self.fit()
+        return True
+
+    def fit(self):
+        self.pending = 0
+        points = np.array(self.points)
+        x = points[:, 0] - points[0, 0]
+        y = points[:, 1] - points[0, 1]
+        x_mean, y_mean = x.mean(), y.mean()
+        dx = x - x_mean
+        denominator = np.dot(dx, dx)
+        if denominator <= 0:
+            return
+        period = np.dot(dx, y - y_mean) / denominator
+        if period <= 0:
+            return
+        intercept = y_mean - period * x_mean
+        residuals = y - (intercept + period * x)
+        self.scale = 1.4826 * float(np.median(np.abs(residuals - np.median(residuals))))
+        self.offset = float(np.min(residuals))
+        self.period = float(period)
+        self.intercept = float(points[0, 1] + intercept - period * points[0, 0])
+
+    def predict(self, index: float):
+        # Host monotonic time of the sample, None until enough points were seen
+        if not self.is_ready:
+            return None
+        return self.intercept + self.period * index + self.offset
+
+    def drift_ppm(self, nominal_rate: float):
+        # Deviation of the device sample clock from its nominal rate, in parts per million
+        if not self.is_ready:
+            return None
+        return (1.0 / (self.period * nominal_rate) - 1.0) * 1e6
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import threading
+from .config import KNOWN_DEVICES_FILE, FILTERED_DEVICES
+
+
+class KnownDevice:
+    def __init__(self, address: str, name: str = None, strategy: str = None, tx_handle: int = None, rx_handle: int = None, rssi: int = None, last_seen: float = None, accepted: bool = True):
+        self.address = address
+        self.name = name
+        self.strategy = strategy  # "exer" or "wit"
+        self.tx_handle = tx_handle
+        self.rx_handle = rx_handle
+        self.rssi = rssi
+        self.last_seen = last_seen
+        self.accepted = accepted
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class DeviceRegistry:
+    def __init__(self, file_path: str = KNOWN_DEVICES_FILE):
+        self.file_path = file_path
+        self.devices: dict[str, KnownDevice] = {}
+        self.lock = threading.Lock()
+        self.is_dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r") as f:
+                entries = json.load(f)
+            for entry in entries:
+                known = KnownDevice(**entry)
+                self.devices[known.address] = known
+            print(f"Loaded {len(self.devices)} known devices from {self.file_path}")
+        except Exception as e:
+            print(f"Exception loading known devices from {self.file_path}: {e}")
+
+    def save(self):
+        with self.lock:
+            if not self.is_dirty:
+                return
+            entries = [d.to_dict() for d in self.devices.values()]
+            self.is_dirty = False
+        try:
+            with open(self.file_path, "w") as f:
+                json.dump(entries, f, indent=2)
+        except Exception as e:
+            print(f"Exception saving known devices to {self.file_path}: {e}")
+
+    def get(self, address: str):
+        return self.devices.get(address)
+
+    def known_devices(self):
+        return [d for d in self.devices.values() if d.accepted and d.strategy is not None]
+
+    def is_accepted(self, name: str, address: str):
+        if FILTERED_DEVICES is None or len(FILTERED_DEVICES) <= 0:
+            return True
+        if str(name).upper() in FILTERED_DEVICES or str(address).upper() in FILTERED_DEVICES:
+            return True
+        known = self.devices.get(address)
+        return known is not None and known.accepted
+
+    def remember(self, device):
+        # Called once the GATT services of a connected sensor have been resolved
+        with self.lock:
+            known = self.devices.get(device.address, KnownDevice(device.address))
+            known.name = device.name
+            known.strategy = device.strategy_type
+            known.tx_handle = device.strategy.tx_handle
+            known.rx_handle = device.strategy.rx_handle
+            known.last_seen = time.time()
+            if device.ad_data is not None:
+                known.rssi = device.ad_data.rssi
+            self.devices[device.address] = known
+            self.is_dirty = True
+        self.save()
+
+    def update_rssi(self, address: str, rssi: int):
+        with self.lock:
+            known = self.devices.get(address)
+            if known is None:
+                return
+            known.rssi = rssi
+            known.last_seen = time.time()
+            self.is_dirty = True
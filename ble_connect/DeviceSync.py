@@ -0,0 +1,104 @@
+import math
+import time
+import threading
+import numpy as np
+
+N_CHANNELS = 6  # acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z
+
+
+class DeviceStream:
+    def __init__(self, name: str):
+        self.name = name
+        self.t: list[float] = []
+        self.values: list[tuple] = []
+
+
+class DeviceSynchronizer:
+    """
+    Resamples the streams of all the connected devices onto one clock. Samples
+    are pushed with their corrected wall clock timestamps from any thread, pull
+    interpolates every stream at the new grid times in one vectorized pass per
+    device and returns aligned frames. A device that lags behind holds the
+    output back by at most max_delay seconds, after that its columns are NaN.
+    """
+
+    def __init__(self, rate: float = 50.0, max_delay: float = 0.5, max_gap: float = 0.5):
+        self.rate = rate  # Hz of the common clock
+        self.max_delay = max_delay
+        self.max_gap = max_gap  # seconds, the streams are not interpolated across longer gaps
+        self.lock = threading.Lock()
+        self.streams: dict[str, DeviceStream] = {}
+        self.next_time: float = None
+
+    def push(self, key: str, name: str, ts: float, values: tuple):
+        if ts != ts:
+            return
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = self.streams[key] = DeviceStream(name)
+            stream.name = name
+            if stream.t and ts <= stream.t[-1]:
+                return
+            stream.t.append(ts)
+            stream.values.append(values)
+
+    def remove(self, key: str):
+        with self.lock:
+            self.streams.pop(key, None)
+
+    def reset(self):
+        with self.lock:
+            self.streams.clear()
+            self.next_time = None
+
+    def pull(self, now: float = None):
+        """
+        Return
+        ------
+        times: (K,) common clock timestamps of the new frames
+        keys: the D device keys, in the order of the frame columns
+        names: the D device names, only meant as labels, several devices can share one
+        frames: (K, D, 6) resampled samples, NaN where a device has no data
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            keys = [key for key, stream in self.streams.items() if stream.t]
+            if not keys:
+                return np.zeros(0), [], [], np.zeros((0, 0, N_CHANNELS))
+            streams = [self.streams[key] for key in keys]
+            if self.next_time is None:
+                first = min(stream.t[0] for stream in streams)
+                self.next_time = math.ceil(first * self.rate) / self.rate
+            # Wait for the slowest device, but never more than max_delay behind the wall clock
+            horizon = max(min(stream.t[-1] for stream in streams), now - self.max_delay)
+            count = int(math.floor((horizon - self.next_time) * self.rate)) + 1
+            if count <= 0:
+                return np.zeros(0), keys, [stream.name for stream in streams], np.zeros((0, len(streams), N_CHANNELS))
+            times = self.next_time + np.arange(count) / self.rate
+            snapshots = [(np.array(stream.t), np.array(stream.values, dtype=float)) for stream in streams]
+            self.next_time = times[-1] + 1.0 / self.rate
+            # Keep the last sample before the next grid time, it brackets the next interpolation
+            for stream in streams:
+                cut = np.searchsorted(stream.t, self.next_time) - 1
+                if cut > 0:
+                    del stream.t[:cut]
+                    del stream.values[:cut]
+            names = [stream.name for stream in streams]
+
+        frames = np.full((count, len(snapshots), N_CHANNELS), np.nan)
+        for d, (t, values) in enumerate(snapshots):
+            right = np.searchsorted(t, times)
+            # Grid times inside the stream and between two samples close enough to be joined
+            valid = (right > 0) & (right < len(t))
+            left = np.clip(right - 1, 0, len(t) - 1)
+            right = np.clip(right, 0, len(t) - 1)
+            valid |= (right < len(t)) & (t[right] == times)
+            valid &= (t[right] - t[left]) <= self.max_gap
+            if not np.any(valid):
+                continue
+            span = np.where(t[right] > t[left], t[right] - t[left], 1.0)
+            weight = ((times - t[left]) / span)[:, None]
+            interpolated = values[left] * (1 - weight) + values[right] * weight
+            frames[valid, d] = interpolated[valid]
+        return times, keys, names, frames
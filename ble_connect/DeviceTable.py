@@ -0,0 +1,154 @@
+import dearpygui.dearpygui as dpg
+import time
+from .config import DEVICE_TABLE_ROWS, DEVICE_TABLE_UPDATE_INTERVAL
+
+
+def device_type(device):
+    if device.is_exerwatch:
+        return "ExerWatch"
+    if getattr(device, "is_wit", False):
+        return "WIT"
+    return "-"
+
+
+def device_rssi(device):
+    return None if device.ad_data is None else device.ad_data.rssi
+
+
+SORT_KEYS = {
+    # Sensors first, accepted before the others, then by name
+    "Type": lambda w: (device_type(w.device) == "-", not w.device.is_accepted_device, str(w.device.name)),
+    "RSSI": lambda w: (device_rssi(w.device) is None, -(device_rssi(w.device) or 0)),
+    "Last seen": lambda w: -w.device.last_seen,
+    "Name": lambda w: (str(w.device.name) == "None", str(w.device.name).lower()),
+}
+
+
+class DeviceTable:
+    """
+    Virtualized list of the advertisers seen by the scanner. A fixed pool of
+    table rows is created once, every refresh sorts and filters the devices and
+    writes the visible slice into the pool, so hundreds of advertisers cost the
+    same number of dpg items as a dozen. Device events only mark the table
+    dirty, it is redrawn from the render loop at most every update_interval.
+    """
+
+    def __init__(self, app, tag: str = "devices_table", rows: int = DEVICE_TABLE_ROWS, update_interval: float = DEVICE_TABLE_UPDATE_INTERVAL):
+        self.app = app
+        self.tag = tag
+        self.rows = rows
+        self.update_interval = update_interval
+        self.sort_tag = f"{self.tag}_sort"
+        self.scroll_tag = f"{self.tag}_scroll"
+        self.count_tag = f"{self.tag}_count"
+        self.row_tags = [f"{self.tag}_row_{i}" for i in range(self.rows)]
+        self.sort_key = "Type"
+        self.include: list[str] = []
+        self.exclude: list[str] = []
+        self.offset = 0
+        self.visible: list = []  # SensorDeviceWidget shown in each pool row
+        self.row_themes: list[str] = [None] * self.rows
+        self.is_dirty = True
+        self.last_render = 0.0
+
+    def make_widget(self):
+        with dpg.group(horizontal=True):
+            dpg.add_combo(list(SORT_KEYS), tag=self.sort_tag, label="Sort", default_value=self.sort_key, callback=self.set_sort, width=100)
+            dpg.add_text(tag=self.count_tag, default_value="0 devices")
+        with dpg.group(horizontal=True):
+            dpg.add_slider_int(tag=self.scroll_tag, vertical=True, min_value=0, max_value=0, default_value=0, height=-1, width=14, format="", callback=self.on_scroll)
+            with dpg.table(tag=self.tag, header_row=True, policy=dpg.mvTable_SizingStretchProp, row_background=True):
+                dpg.add_table_column(label="", width_fixed=True)
+                dpg.add_table_column(label="Device")
+                dpg.add_table_column(label="Type", width_fixed=True)
+                dpg.add_table_column(label="RSSI", width_fixed=True)
+                dpg.add_table_column(label="Seen", width_fixed=True)
+                for i, row in enumerate(self.row_tags):
+                    with dpg.table_row(tag=row, show=False):
+                        dpg.add_button(tag=f"{row}_button", label="Connect", callback=self.on_connect_click, user_data=i, show=False)
+                        dpg.add_selectable(tag=f"{row}_label", label="", callback=self.on_row_click, user_data=i, span_columns=True)
+                        dpg.add_text(tag=f"{row}_type", default_value="")
+                        dpg.add_text(tag=f"{row}_rssi", default_value="")
+                        dpg.add_text(tag=f"{row}_seen", default_value="")
+        with dpg.handler_registry():
+            dpg.add_mouse_wheel_handler(callback=self.on_mouse_wheel)
+
+    def mark_dirty(self):
+        self.is_dirty = True
+
+    def set_sort(self, sender, app_data):
+        self.sort_key = app_data
+        self.mark_dirty()
+
+    def set_filter(self, sender, app_data):
+        # Same syntax as the dpg filter set it replaces: comma separated terms, a leading '-' excludes
+        terms = [term.strip().lower() for term in app_data.split(",") if term.strip()]
+        self.include = [term for term in terms if not term.startswith("-")]
+        self.exclude = [term[1:] for term in terms if term.startswith("-") and len(term) > 1]
+        self.offset = 0
+        self.mark_dirty()
+
+    def matches(self, device):
+        text = f"{device.name} {device.address}".lower()
+        if any(term in text for term in self.exclude):
+            return False
+        return not self.include or any(term in text for term in self.include)
+
+    def scroll_to(self, offset: int):
+        self.offset = offset
+        self.mark_dirty()
+
+    def on_scroll(self, sender, app_data):
+        # The vertical slider has its maximum at the top, where the first devices are
+        self.scroll_to(dpg.get_item_configuration(self.scroll_tag)["max_value"] - app_data)
+
+    def on_mouse_wheel(self, sender, app_data):
+        if not dpg.does_item_exist(self.tag) or not dpg.is_item_hovered(self.tag):
+            return
+        self.scroll_to(self.offset - int(app_data) * 3)
+
+    def on_row_click(self, sender, app_data, user_data):
+        if user_data < len(self.visible):
+            self.visible[user_data].on_device_click(sender, app_data)
+
+    def on_connect_click(self, sender, app_data, user_data):
+        if user_data < len(self.visible):
+            self.visible[user_data].device.toggle_connect()
+
+    def update(self, now: float = None):
+        # Called from the render loop, also redraws the ages of the "Seen" column when nothing else changed
+        now = time.time() if now is None else now
+        if now - self.last_render < self.update_interval:
+            return
+        if not self.is_dirty and now - self.last_render < 1.0:
+            return
+        self.render(now)
+
+    def render(self, now: float):
+        self.is_dirty = False
+        self.last_render = now
+        widgets = [w for w in list(self.app.devices.values()) if self.matches(w.device)]
+        widgets.sort(key=SORT_KEYS[self.sort_key])
+        max_offset = max(0, len(widgets) - self.rows)
+        self.offset = min(max(0, self.offset), max_offset)
+        self.visible = widgets[self.offset:self.offset + self.rows]
+        for i, row in enumerate(self.row_tags):
+            if i >= len(self.visible):
+                dpg.configure_item(row, show=False)
+                continue
+            widget = self.visible[i]
+            device = widget.device
+            rssi = device_rssi(device)
+            dpg.configure_item(row, show=True)
+            dpg.configure_item(f"{row}_button", label="Disconnect" if device.is_connected else "Connect", show=device.is_exerwatch)
+            dpg.configure_item(f"{row}_label", label=widget.label())
+            dpg.set_value(f"{row}_label", device.is_selected)
+            dpg.set_value(f"{row}_type", device_type(device))
+            dpg.set_value(f"{row}_rssi", "-" if rssi is None else f"{rssi}")
+            dpg.set_value(f"{row}_seen", f"{now - device.last_seen:.0f}s")
+            if self.row_themes[i] != widget.theme:
+                self.row_themes[i] = widget.theme
+                dpg.bind_item_theme(row, widget.theme)
+        dpg.configure_item(self.scroll_tag, max_value=max_offset)
+        dpg.set_value(self.scroll_tag, max_offset - self.offset)
+        dpg.set_value(self.count_tag, f"{len(widgets)} of {len(self.app.devices)} devices")
@@ -0,0 +1,100 @@
+import dearpygui.dearpygui as dpg
+import time
+import threading
+from collections import deque
+import numpy as np
+from .config import FRAME_MIN_FPS, FRAME_MAX_FPS, FRAME_INPUT_HOLD, FRAME_STATS_WINDOW
+
+
+class FramePacer:
+    """
+    Paces the render loop on data arrival and user input. After input the loop
+    runs at max_fps for input_hold seconds so that dragging and zooming stay
+    smooth. Otherwise it sleeps until new data wakes it up, never rendering
+    faster than max_fps, nor slower than min_fps so the UI still refreshes when
+    idle. Render times and intervals of the last frames are kept for stats().
+    """
+
+    def __init__(self, min_fps: float = FRAME_MIN_FPS, max_fps: float = FRAME_MAX_FPS, input_hold: float = FRAME_INPUT_HOLD, stats_window: int = FRAME_STATS_WINDOW, tag: str = "frame_pacer"):
+        self.min_interval = 1.0 / max_fps
+        self.max_interval = 1.0 / min_fps
+        self.input_hold = input_hold
+        self.tag = tag
+        self.status_tag = f"{self.tag}_status"
+        self.wake = threading.Event()
+        self.last_input = time.perf_counter()
+        self.frame_start = 0.0
+        self.render_times: deque[float] = deque(maxlen=stats_window)  # seconds spent in the frame, sleep excluded
+        self.intervals: deque[float] = deque(maxlen=stats_window)  # seconds between two frame starts
+        self.woken = 0  # frames started early by data
+        self.last_status = 0.0
+
+    def make_handlers(self):
+        with dpg.handler_registry():
+            dpg.add_mouse_move_handler(callback=self.notify_input)
+            dpg.add_mouse_click_handler(callback=self.notify_input)
+            dpg.add_mouse_wheel_handler(callback=self.notify_input)
+            dpg.add_key_press_handler(callback=self.notify_input)
+
+    def make_status_text(self):
+        dpg.add_text(tag=self.status_tag, default_value="")
+
+    def notify_data(self):
+        # Safe from any thread, the BLE callbacks call it for every sample
+        self.wake.set()
+
+    def notify_input(self):
+        self.last_input = time.perf_counter()
+        self.wake.set()
+
+    @property
+    def is_interactive(self):
+        return time.perf_counter() - self.last_input < self.input_hold
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.frame_start > 0:
+            self.intervals.append(now - self.frame_start)
+        self.frame_start = now
+
+    def end_frame(self):
+        self.render_times.append(time.perf_counter() - self.frame_start)
+
+    def wait(self):
+        # Never faster than max_fps
+        earliest = self.frame_start + self.min_interval
+        now = time.perf_counter()
+        if earliest > now:
+            time.sleep(earliest - now)
+        if self.is_interactive:
+            self.wake.clear()
+            return
+        # Idle: sleep until data or input arrives, or until the min_fps deadline
+        remaining = self.frame_start + self.max_interval - time.perf_counter()
+        if remaining > 0 and self.wake.wait(remaining):
+            self.woken += 1
+        self.wake.clear()
+
+    def stats(self):
+        if not self.intervals:
+            return None
+        intervals = np.array(self.intervals)
+        render_times = np.array(self.render_times)
+        return {
+            "fps": 1.0 / intervals.mean(),
+            "frame_ms": 1000 * render_times.mean(),
+            "frame_p95_ms": 1000 * np.percentile(render_times, 95),
+            "interval_max_ms": 1000 * intervals.max(),
+            "busy": render_times.sum() / intervals.sum(),  # fraction of the time spent in frames rather than sleeping
+            "interactive": self.is_interactive,
+        }
+
+    def update_status(self, interval: float = 1.0):
+        now = time.perf_counter()
+        if now - self.last_status < interval or not dpg.does_item_exist(self.status_tag):
+            return
+        self.last_status = now
+        stats = self.stats()
+        if stats is None:
+            return
+        dpg.set_value(self.status_tag, f"{stats['fps']:.1f} fps, frame {stats['frame_ms']:.1f} ms (p95 {stats['frame_p95_ms']:.1f} ms), busy {100 * stats['busy']:.0f}%")
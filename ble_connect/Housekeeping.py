@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import itertools
+import random
+from .config import HOUSEKEEPING_INTERVALS, HOUSEKEEPING_JITTER, HOUSEKEEPING_BUSY_RATE, HOUSEKEEPING_MAX_SKIPS, BG_LOOP
+
+
+class HousekeepingJob:
+    def __init__(self, device, interval: float):
+        self.device = device
+        self.interval = interval
+        self.is_running = False
+        self.is_cancelled = False
+        self.skipped = 0
+        self.polls = 0
+
+
+class HousekeepingScheduler:
+    """Runs the periodic polls (battery, config, temperature...) of every device from a single task on BG_LOOP"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop = BG_LOOP):
+        self.loop = loop
+        self.jobs: dict[str, HousekeepingJob] = {}
+        self.heap = []  # (due time, tie breaker, job)
+        self.counter = itertools.count()
+        self.wakeup: asyncio.Event = None
+
+    def start(self):
+        return asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+
+    def register(self, device):
+        interval = HOUSEKEEPING_INTERVALS.get(device.strategy_type)
+        if interval is None or not hasattr(device.strategy, "housekeeping"):
+            return
+        self.unregister(device)
+        job = HousekeepingJob(device, interval)
+        self.jobs[device.address] = job
+        # Random first poll so that devices connected together do not poll together
+        self.loop.call_soon_threadsafe(self.schedule, job, random.uniform(0, interval))
+
+    def unregister(self, device):
+        job = self.jobs.pop(device.address, None)
+        if job is not None:
+            job.is_cancelled = True
+
+    def schedule(self, job: HousekeepingJob, delay: float):
+        heapq.heappush(self.heap, (self.loop.time() + delay, next(self.counter), job))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def next_delay(self, job: HousekeepingJob):
+        return job.interval * (1.0 + random.uniform(-HOUSEKEEPING_JITTER, HOUSEKEEPING_JITTER))
+
+    def is_busy(self, job: HousekeepingJob):
+        device = job.device
+        if not device.is_connected:
+            return True
+        rate = device.effective_rate
+        return rate is not None and rate > HOUSEKEEPING_BUSY_RATE
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        while True:
+            now = self.loop.time()
+            while len(self.heap) > 0 and self.heap[0][0] <= now:
+                _, _, job = heapq.heappop(self.heap)
+                if job.is_cancelled:
+                    continue
+                if not job.is_running:
+                    if self.is_busy(job) and job.skipped < HOUSEKEEPING_MAX_SKIPS:
+                        job.skipped += 1
+                    else:
+                        job.skipped = 0
+                        asyncio.ensure_future(self.poll(job))
+                self.schedule(job, self.next_delay(job))
+            timeout = self.heap[0][0] - now if len(self.heap) > 0 else None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self, job: HousekeepingJob):
+        job.is_running = True
+        try:
+            await job.device.strategy.housekeeping()
+            job.polls += 1
+        except Exception as e:
+            print(f"Exception in housekeeping of {job.device.name}: {e}")
+        finally:
+            job.is_running = False
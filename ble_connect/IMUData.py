@@ -1,23 +1,80 @@
+import time
+from bisect import bisect_left, bisect_right
+from .RollingStats import RollingStats
+from .RangeIndex import ChannelIndex
+from .ClockModel import MONOTONIC_TO_EPOCH
+
+
 class IMUData:
-    def __init__(self):
+    def __init__(self, stats_window: float = None, indexed: bool = False):
         self.x: list[float] = []
         self.y: list[float] = []
         self.z: list[float] = []
         self.w: list[float] = []
         self.t: list[float] = []
+        self.ts: list[float] = []  # corrected wall clock time of each sample, NaN when unknown
+        self.segment: list[int] = []
+        self.gaps: list[tuple[int, float, float]] = []  # (first index after the gap, link lost at, link restored at)
+        self.segment_id = 0
         self.region_idx = []
+        # Optional rolling statistics over the last stats_window seconds, one per axis
+        self.stats: list[RollingStats] = None if stats_window is None else [RollingStats(stats_window) for _ in range(3)]
+        # Optional prefix sums and block min/max per axis, for instant statistics over any selected range
+        self.index: list[ChannelIndex] = [ChannelIndex(values) for values in (self.x, self.y, self.z)] if indexed else None
 
     def __len__(self):
         return len(self.x)
 
-    def append(self, x: float = 0, y: float = 0, z: float = 0, t: float = None, w: float = None):
+    def append(self, x: float = 0, y: float = 0, z: float = 0, t: float = None, w: float = None, ts: float = None):
         self.x.append(x)
         self.y.append(y)
         self.z.append(z)
         if w is not None:
             self.w.append(w)
+        self.segment.append(self.segment_id)
+        self.ts.append(float("nan") if ts is None else ts)
+        if self.index is not None:
+            self.index[0].append(x)
+            self.index[1].append(y)
+            self.index[2].append(z)
+        if self.stats is not None:
+            # The window follows the sample timestamps, the arrival time (same wall clock base) only when there is none
+            t_stats = ts if ts is not None and ts == ts else time.monotonic() + MONOTONIC_TO_EPOCH
+            self.stats[0].add(x, t_stats)
+            self.stats[1].add(y, t_stats)
+            self.stats[2].add(z, t_stats)
         if t is None or t < 0:
             self.t.append(len(self.t) + 1)
         else:
             self.t.append(t)
-            
+
+    def add_gap(self, start_time: float, end_time: float):
+        # Explicit discontinuity: samples after this belong to a new segment and are never joined to the previous one
+        self.gaps.append((len(self), start_time, end_time))
+        self.segment_id += 1
+        if self.stats is not None:
+            # The window restarts after the gap, a lost link must not look like a stuck sensor
+            for stats in self.stats:
+                stats.reset()
+
+    def close_gap(self, end_time: float):
+        # The link is restored, the gap was added when it was lost
+        if self.gaps and self.gaps[-1][2] != self.gaps[-1][2]:
+            index, start_time, _ = self.gaps[-1]
+            self.gaps[-1] = (index, start_time, end_time)
+
+    def index_range(self, t_start: float, t_end: float):
+        # t is increasing, so the selection maps to [i, j) with two binary searches
+        return bisect_left(self.t, t_start), bisect_right(self.t, t_end)
+
+    def range_stats(self, t_start: float, t_end: float):
+        if self.index is None:
+            return None
+        i, j = self.index_range(t_start, t_end)
+        if j <= i:
+            return None
+        stats = {axis: channel.stats(i, j) for axis, channel in zip("xyz", self.index)}
+        if any(axis_stats is None for axis_stats in stats.values()):
+            # Only lost samples in the range
+            return None
+        return {"start": i, "end": j, "dominant_axis": max(stats, key=lambda axis: stats[axis]["std"]), **stats}
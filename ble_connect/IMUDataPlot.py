@@ -6,19 +6,25 @@ import datetime
 from icecream import ic
 from .IMUData import *
 from .GraphRegion import *
+from .config import ROLLING_STATS_WINDOW
 
 query_update_interval = 0.5  # seconds
+table_stats = ["mean", "rms", "min", "max", "std"]
 
 class IMUDataPlot:
-    def __init__(self, parent, tag: str = "imu_plot", title="Time Series", area_selection_enabled=True):
+    def __init__(self, parent, tag: str = "imu_plot", title="Time Series", area_selection_enabled=True, rolling_stats=True):
         self.tag = tag
         self.parent = parent
-        self.data: IMUData = IMUData()
+        self.stats_window = ROLLING_STATS_WINDOW if rolling_stats else None
+        self.data: IMUData = IMUData(stats_window=self.stats_window, indexed=area_selection_enabled)
+        # Plotted values, the filtered samples when the parent shows them, data always keeps the raw samples
+        self.shown: tuple[list[float], list[float], list[float]] = ([], [], [])
         self.area_selection_enabled = area_selection_enabled
         self.title = title
         self.has_query_rect = False
         self.title_short = f"{self.title[0:3]}."
         self.plot_areas_tag = f"{self.tag}_areas"
+        self.selection_string = f"{self.tag}_selection_string"
         self.drag_rect_tag = f"{self.tag}_drag_rect"
         self.plot_tag = f"{self.tag}_plot"
         self.plot_x = f"{self.tag}_plotX"
@@ -27,18 +33,21 @@ class IMUDataPlot:
         self.xaxis = f"{self.tag}_xaxis"
         self.yaxis = f"{self.tag}_yaxis"
         self.vline = f"{self.tag}_vline"
+        self.gap_vline = f"{self.tag}_gap_vline"
         self.hline = f"{self.tag}_hline"
         self.fit_checkbox_x = f"{self.tag}_fit_checkbox_x"
         self.fit_checkbox_y = f"{self.tag}_fit_checkbox_y"
         self.name_cell_width = 120
         self.show_data_table = False
         self.vlines = []
+        self.gaps_vlines = []
         self.region_idx = -1
         self.offset_cuts: list[GraphRegion] = []
         self.last_query_update = time.time()
 
     def reset(self):
-        self.data = IMUData()
+        self.data = IMUData(stats_window=self.stats_window, indexed=self.area_selection_enabled)
+        self.shown = ([], [], [])
         dpg.configure_item(self.plot_x, x=[], y=[])
         dpg.configure_item(self.plot_y, x=[], y=[])
         dpg.configure_item(self.plot_z, x=[], y=[])
@@ -53,11 +62,19 @@ class IMUDataPlot:
         except Exception as e:
             pass
 
+        self.gaps_vlines = []
+        try:
+            dpg.configure_item(self.gap_vline, x=[])
+        except Exception as e:
+            pass
+
         if self.show_data_table:
             try:
-                dpg.set_value(f"{self.tag}_table_x", "0.0")
-                dpg.set_value(f"{self.tag}_table_y", "0.0")
-                dpg.set_value(f"{self.tag}_table_z", "0.0")
+                for axis in "xyz":
+                    dpg.set_value(f"{self.tag}_table_{axis}", "0.0")
+                    if self.data.stats is not None:
+                        for stat in table_stats:
+                            dpg.set_value(f"{self.tag}_table_{axis}_{stat}", "0.0")
             except Exception as e:
                 pass
 
@@ -65,18 +82,17 @@ class IMUDataPlot:
         with dpg.table(header_row=True, borders_innerH=True, borders_outerH=True, borders_innerV=True, borders_outerV=True, resizable=False, no_host_extendX=True, no_host_extendY=True, **table_kwargs):
             dpg.add_table_column(width=self.name_cell_width, width_fixed=True, width_stretch=False)
             dpg.add_table_column(width=self.name_cell_width, label=self.title_short, width_fixed=True, width_stretch=False)
+            if self.data.stats is not None:
+                for stat in table_stats:
+                    dpg.add_table_column(width=self.name_cell_width // 2, label=f"{stat} {self.stats_window:g}s", width_fixed=True, width_stretch=False)
 
-            with dpg.table_row(label="X", height=20):
-                dpg.add_text(default_value="X")
-                dpg.add_text(tag=f"{self.tag}_table_x", default_value=f"0.0")
-
-            with dpg.table_row(label="Y", height=20):
-                dpg.add_text(default_value="Y")
-                dpg.add_text(tag=f"{self.tag}_table_y", default_value=f"0.0")
-
-            with dpg.table_row(label="Z", height=20):
-                dpg.add_text(default_value="Z")
-                dpg.add_text(tag=f"{self.tag}_table_z", default_value=f"0.0")
+            for axis in "xyz":
+                with dpg.table_row(label=axis.upper(), height=20):
+                    dpg.add_text(default_value=axis.upper())
+                    dpg.add_text(tag=f"{self.tag}_table_{axis}", default_value=f"0.0")
+                    if self.data.stats is not None:
+                        for stat in table_stats:
+                            dpg.add_text(tag=f"{self.tag}_table_{axis}_{stat}", default_value=f"0.0")
 
     def update_cuts(self, new_cuts):
         if len(new_cuts) <= 0:
@@ -106,6 +122,19 @@ class IMUDataPlot:
         xmax = query_rect[2]
         dpg.set_value(self.drag_rect_tag, (xmin, ymin, xmax, ymax))
 
+    def update_selection_stats(self, query_rect):
+        # Prefix sums and block extrema, independent of how many samples are selected
+        stats = self.data.range_stats(query_rect[0], query_rect[2])
+        if stats is None:
+            selection = "Selection: empty"
+        else:
+            axes = ", ".join(f"{axis.upper()} mean {stats[axis]['mean']:.2f} rms {stats[axis]['rms']:.2f} energy {stats[axis]['energy']:.1f} p2p {stats[axis]['peak_to_peak']:.2f}" for axis in "xyz")
+            selection = f"Selection: {stats['end'] - stats['start']} samples, dominant {stats['dominant_axis'].upper()} | {axes}"
+        try:
+            dpg.set_value(self.selection_string, selection)
+        except Exception as e:
+            pass
+
     def make_plot(self, width=-1, height=400, show_data_table=True, **plot_kwargs):
         self.show_data_table = show_data_table
 
@@ -120,6 +149,9 @@ class IMUDataPlot:
                 # print(f"Query handler: {sender}, {query_rects}, {user_data}")
                 self.parent.gyroscope.update_query_rect(query_rects[0])
                 self.parent.accelerometer.update_query_rect(query_rects[0])
+                self.parent.gyroscope.update_selection_stats(query_rects[0])
+                self.parent.accelerometer.update_selection_stats(query_rects[0])
+                self.parent.match_selection(query_rects[0])
                 if run_detection:
                     self.parent.detect_prototype()
 
@@ -134,6 +166,8 @@ class IMUDataPlot:
                 dpg.add_text("Auto-fit axes:")
                 dpg.add_checkbox(label="X", tag=self.fit_checkbox_x, default_value=True)
                 dpg.add_checkbox(label="Y", tag=self.fit_checkbox_y, default_value=True)
+                if self.area_selection_enabled:
+                    dpg.add_text(tag=self.selection_string, default_value="Selection: none")
             with dpg.group(horizontal=self.show_data_table, width=-1, height=-1):
                 if self.show_data_table:
                     self.data_table()
@@ -153,28 +187,49 @@ class IMUDataPlot:
                         dpg.add_drag_rect(parent=self.plot_tag, tag=self.drag_rect_tag, default_value=(-10, 10), color=[255,0,0, 255], show=False, label="Selected Area")
                     try:
                         dpg.add_inf_line_series(self.vlines, tag=self.vline, parent=self.xaxis, label="Exercises boundaries", color=(255, 255, 255))
+                    except Exception as e:
+                        pass
+                    try:
+                        dpg.add_inf_line_series(self.gaps_vlines, tag=self.gap_vline, parent=self.xaxis, label="Connection gaps")
                     except Exception as e:
                         pass
                         # print(f"Exception adding vline: {e}.")
                         # print(e)
 
-    def start_ex_region(self, before_padding=0):
+    def start_ex_region(self, before_padding=0, at: int = None):
+        # at: data length at the region start, the current length by default
         self.region_idx += 1
         # Add some "flat" data to separate exercise prototypes
         for i in range(before_padding):
             self.update(0, 0, 0)
         # print("STARTING EXERCISE AT: ", len(self.data))
-        self.vlines.append(len(self.data))  # Start the region
+        self.vlines.append(len(self.data) if at is None else at)  # Start the region
         self.update_ex_region()
 
-    def end_ex_region(self, after_padding=0):
+    def end_ex_region(self, after_padding=0, at: int = None):
         # print("ENDING EXERCISE AT: ", len(self.data))
-        self.vlines.append(len(self.data))  # End the region
+        self.vlines.append(len(self.data) if at is None else at)  # End the region
         # Add some "flat" data to separate exercise prototypes
         for i in range(after_padding):
             self.update(0, 0, 0)
         self.update_ex_region()
 
+    def add_gap(self, start_time: float, end_time: float):
+        self.data.add_gap(start_time, end_time)
+        self.gaps_vlines.append(len(self.data))
+        try:
+            dpg.configure_item(self.gap_vline, x=self.gaps_vlines)
+        except Exception as e:
+            pass
+
+    def add_lost_samples(self, count: int, timestamps: list[float] = None):
+        # NaN rows keep the sample index in step with the device counter and break the plotted lines
+        nan = float("nan")
+        for i in range(count):
+            self.data.append(nan, nan, nan, ts=None if timestamps is None else timestamps[i])
+            for series in self.shown:
+                series.append(nan)
+
     def update_ex_region(self):
         try:
             dpg.configure_item(self.vline, x=self.vlines)
@@ -182,8 +237,10 @@ class IMUDataPlot:
             # print(f"Exception updating vline: {e}.")
             pass
 
-    def update(self, x: float = 0, y: float = 0, z: float = 0, refresh_plot: bool = True, w: float = None,):
-        self.data.append(x, y, z, w=w)
+    def update(self, x: float = 0, y: float = 0, z: float = 0, refresh_plot: bool = True, w: float = None, ts: float = None, shown: tuple = None):
+        self.data.append(x, y, z, w=w, ts=ts)
+        for series, value in zip(self.shown, (x, y, z) if shown is None else shown):
+            series.append(value)
         if refresh_plot:
             self.update_plot()
             if self.show_data_table:
@@ -194,11 +251,16 @@ class IMUDataPlot:
             dpg.set_value(f"{self.tag}_table_x", f"{self.data.x[-1]:.2f}")
             dpg.set_value(f"{self.tag}_table_y", f"{self.data.y[-1]:.2f}")
             dpg.set_value(f"{self.tag}_table_z", f"{self.data.z[-1]:.2f}")
+            if self.data.stats is not None:
+                # Running sums and monotonic queues, no rescan of the window
+                for axis, stats in zip("xyz", self.data.stats):
+                    for stat in table_stats:
+                        dpg.set_value(f"{self.tag}_table_{axis}_{stat}", f"{getattr(stats, stat):.2f}")
 
     def update_plot(self):
-        dpg.configure_item(self.plot_x, x=self.data.t, y=self.data.x)
-        dpg.configure_item(self.plot_y, x=self.data.t, y=self.data.y)
-        dpg.configure_item(self.plot_z, x=self.data.t, y=self.data.z)
+        dpg.configure_item(self.plot_x, x=self.data.t, y=self.shown[0])
+        dpg.configure_item(self.plot_y, x=self.data.t, y=self.shown[1])
+        dpg.configure_item(self.plot_z, x=self.data.t, y=self.shown[2])
 
         if dpg.get_value(self.fit_checkbox_y):
             dpg.fit_axis_data(self.yaxis)
@@ -3,14 +3,23 @@ import os
 import csv
 import time
 import datetime
+import numpy as np
 import pandas as pd
 import pickle as pkl
+import asyncio
 from icecream import ic
 from .IMUData import *
 from .GraphRegion import *
 from .IMUDataPlot import *
-from .config import FREQUENCY
+from .SpectrogramPlot import SpectrogramPlot
+from .PrototypeMatcher import PrototypeMatcher
+from .OutputLog import OutputLog
+from .config import FREQUENCY, SAMPLE_RATES, RATE_TOLERANCE, BG_LOOP, ORIENTATION_ENABLED, ORIENTATION_PLOT_EVERY, SIGNAL_FILTER_ENABLED, SPECTROGRAM_ENABLED
+from .config import PROTOTYPE_LIBRARY, PROTOTYPE_MATCH_LENGTH, PROTOTYPE_MATCH_BAND
+from .config import EXERSENSE_BATCH_SIZE, EXERSENSE_MAX_BATCH_DELAY, SEQUENCE_MAX_NAN_FILL
+from .config import OUTPUT_LOG_MAX_EVENTS, OUTPUT_LOG_MAX_LINES, OUTPUT_LOG_VISIBLE_LINES, OUTPUT_LOG_WRAP
 from .SensorDevice import LocalFileMockDevice, SensorDevice
+from quaternion import FUSION_FILTERS
 import importlib
 
 def is_mock_device(device):
@@ -18,10 +27,14 @@ def is_mock_device(device):
 
 class IMUDataWidget:
     total_widgets = 0
+    prototype_matcher: PrototypeMatcher = None  # Shared by all the widgets, loaded with the first one
 
     def __init__(self, app, device=None, extra_id: str = "", show_imu_table: bool = False):
         self.app = app
         self.themes = self.app.themes
+        if IMUDataWidget.prototype_matcher is None:
+            IMUDataWidget.prototype_matcher = PrototypeMatcher(PROTOTYPE_MATCH_LENGTH, PROTOTYPE_MATCH_BAND)
+            IMUDataWidget.prototype_matcher.load(PROTOTYPE_LIBRARY)
         self.device: SensorDevice = device if device is not None else LocalFileMockDevice()
         self.tag = f"{self.device.address}_imu_widget{extra_id}"
         self.float_cell_width = 50
@@ -29,15 +42,31 @@ class IMUDataWidget:
         self.connect_btn_tag = f"{self.tag}_connect_button"
         self.pause_btn_tag = f"{self.tag}_pause_button"
         self.output_tag = f"{self.tag}_output"
+        self.output_log = OutputLog(self.output_tag, "ExerSense Output:", OUTPUT_LOG_MAX_EVENTS, OUTPUT_LOG_MAX_LINES, OUTPUT_LOG_VISIBLE_LINES, OUTPUT_LOG_WRAP)
         self.export_btn_tag = f"{self.tag}_export_button"
         self.clear_btn_tag = f"{self.tag}_clear_button"
         self.detect_button = f"{self.tag}_detection"
         self.live_detect_checkbox = f"{self.tag}_live_detection"
+        self.filter_checkbox = f"{self.tag}_filtered"
+        self.filter_enabled = SIGNAL_FILTER_ENABLED
         self.gyroscope: IMUDataPlot = IMUDataPlot(self, f"{self.tag}_gyro", "Gyroscope XYZ")
         self.accelerometer: IMUDataPlot = IMUDataPlot(self, f"{self.tag}_accelerometer", "Accelerometer XYZ")
-        self.exercise_prototype: IMUDataPlot = IMUDataPlot(self, f"{self.tag}_ex_proto", "Exercise Prototype", area_selection_enabled=False)
+        self.exercise_prototype: IMUDataPlot = IMUDataPlot(self, f"{self.tag}_ex_proto", "Exercise Prototype", area_selection_enabled=False, rolling_stats=False)
+        self.orientation: IMUDataPlot = IMUDataPlot(self, f"{self.tag}_orientation", "Orientation Roll/Pitch/Yaw", area_selection_enabled=False)
+        self.quaternions: IMUData = IMUData()
+        self.spectrogram: SpectrogramPlot = SpectrogramPlot(self, f"{self.tag}_spectrogram", "Gyroscope Spectrogram")
+        self.rate_combo_tag = f"{self.tag}_rate_combo"
+        self.fusion_combo_tag = f"{self.tag}_fusion_combo"
         self.show_imu_table = show_imu_table
         self.exercise_counter = 0
+        self.last_rate_update = time.time()
+        self.periodicity_rate: float = FREQUENCY  # rate the periodicity slider value is expressed at, its default is in samples at FREQUENCY
+        self.exersense_gyr: list[tuple[float, float, float]] = []
+        self.exersense_acc: list[tuple[float, float, float]] = []
+        self.exersense_dt: list[float] = []
+        self.exersense_batch_start: float = None
+        self.exersense_batch_index: int = None  # data length after the first sample of the pending batch
+        self.last_exersense_time: float = None
         
     def device_info(self):
         with dpg.group(horizontal=True):
@@ -55,11 +84,17 @@ class IMUDataWidget:
         with dpg.group(horizontal=True):
             dpg.add_button(tag=self.connect_btn_tag, label="Connect", callback=self.device.toggle_connect, user_data=self.device, enabled=True, show=True, width=100, height=30)
             dpg.add_button(tag=self.pause_btn_tag, label="PAUSE", callback=self.toggle_processing, enabled=True, show=True, width=100, height=30)
-            dpg.add_button(tag=self.export_btn_tag, label="Export", callback=self.export_data, enabled=True, show=True, width=100, height=30)
+            dpg.add_button(tag=self.export_btn_tag, label="Export", callback=lambda: self.export_data(), enabled=True, show=True, width=100, height=30)
             dpg.add_button(tag=self.clear_btn_tag, label="Clear", callback=self.clear_data, enabled=True, show=True, width=100, height=30)
+            dpg.add_combo([f"{r}" for r in SAMPLE_RATES], tag=self.rate_combo_tag, label="Hz", default_value=f"{FREQUENCY}", callback=self.set_sample_rate, width=60)
+            if ORIENTATION_ENABLED:
+                dpg.add_combo(list(FUSION_FILTERS), tag=self.fusion_combo_tag, label="Fusion", default_value=self.device.fusion_filter, callback=self.set_fusion_filter, width=110)
+            dpg.add_checkbox(label="Filtered", tag=self.filter_checkbox, default_value=self.filter_enabled, callback=self.toggle_filter)
             with dpg.group():
                 dpg.add_text(tag=f"{self.tag}_imu_string", default_value="IMU Data", wrap=500)
                 dpg.add_text(tag=f"{self.tag}_exported_string", default_value="Last export: None", wrap=500)
+                dpg.add_text(tag=f"{self.tag}_reconnect_string", default_value="Reconnects: 0", wrap=500)
+                dpg.add_text(tag=f"{self.tag}_rate_string", default_value="Rate: -", wrap=500)
                 
                 
     def add_widget(self, container: str = None, separate_window: bool = False):
@@ -74,17 +109,38 @@ class IMUDataWidget:
             with dpg.child_window(height=400, width=-1, show=True) as wo:
                 dpg.bind_item_theme(wo, self.themes.exer_output_log)
                 with dpg.group(horizontal=True, width=-1, height=-1) as go:
-                    dpg.add_text(tag=self.output_tag, wrap=500, default_value="ExerSense Output:", show_label=False)
+                    with dpg.group(width=500):
+                        self.output_log.make_widget()
                     self.exercise_prototype.make_plot(show_data_table=False)
 
             with dpg.group(horizontal=True):
                 dpg.add_button(tag=self.detect_button, label="Run Detection", callback=self.manual_detection, user_data=self.device, enabled=False, show=True, width=120, height=30)
                 dpg.add_checkbox(label="Live Detection", tag=self.live_detect_checkbox, default_value=True)
                 dpg.add_slider_float(tag=f"{self.tag}_linearity_slider", label="Linearity", default_value=0.2, max_value=1.0, min_value=0.1, width=100, height=30)
-                dpg.add_slider_float(tag=f"{self.tag}_periodicty_slider", label="Periodicity", default_value=FREQUENCY/2, max_value=FREQUENCY, min_value=1.0, width=100, height=30)
+                dpg.add_slider_float(tag=f"{self.tag}_periodicty_slider", label="Periodicity", default_value=FREQUENCY/2, max_value=self.device.periodicity.max_period, min_value=1.0, width=100, height=30)
+                dpg.add_button(label="Use estimate", callback=self.prefill_periodicity, width=100, height=30)
+                dpg.add_text(tag=f"{self.tag}_period_string", default_value="Period: -")
+                dpg.add_text(tag=f"{self.tag}_match_string", default_value="Match: -")
 
             self.gyroscope.make_plot()
+            if SPECTROGRAM_ENABLED:
+                self.spectrogram.make_plot()
             self.accelerometer.make_plot()
+            if ORIENTATION_ENABLED:
+                self.orientation.make_plot()
+
+    def match_selection(self, query_rect):
+        i, j = self.gyroscope.data.index_range(query_rect[0], query_rect[2])
+        data = self.gyroscope.data
+        window = np.column_stack([data.x[i:j], data.y[i:j], data.z[i:j]])
+        # Lost samples are stored as NaN rows, they would make every DTW distance NaN
+        window = window[~np.isnan(window).any(axis=1)]
+        match = IMUDataWidget.prototype_matcher.match(window)
+        match_string = "Match: -" if match is None else f"Match: {match[0]} (DTW {match[1]:.2f}, {len(IMUDataWidget.prototype_matcher)} prototypes)"
+        try:
+            dpg.set_value(f"{self.tag}_match_string", match_string)
+        except Exception as e:
+            pass
 
     def manual_detection(self, sender, app_data):
         self.detect_prototype(reload_module=True)
@@ -122,6 +178,73 @@ class IMUDataWidget:
         dpg.set_value(f"{self.tag}_gyr_y", f"{gyr_y:.2f}")
         dpg.set_value(f"{self.tag}_gyr_z", f"{gyr_z:.2f}")
                 
+    def set_sample_rate(self, sender, app_data):
+        asyncio.run_coroutine_threadsafe(self.device.set_sample_rate(float(app_data)), BG_LOOP)
+
+    def toggle_filter(self, sender, app_data):
+        self.filter_enabled = app_data
+
+    def set_fusion_filter(self, sender, app_data):
+        # The orientation series stays aligned with the samples, it only restarts from the new filter's initial state
+        self.device.set_fusion_filter(app_data)
+
+    def update_rate_string(self):
+        now = time.time()
+        if now - self.last_rate_update < 1.0:
+            return
+        self.last_rate_update = now
+        if SPECTROGRAM_ENABLED and self.spectrogram.sample_rate != self.device.requested_rate:
+            self.spectrogram.set_sample_rate(self.device.requested_rate)
+        if self.periodicity_rate != self.device.requested_rate:
+            self.rescale_periodicity(self.device.requested_rate)
+        rate = self.device.effective_rate
+        if rate is None:
+            return
+        rate_string = f"Rate: {rate:.1f} Hz (requested {self.device.requested_rate:g} Hz), MTU: {self.device.mtu}"
+        sequence = self.device.sequence
+        if sequence.delivered > 0:
+            rate_string += f", Loss: {sequence.loss_rate*100:.1f}% ({sequence.lost} lost, {sequence.duplicates} dup)"
+        drift = self.device.clock.drift_ppm(self.device.requested_rate)
+        if drift is not None:
+            rate_string += f", Clock drift: {drift:+.0f} ppm"
+        if abs(rate - self.device.requested_rate) > RATE_TOLERANCE * self.device.requested_rate:
+            rate_string += " - MISMATCH!"
+        try:
+            dpg.set_value(f"{self.tag}_rate_string", rate_string)
+        except Exception as e:
+            pass
+        self.update_period_string()
+
+    def update_period_string(self):
+        period, confidence = self.device.dominant_period
+        if period is None:
+            return
+        try:
+            dpg.set_value(f"{self.tag}_period_string", f"Period: {period:.2f}s ({confidence*100:.0f}%)")
+        except Exception as e:
+            pass
+
+    def prefill_periodicity(self, sender, app_data):
+        period, confidence = self.device.periodicity.dominant()
+        if period is None:
+            return print(f"Not enough samples from {self.device.name} to estimate the period yet")
+        # Both are in samples at the requested rate, the slider range covers every period the estimator can report
+        self.set_periodicity(period)
+
+    def set_periodicity(self, period: float):
+        slider = f"{self.tag}_periodicty_slider"
+        config = dpg.get_item_configuration(slider)
+        dpg.set_value(slider, min(max(period, config["min_value"]), config["max_value"]))
+
+    def rescale_periodicity(self, rate: float):
+        # The slider is in samples, keep the same period in seconds when the output rate changes
+        try:
+            period = dpg.get_value(f"{self.tag}_periodicty_slider")
+            self.set_periodicity(period * rate / self.periodicity_rate)
+        except Exception as e:
+            print(f"Exception rescaling the periodicity of {self.device.name}: {e}")
+        self.periodicity_rate = rate
+
     def toggle_processing(self):
         if self.device.is_paused:
             self.device.is_paused = False
@@ -134,6 +257,13 @@ class IMUDataWidget:
         self.accelerometer.reset()
         self.gyroscope.reset()
         self.exercise_prototype.reset()
+        self.orientation.reset()
+        self.quaternions = IMUData()
+        self.output_log.clear()
+        self.device.signal_filter.reset()
+        self.device.periodicity.reset()
+        if SPECTROGRAM_ENABLED:
+            self.spectrogram.reset()
 
         # try:
         #     offset_cuts = [[0, -10, 10, 10], [15, -10, 25, 10], [30, -10, 70, 10]]
@@ -153,67 +283,130 @@ class IMUDataWidget:
         out_dir = f"{out_dir}/{export_time}"
         if not os.path.exists(out_dir):
             os.makedirs(out_dir)
+        files = self.write_data(self.snapshot_data(), out_dir, export_time)
+        try:
+            dpg.set_value(f"{self.tag}_exported_string", f"Last export: {files['imu']} and {files['proto']}")
+        except Exception as e:
+            pass
+        print("All exports completed!")
+
+    def snapshot_data(self, start: int = 0, end: int = None, proto_start: int = 0):
+        # DataFrames of the samples in [start, end), built on the calling thread so that writing them can happen anywhere
+        end = len(self.accelerometer.data) if end is None else end
         data = {}
-        
+
         # IMU DATA EXPORT
-        imu_columns = ["time", "accel_x", "accel_y", "accel_z", "gyr_x", "gyr_y", "gyr_z"]
+        imu_columns = ["time", "timestamp", "segment", "accel_x", "accel_y", "accel_z", "gyr_x", "gyr_y", "gyr_z"]
         imu_df = pd.DataFrame(columns=imu_columns)
-        imu_file_name = f"{out_dir}/{self.device.name}_IMU_{export_time}.csv"
-        print(f"Exporting imu data to: {imu_file_name}")
-        imu_df['time'] = self.accelerometer.data.t
-        imu_df['accel_x'] = self.accelerometer.data.x
-        imu_df['accel_y'] = self.accelerometer.data.y
-        imu_df['accel_z'] = self.accelerometer.data.z
-        imu_df['gyr_x'] = self.gyroscope.data.x
-        imu_df['gyr_y'] = self.gyroscope.data.y
-        imu_df['gyr_z'] = self.gyroscope.data.z
-        imu_df.to_csv(imu_file_name, index=False)
-        
+        imu_df['time'] = self.accelerometer.data.t[start:end]
+        imu_df['timestamp'] = self.accelerometer.data.ts[start:end]
+        imu_df['segment'] = self.accelerometer.data.segment[start:end]
+        imu_df['accel_x'] = self.accelerometer.data.x[start:end]
+        imu_df['accel_y'] = self.accelerometer.data.y[start:end]
+        imu_df['accel_z'] = self.accelerometer.data.z[start:end]
+        imu_df['gyr_x'] = self.gyroscope.data.x[start:end]
+        imu_df['gyr_y'] = self.gyroscope.data.y[start:end]
+        imu_df['gyr_z'] = self.gyroscope.data.z[start:end]
+        if len(self.quaternions) == len(self.accelerometer.data):
+            imu_df['q_w'] = self.quaternions.w[start:end]
+            imu_df['q_x'] = self.quaternions.x[start:end]
+            imu_df['q_y'] = self.quaternions.y[start:end]
+            imu_df['q_z'] = self.quaternions.z[start:end]
+            imu_df['roll'] = self.orientation.data.x[start:end]
+            imu_df['pitch'] = self.orientation.data.y[start:end]
+            imu_df['yaw'] = self.orientation.data.z[start:end]
+
         # Gyr and Accel CUTS/REGIONS export
         cuts_columns = ["xmin", "ymin", "xmax", "ymax"]
-        cuts_file_name = f"{{out_dir}}/{self.device.name}_cuts_{export_time}.csv"
         cuts_df = pd.DataFrame(columns=cuts_columns)
-        print(f"Exporting cuts/regions data to: {cuts_file_name}")
         for r in self.gyroscope.offset_cuts:
             cuts_df['xmin'] = r.xmin
             cuts_df['ymin'] = r.ymin
             cuts_df['xmax'] = r.xmax
             cuts_df['ymax'] = r.ymax
-        cuts_df.to_csv(cuts_file_name, index=False)
-                
+
+        # Connection gaps export, one row per discontinuity between two segments
+        gaps_columns = ["index", "disconnected_at", "reconnected_at"]
+        gaps = [(index - start, lost_at, restored_at) for index, lost_at, restored_at in self.accelerometer.data.gaps if start <= index < end]
+        gaps_df = pd.DataFrame(gaps, columns=gaps_columns)
+
         # Prototype data export
         proto_columns = ["time", "x", "y", "z", "w"]
-        proto_file_name = f"{out_dir}/{self.device.name}_proto_{export_time}.csv"
         proto_df = pd.DataFrame(columns=proto_columns)
-        print(f"Exporting exercises prototype data to: {proto_file_name}")
-        proto_df['time'] = self.exercise_prototype.data.t
-        proto_df['x'] = self.exercise_prototype.data.x
-        proto_df['y'] = self.exercise_prototype.data.y
-        proto_df['z'] = self.exercise_prototype.data.z
-        proto_df['w'] = self.exercise_prototype.data.w
-        proto_df.to_csv(proto_file_name, index=False)
-        
+        # The prototype series has its own padding rows, it is sliced by its own length at the start
+        proto_df['time'] = self.exercise_prototype.data.t[proto_start:]
+        proto_df['x'] = self.exercise_prototype.data.x[proto_start:]
+        proto_df['y'] = self.exercise_prototype.data.y[proto_start:]
+        proto_df['z'] = self.exercise_prototype.data.z[proto_start:]
+        proto_df['w'] = self.exercise_prototype.data.w[proto_start:]
+
         data['imu'] = imu_df
         data['cuts'] = cuts_df
+        data['gaps'] = gaps_df
         data['proto'] = proto_df
-        pkl_export = f"{out_dir}/{self.device.name}_{export_time}.pkl"
-        print(f"Exporting pickle data to: {pkl_export}")
-        with open(pkl_export, "wb") as f:
+        data['log'] = self.output_log.to_frame(start, end)
+        return data
+
+    def write_data(self, data: dict, out_dir: str, export_time: str):
+        files = {
+            'imu': f"{out_dir}/{self.device.name}_IMU_{export_time}.csv",
+            'cuts': f"{out_dir}/{self.device.name}_cuts_{export_time}.csv",
+            'gaps': f"{out_dir}/{self.device.name}_gaps_{export_time}.csv",
+            'proto': f"{out_dir}/{self.device.name}_proto_{export_time}.csv",
+            'log': f"{out_dir}/{self.device.name}_exersense_{export_time}.csv",
+            'pkl': f"{out_dir}/{self.device.name}_{export_time}.pkl",
+        }
+        print(f"Exporting imu data to: {files['imu']}")
+        data['imu'].to_csv(files['imu'], index=False)
+        print(f"Exporting cuts/regions data to: {files['cuts']}")
+        data['cuts'].to_csv(files['cuts'], index=False)
+        print(f"Exporting connection gaps to: {files['gaps']}")
+        data['gaps'].to_csv(files['gaps'], index=False)
+        print(f"Exporting exercises prototype data to: {files['proto']}")
+        data['proto'].to_csv(files['proto'], index=False)
+        print(f"Exporting exersense output log to: {files['log']}")
+        data['log'].to_csv(files['log'], index=False)
+        print(f"Exporting pickle data to: {files['pkl']}")
+        with open(files['pkl'], "wb") as f:
             pkl.dump(data, f)
+        return files
 
-        try:
-            dpg.set_value(f"{self.tag}_exported_string", f"Last export: {imu_file_name} and {proto_file_name}")
-        except Exception as e:
-            pass
-        print("All exports completed!")
-            
     def on_disconnect(self):
         dpg.configure_item(self.connect_btn_tag, label="Connect")
         dpg.configure_item(self.pause_btn_tag, label="PAUSE", enabled=False)
+        # No more samples will complete the pending batch
+        self.flush_exersense()
+        if self.app.sync_view is not None and not is_mock_device(self.device):
+            self.app.sync_view.remove(self.device)
 
     def on_connect(self):
         dpg.configure_item(self.connect_btn_tag, label="Disconnect")
         dpg.configure_item(self.pause_btn_tag, label="PAUSE", enabled=True)
+        self.app.session.join(self)
+
+    def on_link_lost(self, disconnected_at: float):
+        # Called when the link drops, so that no sample of the next connection lands before the gap or the resets
+        # Do not filter across the gap, the next sample restarts the filter from its steady state
+        self.device.signal_filter.reset()
+        self.device.periodicity.reset()
+        if SPECTROGRAM_ENABLED:
+            self.spectrogram.restart()
+        # The time spent disconnected is not a sample interval for the tracker
+        self.last_exersense_time = None
+        # Samples missed while disconnected are shown by the gap, not counted as link losses
+        self.device.sequence.resync()
+        self.device.clock.reset()
+        self.accelerometer.add_gap(disconnected_at, float("nan"))
+        self.gyroscope.add_gap(disconnected_at, float("nan"))
+
+    def on_reconnect(self, disconnected_at: float, reconnected_at: float):
+        self.accelerometer.data.close_gap(reconnected_at)
+        self.gyroscope.data.close_gap(reconnected_at)
+        reconnect_times = self.device.reconnect_times
+        try:
+            dpg.set_value(f"{self.tag}_reconnect_string", f"Reconnects: {len(reconnect_times)}, last: {reconnect_times[-1]:.2f}s, avg: {sum(reconnect_times)/len(reconnect_times):.2f}s")
+        except Exception as e:
+            pass
 
     def update(self, byte_data: bytearray, start_idx: int = 1):
         if self.device.is_paused:
@@ -225,9 +418,32 @@ class IMUDataWidget:
             return 
         try:
             data = self.device.process_data(byte_data)
-            if data is None:
-                print(f"Processed IMU Data is None!")
+        except Exception as e:
+            print(f"Exception decoding IMU data: {e}")
+            return
+        self.update_values(data, start_idx)
+
+    def update_values(self, data: list[float], start_idx: int = 1):
+        # Shared by GATT notifications and advertisement captures, data is [seq, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]
+        if self.device.is_paused:
+            return
+        self.app.frame_pacer.notify_data()
+        if data is None:
+            print(f"Processed IMU Data is None!")
+            return
+        now = time.monotonic()
+        lost = 0
+        if start_idx > 0:
+            lost = self.device.track_sequence(data[0])
+            if lost is None:
+                # Duplicate or late sample, already plotted
                 return
+        ts = self.device.timestamp_sample(now)
+        if lost > 0:
+            self.add_lost_samples(lost)
+        self.device.on_sample(now)
+        self.update_rate_string()
+        try:
             acc_x = data[start_idx]
             acc_y = data[start_idx+1]
             acc_z = data[start_idx+2]
@@ -238,18 +454,58 @@ class IMUDataWidget:
             print(f"Exception decoding IMU data: {e}")
             return
 
+        # The filter state is advanced even when showing raw data, so toggling back does not start with a transient.
+        # Filtered samples are only plotted and given to the tracker, the stored, exported and fused samples stay raw.
+        filtered = self.device.signal_filter.process(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z)
+        shown = filtered if self.filter_enabled else (acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z)
+        self.device.periodicity.add(*shown[3:])
+
         try:
-            self.update_imu_table(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, decoded)
+            self.update_imu_table(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, ", ".join([f"{v:.2f}" for v in data]))
         except Exception as e:
             print(f"Exception updating IMU TABLES with data: {e}")
         
         try:
-            self.accelerometer.update(x=acc_x, y=acc_y, z=acc_z)
-            self.gyroscope.update(x=gyr_x, y=gyr_y, z=gyr_z)
+            self.accelerometer.update(x=acc_x, y=acc_y, z=acc_z, ts=ts, shown=shown[:3])
+            self.gyroscope.update(x=gyr_x, y=gyr_y, z=gyr_z, ts=ts, shown=shown[3:])
         except Exception as e:
             print(f"Exception updating IMU PLOTS with data: {e}")
-        self.run_exersense(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z)
+        if SPECTROGRAM_ENABLED:
+            # The low-pass filter would hide the high frequencies the spectrogram is there to show
+            self.spectrogram.update(gyr_x, gyr_y, gyr_z)
+        if self.app.sync_view is not None and not is_mock_device(self.device):
+            self.app.sync_view.push(self.device, ts, (acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z))
+        if ORIENTATION_ENABLED:
+            self.update_orientation(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, ts)
+        self.run_exersense(*shown, ts)
         
+    def add_lost_samples(self, count: int):
+        count = min(count, SEQUENCE_MAX_NAN_FILL)
+        timestamps = self.device.lost_timestamps(count)
+        self.accelerometer.add_lost_samples(count, timestamps)
+        self.gyroscope.add_lost_samples(count, timestamps)
+        if ORIENTATION_ENABLED:
+            nan = float("nan")
+            self.orientation.add_lost_samples(count, timestamps)
+            for i in range(count):
+                self.quaternions.append(nan, nan, nan, w=nan)
+
+    def update_orientation(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, ts: float = None):
+        fusion = self.device.update_orientation(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, ts)
+        try:
+            if fusion is None:
+                # Keep the orientation series aligned with the IMU samples
+                self.quaternions.append(float("nan"), float("nan"), float("nan"), w=float("nan"))
+                self.orientation.update(float("nan"), float("nan"), float("nan"), refresh_plot=False, ts=ts)
+                return
+            q_w, q_x, q_y, q_z = fusion.quaternion
+            self.quaternions.append(q_x, q_y, q_z, w=q_w)
+            # Only the plot refresh is decimated, the series keeps one orientation per sample
+            refresh_plot = len(self.quaternions) % ORIENTATION_PLOT_EVERY == 0
+            self.orientation.update(fusion.roll, fusion.pitch, fusion.yaw, refresh_plot=refresh_plot, ts=ts)
+        except Exception as e:
+            print(f"Exception updating ORIENTATION with data: {e}")
+
     def detect_prototype(self, reload_module=True):
         try:
             import exersense.exersense_offline as learner
@@ -283,78 +539,111 @@ class IMUDataWidget:
                         z=v[2],
                         w=v[3]
                     )
+                IMUDataWidget.prototype_matcher.add([v[:3] for v in prototype_vector], f"{self.device.name} detected {self.exercise_counter+1}")
             self.export_data()
         except Exception as e:
             print(f"Exception running exersense: {e}")
             raise e
             
-    def run_exersense(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z):
+    def run_exersense(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, t: float = None):
+        # Samples are buffered and handed to the tracker in batches, with the real time between samples
+        t = time.monotonic() if t is None else t
+        dt = 1.0 / self.device.requested_rate if self.last_exersense_time is None else t - self.last_exersense_time
+        # The tracker integrates with dt, it must stay positive whatever the timestamps do
+        dt = max(dt, 0.5 / self.device.requested_rate)
+        self.last_exersense_time = t
+        if not self.exersense_gyr:
+            self.exersense_batch_start = t
+            # Data length right after this sample, where an unbatched tracker output would have been placed
+            self.exersense_batch_index = len(self.accelerometer.data)
+        self.exersense_gyr.append((gyr_x, gyr_y, gyr_z))
+        self.exersense_acc.append((acc_x, acc_y, acc_z))
+        self.exersense_dt.append(dt)
+        if len(self.exersense_gyr) >= EXERSENSE_BATCH_SIZE or t - self.exersense_batch_start >= EXERSENSE_MAX_BATCH_DELAY:
+            self.flush_exersense()
+
+    def flush_exersense(self):
+        if not self.exersense_gyr:
+            return
+        gyr, acc, dt = self.exersense_gyr, self.exersense_acc, self.exersense_dt
+        # The tracker does not say which sample of the batch produced an output, markers and log rows go at its first one
+        index = self.exersense_batch_index
+        self.exersense_gyr, self.exersense_acc, self.exersense_dt = [], [], []
         try:
             import exersense.exersense_online as tracker
         except Exception as e:
             print(f"Exception importing exersense tracker: {e}")
             return
         try:
-            exer_out = tracker.receive_data([(gyr_x, gyr_y, gyr_z)], [(acc_x, acc_y, acc_z)], [.1])
+            exer_out = tracker.receive_data(gyr, acc, dt)
         except Exception as e:
             print(f"Exception running exersense: {e}")
             return
+        if exer_out is None or len(exer_out) == 0:
+            return
+        # A batch may produce one output or a list of them
+        outputs = exer_out if not isinstance(exer_out[0], str) else [exer_out]
+        for out in outputs:
+            if out is None or len(out) == 0:
+                continue
+            exercise = self.exercise_counter + 1
+            kind, out_print = self.process_exersense_output(out, index)
+            self.output_log.add(kind, exercise, out_print, index)
+
+    def process_exersense_output(self, exer_out, index: int = None):
         prefix = f"\n  -"
-        if exer_out is not None and len(exer_out) > 0:
-            out_type = exer_out[0].lower()
-            out_print = f"\n[Ex.{self.exercise_counter+1}] "
-            # Exercise region 'S'tart
-            if out_type == 's':
-                start_off_x, start_off_y, start_off_z = exer_out[1] # it's a tuple
-                reps = exer_out[2]
-                reps_roms = ""
-                for rom in exer_out[3]:
-                    reps_roms = f"{prefix} Rep accuracy: {rom[0]:.2f}, Max ROM XYZ: [{rom[1]:.2f}, {rom[2]:.2f}, {rom[3]:.2f}]"
-
-                dominant_axis_idx = exer_out[4]
-                self.exercise_prototype.start_ex_region()
-                self.accelerometer.start_ex_region()
-                self.gyroscope.start_ex_region()
-                
-                prototype_dom_axis = []
-                prototype_vector = exer_out[5]
-                for v in prototype_vector:
-                    prototype_dom_axis.append(float(v))
-                    # Only add the prototype value to the dominant axis
-                    self.exercise_prototype.update(
-                        x = v if dominant_axis_idx==0 else 0,
-                        y = v if dominant_axis_idx==1 else 0,
-                        z = v if dominant_axis_idx==2 else 0
-                    )
-                out_print += f"START -  Reps={reps}"
-                out_print += f"{prefix} Offsets XYZ: [{start_off_x}, {start_off_y}, {start_off_z}]"
-                out_print += reps_roms
-                out_print += f"{prefix} Dominant axis: {dominant_axis_idx} - Prototype XYZ: {prototype_dom_axis}"
-            elif out_type == 'u':
-                # Exercise 'U'pdate
-                reps = exer_out[1]
-                roms = ""
-                for axis_rom_data in exer_out[2]:
-                    rep_correctness = axis_rom_data[0]
-                    rom_x = axis_rom_data[1]
-                    rom_y = axis_rom_data[2]
-                    rom_z = axis_rom_data[3]
-                    roms += f"({rep_correctness:.2f}, {rom_x:.2f}, {rom_y:.2f}, {rom_z:.2f}) "
-                out_print += f"UPDATE - Reps={reps}, ROMs: {roms}"
-            elif out_type == 'e':
-                # Exercise region 'E'nd
-                end_off_x, end_off_y, end_off_z = exer_out[1]
-                out_print += f"END - Exercise XYZ: [{end_off_x}, {end_off_y}, {end_off_z}]\n"
-                self.exercise_prototype.end_ex_region(after_padding=5)
-                self.accelerometer.end_ex_region()
-                self.gyroscope.end_ex_region()
-                self.exercise_counter += 1
-            else:
-                out_print = "Unknown output type!"
-
-            dpg.set_value(self.output_tag, dpg.get_value(self.output_tag)+f"{out_print}")
-            # try:
-            #     print(dpg.get_y_scroll(self.output_tag))
-            # except Exception as e:
-            #     print(f"Exception getting y scroll: {e}")
-            print(f"ExerSens Output: {exer_out}")
+        out_type = exer_out[0].lower()
+        out_print = f"[Ex.{self.exercise_counter+1}] "
+        # Exercise region 'S'tart
+        kind = {'s': "start", 'u': "update", 'e': "end"}.get(out_type, "unknown")
+        if out_type == 's':
+            start_off_x, start_off_y, start_off_z = exer_out[1] # it's a tuple
+            reps = exer_out[2]
+            reps_roms = ""
+            for rom in exer_out[3]:
+                reps_roms = f"{prefix} Rep accuracy: {rom[0]:.2f}, Max ROM XYZ: [{rom[1]:.2f}, {rom[2]:.2f}, {rom[3]:.2f}]"
+
+            dominant_axis_idx = exer_out[4]
+            self.exercise_prototype.start_ex_region()
+            self.accelerometer.start_ex_region(at=index)
+            self.gyroscope.start_ex_region(at=index)
+            
+            prototype_dom_axis = []
+            prototype_vector = exer_out[5]
+            for v in prototype_vector:
+                prototype_dom_axis.append(float(v))
+                # Only add the prototype value to the dominant axis
+                self.exercise_prototype.update(
+                    x = v if dominant_axis_idx==0 else 0,
+                    y = v if dominant_axis_idx==1 else 0,
+                    z = v if dominant_axis_idx==2 else 0
+                )
+            IMUDataWidget.prototype_matcher.add([[v if dominant_axis_idx == axis else 0 for axis in range(3)] for v in prototype_dom_axis], f"{self.device.name} Ex.{self.exercise_counter+1}")
+            out_print += f"START -  Reps={reps}"
+            out_print += f"{prefix} Offsets XYZ: [{start_off_x}, {start_off_y}, {start_off_z}]"
+            out_print += reps_roms
+            out_print += f"{prefix} Dominant axis: {dominant_axis_idx} - Prototype XYZ: {prototype_dom_axis}"
+        elif out_type == 'u':
+            # Exercise 'U'pdate
+            reps = exer_out[1]
+            roms = ""
+            for axis_rom_data in exer_out[2]:
+                rep_correctness = axis_rom_data[0]
+                rom_x = axis_rom_data[1]
+                rom_y = axis_rom_data[2]
+                rom_z = axis_rom_data[3]
+                roms += f"({rep_correctness:.2f}, {rom_x:.2f}, {rom_y:.2f}, {rom_z:.2f}) "
+            out_print += f"UPDATE - Reps={reps}, ROMs: {roms}"
+        elif out_type == 'e':
+            # Exercise region 'E'nd
+            end_off_x, end_off_y, end_off_z = exer_out[1]
+            out_print += f"END - Exercise XYZ: [{end_off_x}, {end_off_y}, {end_off_z}]\n"
+            self.exercise_prototype.end_ex_region(after_padding=5)
+            self.accelerometer.end_ex_region(at=index)
+            self.gyroscope.end_ex_region(at=index)
+            self.exercise_counter += 1
+        else:
+            out_print = "Unknown output type!"
+
+        print(f"ExerSens Output: {exer_out}")
+        return kind, out_print
@@ -0,0 +1,119 @@
+import dearpygui.dearpygui as dpg
+import time
+import textwrap
+import threading
+from collections import deque
+import pandas as pd
+
+
+class LogEvent:
+    def __init__(self, kind: str, exercise: int, message: str, index: int = None):
+        self.time = time.time()
+        self.kind = kind
+        self.exercise = exercise
+        self.message = message
+        self.index = index  # sample index of the device data when the event was received
+
+
+class OutputLog:
+    """
+    Text log backed by bounded rings of events and of wrapped lines. Only a
+    fixed number of text items are created, scrolling rewrites them with the
+    visible slice, so an update costs the same after hours of training as it
+    does at the start. Evicted events are lost, the export covers the ring.
+    """
+
+    def __init__(self, tag: str, title: str = "", max_events: int = 1000, max_lines: int = 5000, visible_lines: int = 20, wrap: int = 72):
+        self.tag = tag
+        self.title = title
+        self.visible_lines = visible_lines
+        self.wrap = wrap  # characters, lines are wrapped once when added so that every row is one line high
+        self.events: deque[LogEvent] = deque(maxlen=max_events)
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self.lock = threading.Lock()
+        self.offset = 0  # index of the first visible line
+        self.follow = True  # stick to the newest lines until the user scrolls up
+        self.window_tag = f"{self.tag}_window"
+        self.scroll_tag = f"{self.tag}_scroll"
+        self.row_tags = [f"{self.tag}_row_{i}" for i in range(self.visible_lines)]
+
+    def make_widget(self):
+        with dpg.group(horizontal=True):
+            dpg.add_slider_int(tag=self.scroll_tag, vertical=True, min_value=0, max_value=0, default_value=0, height=-1, width=14, format="", callback=self.on_scroll)
+            with dpg.group(tag=self.window_tag):
+                for row in self.row_tags:
+                    dpg.add_text(tag=row, default_value="")
+        with dpg.handler_registry():
+            dpg.add_mouse_wheel_handler(callback=self.on_mouse_wheel)
+        dpg.set_value(self.row_tags[0], self.title)
+
+    def add(self, kind: str, exercise: int, message: str, index: int = None):
+        event = LogEvent(kind, exercise, message, index)
+        with self.lock:
+            self.events.append(event)
+            evicted = 0
+            for paragraph in message.split("\n"):
+                for line in textwrap.wrap(paragraph, self.wrap, subsequent_indent="    ") or [""]:
+                    if len(self.lines) == self.lines.maxlen:
+                        evicted += 1
+                    self.lines.append(line)
+            # Keep the view on the same lines when older ones are evicted
+            self.offset = max(0, self.offset - evicted)
+        self.render()
+        return event
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.lines.clear()
+            self.offset = 0
+            self.follow = True
+        self.render()
+
+    @property
+    def max_offset(self):
+        return max(0, len(self.lines) - self.visible_lines)
+
+    def scroll_to(self, offset: int):
+        with self.lock:
+            self.offset = min(max(0, offset), self.max_offset)
+            self.follow = self.offset == self.max_offset
+        self.render()
+
+    def on_scroll(self, sender, app_data):
+        # The vertical slider has its maximum at the top, where the oldest lines are
+        self.scroll_to(self.max_offset - app_data)
+
+    def on_mouse_wheel(self, sender, app_data):
+        if not dpg.does_item_exist(self.window_tag) or not dpg.is_item_hovered(self.window_tag):
+            return
+        self.scroll_to(self.offset - int(app_data) * 3)
+
+    def render(self):
+        with self.lock:
+            if self.follow:
+                self.offset = self.max_offset
+            if not self.lines:
+                visible = [self.title]
+            else:
+                visible = [self.lines[i] for i in range(self.offset, min(self.offset + self.visible_lines, len(self.lines)))]
+            max_offset = self.max_offset
+            value = max_offset - self.offset
+        if not dpg.does_item_exist(self.window_tag):
+            return
+        visible += [""] * (self.visible_lines - len(visible))
+        for row, line in zip(self.row_tags, visible):
+            dpg.set_value(row, line)
+        dpg.configure_item(self.scroll_tag, max_value=max_offset)
+        dpg.set_value(self.scroll_tag, value)
+
+    def to_frame(self, start: int = None, end: int = None):
+        # Events as a DataFrame, optionally only those received while the sample index was in [start, end)
+        with self.lock:
+            events = list(self.events)
+        rows = [(e.time, e.index, e.exercise, e.kind, e.message) for e in events
+                if start is None or e.index is None or start <= e.index < (end if end is not None else float("inf"))]
+        df = pd.DataFrame(rows, columns=["time", "index", "exercise", "kind", "message"])
+        if start is not None:
+            df["index"] = df["index"] - start
+        return df
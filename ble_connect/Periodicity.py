@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class PeriodicityEstimator:
+    """
+    Dominant period of the gyroscope signal from a damped sliding DFT over the
+    last `window` samples. Each sample updates every bin of the three axes in
+    O(bins), the spectrum is never recomputed from the whole window.
+    """
+
+    def __init__(self, window: int = 128, min_period: float = 2.0, damping: float = 0.9999):
+        self.window = window
+        self.damping = damping
+        # Bins 1..window/min_period are searched, the DC bin carries the offset of the axes and is skipped.
+        # One extra bin on each side is tracked for the Hann window applied in the frequency domain.
+        self.bins = np.arange(1, int(window / min_period) + 1)
+        self.coef = damping * np.exp(2j * np.pi * np.arange(0, len(self.bins) + 2) / window)
+        self.damping_n = damping ** window
+        self.reset()
+
+    def reset(self):
+        self.spectrum = np.zeros((3, len(self.bins) + 2), dtype=complex)
+        self.history = np.zeros((self.window, 3))
+        self.pos = 0
+        self.count = 0
+
+    def add(self, x: float, y: float, z: float):
+        sample = np.array([x, y, z])
+        delta = sample - self.damping_n * self.history[self.pos]
+        self.history[self.pos] = sample
+        self.pos = (self.pos + 1) % self.window
+        self.count += 1
+        self.spectrum = self.coef * self.spectrum + delta[:, None]
+
+    @property
+    def max_period(self):
+        # Longest period in samples dominant() can report, the one of the first bin
+        return self.window / self.bins[0]
+
+    @property
+    def is_ready(self):
+        return self.count >= self.window
+
+    def power(self):
+        # Hann window as a 3-tap convolution of the bins, summed over the axes so the estimate
+        # does not depend on which axis the exercise rotates about
+        windowed = 0.5 * self.spectrum[:, 1:-1] - 0.25 * (self.spectrum[:, :-2] + self.spectrum[:, 2:])
+        return np.sum(windowed.real ** 2 + windowed.imag ** 2, axis=0)
+
+    def dominant(self):
+        """
+        Return
+        ------
+        period: dominant period in samples, None until a full window was seen
+        confidence: share of the spectrum power in the peak bin and its neighbours
+        """
+        if not self.is_ready:
+            return None, 0.0
+        power = self.power()
+        total = np.sum(power)
+        if total <= 0:
+            return None, 0.0
+        k = int(np.argmax(power))
+        offset = 0.0
+        if 0 < k < len(power) - 1 and power[k - 1] > 0 and power[k + 1] > 0:
+            # Parabolic interpolation of the log power around the peak, close to exact for a Hann window
+            left, peak, right = np.log(power[k - 1]), np.log(power[k]), np.log(power[k + 1])
+            denominator = left - 2 * peak + right
+            if denominator != 0:
+                offset = 0.5 * (left - right) / denominator
+        frequency_bin = self.bins[k] + offset
+        confidence = float(np.sum(power[max(k - 1, 0):k + 2]) / total)
+        return self.window / frequency_bin, confidence
@@ -0,0 +1,154 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+
+def resample(window: np.ndarray, length: int):
+    # Linear resampling of an (N, 3) window to (length, 3)
+    window = np.asarray(window, dtype=float)
+    if len(window) == length:
+        return window
+    src = np.linspace(0, 1, len(window))
+    dst = np.linspace(0, 1, length)
+    return np.stack([np.interp(dst, src, window[:, axis]) for axis in range(window.shape[1])], axis=1)
+
+
+def znormalize(window: np.ndarray):
+    std = window.std(axis=0)
+    return (window - window.mean(axis=0)) / np.where(std > 1e-9, std, 1.0)
+
+
+def load_prototypes(path: str, min_length: int = 4):
+    """
+    Reads an exported _proto_ CSV, consecutive prototypes are separated by
+    all-zero padding rows, see IMUDataPlot.end_ex_region.
+    """
+    df = pd.read_csv(path)
+    values = df[["x", "y", "z"]].to_numpy(dtype=float)
+    padding = np.all(values == 0, axis=1)
+    prototypes = []
+    start = None
+    for i, is_padding in enumerate(np.append(padding, True)):
+        if not is_padding and start is None:
+            start = i
+        elif is_padding and start is not None:
+            if i - start >= min_length:
+                prototypes.append(values[start:i])
+            start = None
+    return prototypes
+
+
+class PrototypeMatcher:
+    """
+    DTW nearest-prototype search. The library is stored as one (M, L, 3) array
+    of resampled, z-normalized prototypes with their LB_Keogh envelopes, so the
+    lower bound of every prototype is one vectorized expression. The remaining
+    candidates run DTW together, abandoning each one as soon as its partial
+    cost plus the lower bound of the rest of the query exceeds the best match.
+    """
+
+    def __init__(self, length: int = 32, band: int = 3):
+        self.length = length
+        self.band = band  # Sakoe-Chiba band half width, in resampled samples
+        self.names: list[str] = []
+        self.prototypes = np.zeros((0, length, 3))
+        self.upper = np.zeros((0, length, 3))
+        self.lower = np.zeros((0, length, 3))
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, prototype: np.ndarray, name: str = None):
+        self.add_many([prototype], [name if name is not None else f"prototype {len(self.names)}"])
+
+    def add_many(self, prototypes: list[np.ndarray], names: list[str]):
+        kept = [(p, name) for p, name in zip(prototypes, names) if len(p) >= 2]
+        if len(kept) == 0:
+            return
+        prototypes, names = zip(*kept)
+        batch = np.stack([znormalize(resample(p, self.length)) for p in prototypes])
+        upper, lower = self.envelopes(batch)
+        self.prototypes = np.concatenate([self.prototypes, batch])
+        self.upper = np.concatenate([self.upper, upper])
+        self.lower = np.concatenate([self.lower, lower])
+        self.names.extend(names)
+
+    def load(self, pattern: str):
+        for path in sorted(glob.glob(pattern)):
+            try:
+                prototypes = load_prototypes(path)
+            except Exception as e:
+                print(f"Exception loading prototypes from {path}: {e}")
+                continue
+            name = os.path.basename(path)
+            self.add_many(prototypes, [f"{name}[{i}]" for i in range(len(prototypes))])
+        print(f"Loaded {len(self)} exercise prototypes from {pattern}")
+
+    def envelopes(self, batch: np.ndarray):
+        # Running max/min of each prototype over the band, shape (M, L, 3)
+        padded = np.pad(batch, ((0, 0), (self.band, self.band), (0, 0)), mode="edge")
+        windows = np.stack([padded[:, k:k + self.length] for k in range(2 * self.band + 1)])
+        return windows.max(axis=0), windows.min(axis=0)
+
+    def lb_keogh(self, query: np.ndarray):
+        # Per query sample contribution of every prototype, shape (M, L)
+        above = np.maximum(query[None] - self.upper, 0.0)
+        below = np.maximum(self.lower - query[None], 0.0)
+        return np.sum(above * above + below * below, axis=2)
+
+    def dtw(self, query: np.ndarray, candidates: np.ndarray, lb_tail: np.ndarray, best: float):
+        """
+        Banded DTW of the query against the candidate prototypes at once.
+        lb_tail[c, i] is the LB_Keogh of query samples i+1.. against candidate c.
+        Returns the distances, inf for the abandoned candidates.
+        """
+        n = self.length
+        protos = self.prototypes[candidates]
+        alive = np.arange(len(candidates))  # rows still in the computation
+        distances = np.full(len(candidates), np.inf)
+        previous = np.full((len(candidates), n + 1), np.inf)
+        previous[:, 0] = 0.0
+        for i in range(n):
+            current = np.full((len(alive), n + 1), np.inf)
+            cost = np.sum((protos - query[i]) ** 2, axis=2)  # (C, L)
+            for j in range(max(0, i - self.band), min(n, i + self.band + 1)):
+                current[:, j + 1] = cost[:, j] + np.minimum(np.minimum(previous[:, j], previous[:, j + 1]), current[:, j])
+            previous = current
+            # Early abandoning, the cheapest path so far plus the bound on the rest of the query
+            keep = np.min(current, axis=1) + lb_tail[:, i] < best
+            if not np.all(keep):
+                alive, protos, previous, lb_tail = alive[keep], protos[keep], previous[keep], lb_tail[keep]
+                if len(alive) == 0:
+                    return distances
+        distances[alive] = previous[:, n]
+        return distances
+
+    def match(self, window: np.ndarray):
+        """
+        Parameters
+        ----------
+        window: (N, 3) gyroscope samples of one repetition
+
+        Return
+        ------
+        (name, distance) of the closest prototype, None if the library is empty
+        """
+        if len(self) == 0 or len(window) < 2:
+            return None
+        query = znormalize(resample(window, self.length))
+        contributions = self.lb_keogh(query)
+        lower_bounds = contributions.sum(axis=1)
+        order = np.argsort(lower_bounds)
+        # Exact distance of the most promising prototype gives the first bound to prune with
+        tails = np.cumsum(contributions[:, ::-1], axis=1)[:, ::-1]
+        lb_tail = np.concatenate([tails[:, 1:], np.zeros((len(self), 1))], axis=1)
+        best_idx = order[0]
+        best = self.dtw(query, order[:1], lb_tail[order[:1]], np.inf)[0]
+        candidates = order[1:][lower_bounds[order[1:]] < best]
+        if len(candidates) > 0:
+            distances = self.dtw(query, candidates, lb_tail[candidates], best)
+            k = int(np.argmin(distances))
+            if distances[k] < best:
+                best_idx, best = candidates[k], distances[k]
+        return self.names[best_idx], float(np.sqrt(best))
@@ -0,0 +1,105 @@
+import math
+
+BLOCK = 64  # fan-out of the min/max block levels
+LEVELS = 4  # 64, 4096, 262144 and 16777216 samples per block
+
+
+def nanmin(values: list[float]):
+    # Raw samples may hold NaN for lost samples, the block levels never do
+    return min((v for v in values if v == v), default=math.inf)
+
+
+def nanmax(values: list[float]):
+    return max((v for v in values if v == v), default=-math.inf)
+
+
+class ChannelIndex:
+    """
+    Incremental index of one channel, any [i, j) range gives its sum and sum of
+    squares in O(1) from the prefix sums and its min/max in O(BLOCK * LEVELS)
+    from the block levels, without touching the samples in between.
+    """
+
+    def __init__(self, values: list[float] = None):
+        # values may be a list owned and appended to by the caller (IMUData), so the samples are not stored twice
+        self.owns_values = values is None
+        self.values: list[float] = [] if values is None else values
+        self.cumsum: list[float] = [0.0]
+        self.cumsq: list[float] = [0.0]
+        self.cumcount: list[int] = [0]  # valid samples, NaN marks lost samples and counts for nothing
+        self.levels: list[tuple[list[float], list[float]]] = [([], []) for _ in range(LEVELS)]
+
+    def __len__(self):
+        return len(self.cumsum) - 1
+
+    def append(self, value: float):
+        i = len(self.cumsum) - 1
+        if self.owns_values:
+            self.values.append(value)
+        if value != value:
+            self.cumsum.append(self.cumsum[-1])
+            self.cumsq.append(self.cumsq[-1])
+            self.cumcount.append(self.cumcount[-1])
+            # Extrema levels get a neutral entry so block indexes stay aligned
+            value_min, value_max = math.inf, -math.inf
+        else:
+            self.cumsum.append(self.cumsum[-1] + value)
+            self.cumsq.append(self.cumsq[-1] + value * value)
+            self.cumcount.append(self.cumcount[-1] + 1)
+            value_min = value_max = value
+        size = 1
+        for mins, maxs in self.levels:
+            size *= BLOCK
+            block = i // size
+            if block == len(mins):
+                mins.append(value_min)
+                maxs.append(value_max)
+            else:
+                if value_min < mins[block]:
+                    mins[block] = value_min
+                if value_max > maxs[block]:
+                    maxs[block] = value_max
+
+    def sum(self, i: int, j: int):
+        return self.cumsum[j] - self.cumsum[i]
+
+    def sum_sq(self, i: int, j: int):
+        return self.cumsq[j] - self.cumsq[i]
+
+    def count(self, i: int, j: int):
+        return self.cumcount[j] - self.cumcount[i]
+
+    def extrema(self, i: int, j: int):
+        lo, hi = math.inf, -math.inf
+        mins, maxs = self.values, self.values
+        for level in range(LEVELS + 1):
+            if i >= j:
+                break
+            i_up, j_up = -(-i // BLOCK), j // BLOCK
+            if level == LEVELS or i_up >= j_up:
+                # Top level, or no full block left in the range
+                lo, hi = min(lo, nanmin(mins[i:j])), max(hi, nanmax(maxs[i:j]))
+                break
+            # Partial blocks at both ends, the full blocks in between are read one level up
+            if i < i_up * BLOCK:
+                lo, hi = min(lo, nanmin(mins[i:i_up * BLOCK])), max(hi, nanmax(maxs[i:i_up * BLOCK]))
+            if j_up * BLOCK < j:
+                lo, hi = min(lo, nanmin(mins[j_up * BLOCK:j])), max(hi, nanmax(maxs[j_up * BLOCK:j]))
+            i, j = i_up, j_up
+            mins, maxs = self.levels[level]
+        return lo, hi
+
+    def stats(self, i: int, j: int):
+        n = self.count(i, j)
+        if n <= 0:
+            return None
+        total, energy = self.sum(i, j), self.sum_sq(i, j)
+        mean = total / n
+        lo, hi = self.extrema(i, j)
+        return {
+            "mean": mean,
+            "rms": math.sqrt(max(energy / n, 0.0)),
+            "energy": energy,
+            "std": math.sqrt(max(energy / n - mean * mean, 0.0)),
+            "peak_to_peak": hi - lo,
+        }
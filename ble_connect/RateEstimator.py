@@ -0,0 +1,24 @@
+import time
+from collections import deque
+
+
+class RateEstimator:
+    def __init__(self, window: float = 5.0):
+        self.window = window  # seconds of arrivals used for the estimate
+        self.times = deque()
+
+    def reset(self):
+        self.times.clear()
+
+    def add_sample(self, t: float = None):
+        t = time.monotonic() if t is None else t
+        self.times.append(t)
+        while len(self.times) > 2 and t - self.times[0] > self.window:
+            self.times.popleft()
+
+    @property
+    def rate(self):
+        if len(self.times) < 2:
+            return None
+        span = self.times[-1] - self.times[0]
+        return (len(self.times) - 1) / span if span > 0 else None
@@ -0,0 +1,87 @@
+import math
+import time
+from collections import deque
+
+
+class RollingStats:
+    def __init__(self, window: float = 5.0):
+        self.window = window  # seconds of samples covered by the statistics
+        self.samples = deque()  # (seq, t, value)
+        # Monotonic queues of (seq, value), the front is the min/max of the window
+        self.min_queue = deque()
+        self.max_queue = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.seq = 0
+        self.evictions = 0
+
+    def reset(self):
+        self.samples.clear()
+        self.min_queue.clear()
+        self.max_queue.clear()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.evictions = 0
+
+    def add(self, value: float, t: float = None):
+        if value != value:
+            # NaN marks lost samples, they are not part of the statistics
+            return
+        t = time.monotonic() if t is None else t
+        seq = self.seq
+        self.seq += 1
+        self.samples.append((seq, t, value))
+        self.total += value
+        self.total_sq += value * value
+        while self.min_queue and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((seq, value))
+        while self.max_queue and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((seq, value))
+
+        while len(self.samples) > 1 and t - self.samples[0][1] > self.window:
+            old_seq, _, old = self.samples.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+            if self.min_queue[0][0] == old_seq:
+                self.min_queue.popleft()
+            if self.max_queue[0][0] == old_seq:
+                self.max_queue.popleft()
+            self.evictions += 1
+
+        if self.evictions > len(self.samples):
+            # Re-sum once per window length so the running sums do not drift, amortized O(1)
+            self.total = math.fsum(v for _, _, v in self.samples)
+            self.total_sq = math.fsum(v * v for _, _, v in self.samples)
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def mean(self):
+        return self.total / len(self.samples) if self.samples else 0.0
+
+    @property
+    def rms(self):
+        return math.sqrt(max(self.total_sq / len(self.samples), 0.0)) if self.samples else 0.0
+
+    @property
+    def variance(self):
+        if not self.samples:
+            return 0.0
+        mean = self.total / len(self.samples)
+        return max(self.total_sq / len(self.samples) - mean * mean, 0.0)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def min(self):
+        return self.min_queue[0][1] if self.min_queue else 0.0
+
+    @property
+    def max(self):
+        return self.max_queue[0][1] if self.max_queue else 0.0
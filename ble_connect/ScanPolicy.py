@@ -0,0 +1,39 @@
+import time
+from .config import EXER_BLE_SERVICE_UUID, WIT_BLE_SERVICE_UUID, TEST_SERVICE_UUIDS, SCAN_FILTER_SERVICES, RSSI_UPDATE_INTERVAL
+
+
+class ScanPolicy:
+    def __init__(self):
+        self.classification: dict[str, bool] = {}  # address -> is a sensor we care about
+        self.last_rssi_update: dict[str, float] = {}
+        self.dropped_advertisements = 0
+        self.processed_advertisements = 0
+
+    def service_uuids(self):
+        # Passed to BleakScanner so that the OS drops phones, headphones, etc. before they reach python
+        if not SCAN_FILTER_SERVICES:
+            return None
+        return [EXER_BLE_SERVICE_UUID.lower(), WIT_BLE_SERVICE_UUID.lower()] + [x.lower() for x in TEST_SERVICE_UUIDS]
+
+    def classify(self, address: str, is_target: bool):
+        self.classification[address] = is_target
+
+    def is_classified(self, address: str):
+        return address in self.classification
+
+    def is_target(self, address: str):
+        return self.classification.get(address, False)
+
+    def should_update_rssi(self, address: str, now: float = None):
+        # Coalesce the advertisements of an already classified device into one RSSI refresh every RSSI_UPDATE_INTERVAL
+        now = time.time() if now is None else now
+        if now - self.last_rssi_update.get(address, 0) < RSSI_UPDATE_INTERVAL:
+            self.dropped_advertisements += 1
+            return False
+        self.last_rssi_update[address] = now
+        self.processed_advertisements += 1
+        return True
+
+    def all_targets_connected(self, devices):
+        targets = [d for d in devices if self.is_target(d.address) and d.is_accepted_device]
+        return len(targets) > 0 and all(d.is_connected for d in targets)
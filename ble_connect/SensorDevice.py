@@ -2,28 +2,96 @@ from bleak import BleakClient, BLEDevice, AdvertisementData, BleakGATTCharacteri
 import asyncio
 import dearpygui.dearpygui as dpg
 import platform
+import importlib.metadata
+import struct
+import time
+from .RateEstimator import RateEstimator
+from .SignalFilter import SignalFilter
+from .Periodicity import PeriodicityEstimator
+from .SequenceTracker import SequenceTracker
+from .ClockModel import ClockModel, MONOTONIC_TO_EPOCH
+from quaternion import makeFusionFilter
+from .WitSensor import WitSensorStrategy, WitOp
 
 from .config import EXER_BLE_SERVICE_UUID, EXER_CHARACTERISTIC_UUID_TX, EXER_CHARACTERISTIC_UUID_RX, WATCH_CHARACTERISTIC_UUID_RX, WATCH_CHARACTERISTIC_UUID_TX, TEST_SERVICE_UUIDS, FILTERED_DEVICES, AUTO_CONNECT, BG_LOOP, WIT_BLE_SERVICE_UUID, WIT_CHARACTERISTIC_UUID_TX, WIT_CHARACTERISTIC_UUID_RX
+from .config import AUTO_RECONNECT, RECONNECT_BACKOFF, RECONNECT_MAX_BACKOFF
+from .config import FREQUENCY, REQUEST_MTU, ORIENTATION_MAX_DT, DEFAULT_FUSION_FILTER, SIGNAL_FILTER_STAGES, PERIODICITY_WINDOW
+from .config import SEQUENCE_TRACKING, SEQUENCE_MODULUS, SEQUENCE_MAX_GAP, CLOCK_MODEL_WINDOW
+from .config import ADV_CAPTURE_MODE, EXER_ADV_MANUFACTURER_ID, EXER_ADV_PAYLOAD_FORMAT, EXER_ADV_ACC_SCALE, EXER_ADV_GYR_SCALE
 
 class ExerDeviceStrategy:
+    type = "exer"
+    has_sequence = True  # data[0] is the device sample counter
+
     def __init__(self):
         self.characteristic_uuid_rx = EXER_CHARACTERISTIC_UUID_RX
         self.characteristic_uuid_tx = EXER_CHARACTERISTIC_UUID_TX
+        self.tx_handle: int = None
+        self.rx_handle: int = None
         
     def process_data(self, byte_data: bytearray):
         decoded = byte_data.decode('utf-8')
         data = [float(i) for i in decoded.split(",")]
         return data
 
+    def process_advertisement(self, ad_data: AdvertisementData):
+        payload = ad_data.service_data.get(EXER_BLE_SERVICE_UUID.lower(), ad_data.manufacturer_data.get(EXER_ADV_MANUFACTURER_ID))
+        if payload is None or len(payload) < struct.calcsize(EXER_ADV_PAYLOAD_FORMAT):
+            return None
+        seq, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z = struct.unpack_from(EXER_ADV_PAYLOAD_FORMAT, payload, 0)
+        return [seq] + [v * EXER_ADV_ACC_SCALE for v in (acc_x, acc_y, acc_z)] + [v * EXER_ADV_GYR_SCALE for v in (gyr_x, gyr_y, gyr_z)]
+
+    def rate_commands(self, rate_hz: float):
+        return [bytearray(f"r{rate_hz:g}", "utf-8")]
+
 class WitDeviceStrategy:
+    type = "wit"
+    has_sequence = False
+
     def __init__(self):
         self.characteristic_uuid_rx = WIT_CHARACTERISTIC_UUID_RX
         self.characteristic_uuid_tx = WIT_CHARACTERISTIC_UUID_TX
-        
+        self.tx_handle: int = None
+        self.rx_handle: int = None
+        self.wit = WitSensorStrategy()
+
+    def attach(self, device):
+        self.wit.device = device
+
     def process_data(self, byte_data: bytearray):
-        pass
+        # 0x71 read returns are matched to their pending requests inside process_bytes
+        sensor_data = self.wit.process_bytes(byte_data)
+        if sensor_data is None:
+            return None
+        return [0, sensor_data.acc.x, sensor_data.acc.y, sensor_data.acc.z, sensor_data.gyr.x, sensor_data.gyr.y, sensor_data.gyr.z]
+
+    async def write_command(self, payload: bytes):
+        await self.wit.send_protocol_data(payload)
+        return True
+
+    async def housekeeping(self):
+        return await self.wit.housekeeping()
+
+    def cleanup(self):
+        self.wit.cleanup()
+
+    def process_advertisement(self, ad_data: AdvertisementData):
+        # Wit sensors do not broadcast IMU data in their advertisements
+        return None
+
+    def rate_commands(self, rate_hz: float):
+        # The RRATE register is protected, unlock it first
+        return [
+            bytes([WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.UNLOCK_REG_0x69, 0x88, 0xB5]),
+            bytes([WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.SET_RETURN_RATE_0x03, WitSensorStrategy.return_rate_code(rate_hz), 0x00]),
+        ]
     
 
+DEVICE_STRATEGIES = {
+    ExerDeviceStrategy.type: ExerDeviceStrategy,
+    WitDeviceStrategy.type: WitDeviceStrategy,
+}
+
 
 class SensorDevice(BLEDevice):
     def __init__(self, ble_device: BLEDevice = None, address: str = "LOCAL_ADDRESS", name: str = "MOCK_DEVICE", ad_data: AdvertisementData = None):
@@ -33,7 +101,7 @@ class SensorDevice(BLEDevice):
         else:
             super(SensorDevice, self).__init__(address, name, None, rssi)
         self.ad_data: AdvertisementData = ad_data
-        self.client: BleakClient = BleakClient(self.address)
+        self.client: BleakClient = BleakClient(self.address, disconnected_callback=self.on_client_disconnected)
         self.strategy = None
         self.is_paused = False
         self.is_updated = False
@@ -42,8 +110,54 @@ class SensorDevice(BLEDevice):
         self.is_selected = False
         self.is_connected = False
         self.is_updating = False 
+        self.is_reconnecting = False
+        self.user_disconnected = False
+        self.disconnected_at: float = None
+        self.reconnect_times: list[float] = []  # seconds from link loss to notifications restarted
+        self.last_seen: float = time.time()
+        self.scan_policy = None
+        self.registry = None
+        self.housekeeping = None
+        self.connect_requested_at: float = None
+        self.first_sample_at: float = None
+        self.is_capturing = False
+        self.last_adv_seq = None
+        self.requested_rate: float = FREQUENCY
+        self.rate_estimator = RateEstimator()
+        self.signal_filter = SignalFilter(SIGNAL_FILTER_STAGES, FREQUENCY)
+        self.periodicity = PeriodicityEstimator(PERIODICITY_WINDOW)
+        self.sequence = SequenceTracker(SEQUENCE_MODULUS, SEQUENCE_MAX_GAP)
+        self.clock = ClockModel(CLOCK_MODEL_WINDOW)
+        self.last_timestamp: float = None  # timestamps handed out never go back, see timestamp_sample
+        self.samples_seen = -1  # sample index of devices without a sequence counter
+        self.mtu: int = None
+        self.fusion_filter = DEFAULT_FUSION_FILTER
+        self.fusion = makeFusionFilter(DEFAULT_FUSION_FILTER)
+        self.last_fusion_time: float = None
         self.widget = None
 
+    @property
+    def strategy_type(self):
+        return None if self.strategy is None else self.strategy.type
+
+    def preclassify(self, known):
+        # Skip advertisement based classification for a sensor remembered from a previous session
+        self.strategy = DEVICE_STRATEGIES[known.strategy]()
+        self.strategy.tx_handle = known.tx_handle
+        self.strategy.rx_handle = known.rx_handle
+        self.is_exerwatch = known.strategy == ExerDeviceStrategy.type
+        self.is_wit = known.strategy == WitDeviceStrategy.type
+        self.is_accepted_device = known.accepted
+        self.is_updated = True
+        if self.scan_policy is not None:
+            self.scan_policy.classify(self.address, True)
+
+    @property
+    def time_to_first_sample(self):
+        if self.connect_requested_at is None or self.first_sample_at is None:
+            return None
+        return self.first_sample_at - self.connect_requested_at
+
     async def update(self, data: AdvertisementData):
         if self.is_updating:
             # print(f"Device {self.name} is already updating!")
@@ -61,7 +175,10 @@ class SensorDevice(BLEDevice):
         self.is_exerwatch = EXER_BLE_SERVICE_UUID in list(map(lambda x: x.upper(), data.service_uuids))
         self.is_wit = WIT_BLE_SERVICE_UUID in list(map(lambda x: x.upper(), data.service_uuids))
         
-        if not self.is_exerwatch and self.is_wit:
+        if self.scan_policy is not None:
+            self.scan_policy.classify(self.address, self.is_exerwatch or self.is_wit)
+
+        if not self.is_exerwatch and not self.is_wit:
             self.is_updated = True
             self.is_updating = False
             # print(f"Device {self.name} is NOT an ExerWatch device!")
@@ -73,7 +190,9 @@ class SensorDevice(BLEDevice):
             self.strategy = WitDeviceStrategy()    
         
             
-        if FILTERED_DEVICES is None or len(FILTERED_DEVICES) <= 0:
+        if self.registry is not None:
+            self.is_accepted_device = self.registry.is_accepted(self.name, self.address)
+        elif FILTERED_DEVICES is None or len(FILTERED_DEVICES) <= 0:
             self.is_accepted_device = True
         else:
             self.is_accepted_device = (str(self.name).upper() in FILTERED_DEVICES or str(self.address).upper() in FILTERED_DEVICES)
@@ -90,6 +209,17 @@ class SensorDevice(BLEDevice):
             print(f"Device {self.name} is already connected!")
             return
         
+        if ADV_CAPTURE_MODE:
+            self.is_updated = True
+            self.is_updating = False
+            self.is_capturing = True
+            print(f"Device {self.name} captured from advertisements (ADV_CAPTURE_MODE=True)")
+            try:
+                self.widget.on_accepted_device()
+            except Exception as e:
+                print(f"Exception updating device widget: {e}")
+            return
+
         if not AUTO_CONNECT:
             self.is_updated = True
             self.is_updating = False
@@ -109,8 +239,32 @@ class SensorDevice(BLEDevice):
         self.is_updated = True
         self.is_updating = False
 
+    def update_rssi(self, data: AdvertisementData):
+        self.ad_data = data
+        self.last_seen = time.time()
+        if self.registry is not None:
+            self.registry.update_rssi(self.address, data.rssi)
+
+    def capture_advertisement(self, data: AdvertisementData):
+        if self.strategy is None:
+            return None
+        values = self.strategy.process_advertisement(data)
+        if values is None:
+            return None
+        # The same payload is advertised several times until the sensor updates it
+        if values[0] == self.last_adv_seq:
+            return None
+        self.last_adv_seq = values[0]
+        self.ad_data = data
+        self.last_seen = time.time()
+        return values
+
     def notification_handler(self, characteristic: BleakGATTCharacteristic, data: bytearray):
         print(f"Notification from {self.name} on characteristic {characteristic.uuid}: {data}")
+        if self.first_sample_at is None:
+            self.first_sample_at = time.time()
+            if self.time_to_first_sample is not None:
+                print(f"First sample from {self.name} {self.time_to_first_sample:.2f}s after connecting")
         self.widget.on_notification(characteristic, data)
 
     def toggle_connect(self):
@@ -119,34 +273,109 @@ class SensorDevice(BLEDevice):
         else:
             asyncio.run_coroutine_threadsafe(self.connect(), BG_LOOP)
 
+    def stop_housekeeping(self):
+        if self.housekeeping is not None:
+            self.housekeeping.unregister(self)
+        if hasattr(self.strategy, "cleanup"):
+            self.strategy.cleanup()
+
     async def disconnect(self):
+        self.user_disconnected = True
+        self.stop_housekeeping()
         await self.client.stop_notify(self.strategy.characteristic_uuid_tx)
         await self.client.disconnect()
         self.is_connected = False
         if self.widget is not None:
             self.widget.on_disconnect()
 
+    def on_client_disconnected(self, client: BleakClient):
+        # Called by bleak (on BG_LOOP) for every disconnection, requested or not
+        if self.user_disconnected or not self.is_connected:
+            return
+        print(f"Link lost with {self.name} {self.address}!")
+        self.is_connected = False
+        self.stop_housekeeping()
+        self.disconnected_at = time.time()
+        if self.widget is not None:
+            self.widget.on_disconnect()
+            # Mark the gap now, before any sample of the next connection can arrive
+            self.widget.on_link_lost(self.disconnected_at)
+        if AUTO_RECONNECT and not self.is_reconnecting:
+            asyncio.ensure_future(self.reconnect(), loop=BG_LOOP)
+
+    async def reconnect(self):
+        self.is_reconnecting = True
+        backoff = RECONNECT_BACKOFF
+        while not self.is_connected and not self.user_disconnected:
+            await asyncio.sleep(backoff)
+            print(f"Reconnecting to {self.name} {self.address}...")
+            await self.connect()
+            backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+        self.is_reconnecting = False
+
+    def record_reconnect(self, reconnected_at: float):
+        self.reconnect_times.append(reconnected_at - self.disconnected_at)
+        print(f"Reconnected to {self.name} after {self.reconnect_times[-1]:.2f}s")
+        if self.widget is not None:
+            self.widget.on_reconnect(self.disconnected_at, reconnected_at)
+        self.disconnected_at = None
+
+    @property
+    def last_reconnect_time(self):
+        return self.reconnect_times[-1] if len(self.reconnect_times) > 0 else None
+
     async def connect(self):
         if self.is_connected:
             return print(f"Device {self.name} is already connected!")
+        self.user_disconnected = False
+        if self.connect_requested_at is None:
+            self.connect_requested_at = time.time()
         try:
             print(f"Connecting to {self.name} {self.address}... ")
             await self.client.connect()
             self.is_connected = True
+            connected_at = time.time()
             print(f"CONNECTED to {self.name} {self.address}!")
         except Exception as e:
             print(f"Exception connecting to device: {self}: {e}")
             return
 
+        if hasattr(self.strategy, "attach"):
+            self.strategy.attach(self)
+
         if self.widget is not None:
             self.widget.on_connect()   
+        if self.disconnected_at is not None:
+            # After a link loss, the gap was opened by on_link_lost, the link is back before notifications restart
+            self.record_reconnect(connected_at)
 
         print(f"Starting notifications for gatt '{self.strategy.characteristic_uuid_tx}'...")
         await self.start_notifications()
         await self.send_name_to_device()
+        if REQUEST_MTU:
+            await self.request_mtu()
+        self.resolve_handles()
+        if self.registry is not None:
+            self.registry.remember(self)
+        if self.housekeeping is not None:
+            self.housekeeping.register(self)
 
+    def resolve_handles(self):
+        try:
+            self.strategy.tx_handle = self.client.services.get_characteristic(self.strategy.characteristic_uuid_tx).handle
+            self.strategy.rx_handle = self.client.services.get_characteristic(self.strategy.characteristic_uuid_rx).handle
+        except Exception as e:
+            print(f"Exception resolving characteristic handles for {self.name}: {e}")
 
     async def start_notifications(self):
+        if self.strategy.tx_handle is not None:
+            try:
+                # Cached handle from a previous session, avoids looking the characteristic up by UUID
+                await self.client.start_notify(self.strategy.tx_handle, self.notification_handler)
+                return
+            except Exception as e:
+                print(f"Cached handle {self.strategy.tx_handle} not valid anymore for {self.name}: {e}")
+                self.strategy.tx_handle = None
         try:
             # Start receiving notifications on the GATT characteristic advertising the sensor's IMU data
             await self.client.start_notify(self.strategy.characteristic_uuid_tx, self.notification_handler)
@@ -164,15 +393,140 @@ class SensorDevice(BLEDevice):
             print(f"Exception writing to gatt '{WATCH_CHARACTERISTIC_UUID_RX}': {e}")
             
         try:
-            await self.client.write_gatt_char(self.characteristic_uuid_rx, bytearray(f"n{device_name}", "utf-8"))
+            await self.client.write_gatt_char(self.strategy.characteristic_uuid_rx, bytearray(f"n{device_name}", "utf-8"))
             descriptors = self.client.services.descriptors
         except Exception as e:
-            print(f"Exception writing to gatt '{self.characteristic_uuid_rx}': {e}")
+            print(f"Exception writing to gatt '{self.strategy.characteristic_uuid_rx}': {e}")
 
         if self.widget is not None:
             self.widget.on_services_discovered(characteristics, descriptors)
             
     
+    async def write_command(self, payload: bytes):
+        if hasattr(self.strategy, "write_command"):
+            # Strategies with their own command queue (Wit) keep writes ordered with their register reads
+            try:
+                return await self.strategy.write_command(payload)
+            except Exception as e:
+                print(f"Exception writing command to {self.name}: {e}")
+                return False
+        # The strategy's RX characteristic, the watch one only for sensors that do not expose it
+        try:
+            await self.client.write_gatt_char(self.strategy.characteristic_uuid_rx, payload)
+            return True
+        except Exception as e:
+            error = e
+        try:
+            await self.client.write_gatt_char(WATCH_CHARACTERISTIC_UUID_RX, payload)
+            return True
+        except Exception as e:
+            print(f"Exception writing command to {self.name}: '{self.strategy.characteristic_uuid_rx}': {error}, '{WATCH_CHARACTERISTIC_UUID_RX}': {e}")
+        return False
+
+    async def set_sample_rate(self, rate_hz: float):
+        if not self.is_connected or self.strategy is None:
+            return print(f"Device {self.name} is not connected, cannot set the sample rate!")
+        print(f"Setting {self.name} output rate to {rate_hz} Hz")
+        for command in self.strategy.rate_commands(rate_hz):
+            if not await self.write_command(command):
+                return
+        self.requested_rate = rate_hz
+        self.rate_estimator.reset()
+        self.signal_filter.set_sample_rate(rate_hz)
+        self.periodicity.reset()
+        self.clock.reset()
+
+    async def request_mtu(self):
+        if platform.system() == "Linux":
+            await self.acquire_bluez_mtu()
+        try:
+            # Public API, CoreBluetooth and WinRT negotiate the MTU on connect
+            self.mtu = self.client.mtu_size
+            print(f"MTU for {self.name}: {self.mtu}")
+        except Exception as e:
+            print(f"Exception reading MTU for {self.name}: {e}")
+
+    async def acquire_bluez_mtu(self):
+        # BlueZ reports the default 23 bytes until the MTU is acquired, bleak has no public API for it:
+        # its docs suggest the private BleakClientBlueZDBus._acquire_mtu (bleak >= 0.20), so it is only
+        # called on that backend and version, any failure just leaves the default MTU
+        try:
+            bleak_version = tuple(int(v) for v in importlib.metadata.version("bleak").split(".")[:2])
+        except Exception as e:
+            return
+        backend = getattr(self.client, "_backend", None)
+        if bleak_version < (0, 20) or type(backend).__name__ != "BleakClientBlueZDBus" or not hasattr(backend, "_acquire_mtu"):
+            return
+        try:
+            await backend._acquire_mtu()
+        except Exception as e:
+            print(f"Exception acquiring MTU from BlueZ for {self.name}: {e}")
+
+    def track_sequence(self, seq: float):
+        # Lost samples before this one, None for a duplicate to drop, 0 when the strategy has no counter
+        if not self.has_sequence:
+            return 0
+        return self.sequence.update(seq)
+
+    @property
+    def has_sequence(self):
+        return SEQUENCE_TRACKING and self.strategy is not None and self.strategy.has_sequence
+
+    def timestamp_sample(self, host_time: float):
+        # Wall clock time of the latest sample from the host/device clock model, the arrival time until it is fitted
+        if self.has_sequence:
+            index = self.sequence.index
+        else:
+            self.samples_seen += 1
+            index = self.samples_seen
+        self.clock.add(index, host_time)
+        t = self.clock.predict(index)
+        t = (host_time if t is None else t) + MONOTONIC_TO_EPOCH
+        # Samples of one connection event arrive together, and the first fit moves the line down to the earliest
+        # arrivals: keep at least half a sample period between timestamps, the model catches up with the clamp
+        if self.last_timestamp is not None:
+            t = max(t, self.last_timestamp + 0.5 / self.requested_rate)
+        self.last_timestamp = t
+        return t
+
+    def lost_timestamps(self, count: int):
+        # Timestamps of the samples lost right before the latest one
+        index = self.sequence.index
+        predicted = [self.clock.predict(index - count + i) for i in range(count)]
+        return [float("nan") if t is None else t + MONOTONIC_TO_EPOCH for t in predicted]
+
+    def on_sample(self, t: float = None):
+        self.rate_estimator.add_sample(t)
+
+    @property
+    def dominant_period(self):
+        # (period in seconds, confidence) of the gyroscope signal, period is None until the window is full
+        period, confidence = self.periodicity.dominant()
+        return (None if period is None else period / self.requested_rate), confidence
+
+    def set_fusion_filter(self, name: str):
+        self.fusion = makeFusionFilter(name)
+        self.fusion_filter = name
+        self.last_fusion_time = None
+
+    def update_orientation(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, t: float = None):
+        # Runs wherever samples are decoded (the bleak thread for notifications), never on the UI thread
+        t = time.monotonic() if t is None else t
+        if self.last_fusion_time is None:
+            dt = 1.0 / self.requested_rate
+        else:
+            # Real inter-sample interval, clamped so that a stalled link does not throw the filter off
+            dt = min(max(t - self.last_fusion_time, 0.0), ORIENTATION_MAX_DT)
+        self.last_fusion_time = t
+        if acc_x == 0 and acc_y == 0 and acc_z == 0:
+            return None
+        self.fusion.updateRollAndPitch(acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, dt)
+        return self.fusion
+
+    @property
+    def effective_rate(self):
+        return self.rate_estimator.rate
+
     def process_data(self, byte_data: bytearray):
         if self.strategy:
             return self.strategy.process_data(byte_data)
@@ -9,29 +9,33 @@ from threading import Thread
 import asyncio
 import typing
 from .IMUDataWidget import IMUDataWidget
+from .DeviceTable import DeviceTable
 from .config import EXER_BLE_SERVICE_UUID, EXER_CHARACTERISTIC_UUID_TX, EXER_CHARACTERISTIC_UUID_RX, WATCH_CHARACTERISTIC_UUID_RX, WATCH_CHARACTERISTIC_UUID_TX, TEST_SERVICE_UUIDS, FILTERED_DEVICES, AUTO_CONNECT
 from .SensorDevice import SensorDevice
 
 class SensorDeviceWidget:
-    def __init__(self, app, device: SensorDevice, foldout_container: str = None, panel_container: str = None, exer_sensors_container: str = None, separate_window: bool = True):
+    def __init__(self, app, device: SensorDevice, table: DeviceTable = None, panel_container: str = None, exer_sensors_container: str = None, separate_window: bool = True):
         self.app = app
         self.themes = self.app.themes
         self.theme = self.themes.generic_device
-        self.foldout_tag = f"{device.address}_foldout"
-        self.selectable_tag = f"{device.address}_selectable"
         self.panel_tag = f"{device.address}_panel"
-        self.button_tag = f"{device.address}_button"
         self.device: SensorDevice = device
-        self.foldout_container = foldout_container
+        self.table = table  # the device row is drawn by the table, this widget only holds its state
         self.panel_container = panel_container
         self.exer_sensors_container = exer_sensors_container
         self.on_click = None
-        self.handler_registry = dpg.add_item_handler_registry()
-        self.click_handler = -1
+        self.payload: bytearray = None  # last notification, decoded only when the row is drawn
         self.imu_widget = IMUDataWidget(app, self.device)
         self.separate_window = separate_window
-        if self.foldout_container is not None:
-            self.foldout_info(self.foldout_container)
+
+    def mark_dirty(self):
+        if self.table is not None:
+            self.table.mark_dirty()
+
+    def label(self):
+        if self.device.is_connected and self.payload is not None:
+            return f"{self.device.name} ({self.device.address}) => {self.payload.decode('utf-8', errors='replace')}"
+        return f"{self.device.name} ({self.device.address})"
 
     def set_selected(self, selected: bool):
         self.device.is_selected = selected
@@ -58,45 +62,44 @@ class SensorDeviceWidget:
                 dpg.add_text(tag=f"{self.panel_tag}_service_uuids", default_value=f"{list(map(lambda x: str(x.uuid), self.client.services.services.values()))}")
             except Exception as e:
                 pass
-            dpg.add_text(tag=f"{self.panel_tag}_service_data", default_value=f"{self.device.ad_data.service_data}")
-            dpg.add_text(tag=f"{self.panel_tag}_manufacturer_data", default_value=f"{self.device.ad_data.manufacturer_data}")
-            dpg.add_text(tag=f"{self.panel_tag}_platform_data", default_value=f"{self.device.ad_data.platform_data}")
-            dpg.add_text(tag=f"{self.panel_tag}_rssi", default_value=f"{self.device.ad_data.rssi}")
-            dpg.add_text(tag=f"{self.panel_tag}_services", default_value=f"{self.device.ad_data.rssi}")
-
-    def foldout_info(self, container: str = None):
-        container = self.foldout_container if container is None else container
-        with dpg.group(parent=container, filter_key=f"{self.device.name}", horizontal=True, tag=self.foldout_tag) as grp:
-            dpg.add_button(tag=self.button_tag, label=f"Connect", callback=self.device.toggle_connect, user_data=self.device, enabled=True, show=False)
-            dpg.add_collapsing_header(label=f"{self.device.name} ({self.device.address})", tag=self.selectable_tag, closable=False, leaf=True)
-
-        dpg.bind_item_handler_registry(self.selectable_tag, self.handler_registry)
-        self.click_handler = dpg.add_item_clicked_handler(parent=self.handler_registry, callback=self.on_device_click)
-        dpg.bind_item_theme(self.foldout_tag, self.themes.generic_device)
+            # Devices that were never seen advertising have no ad_data, the texts are still created for the later updates
+            ad_data = self.device.ad_data
+            dpg.add_text(tag=f"{self.panel_tag}_service_data", default_value="-" if ad_data is None else f"{ad_data.service_data}")
+            dpg.add_text(tag=f"{self.panel_tag}_manufacturer_data", default_value="-" if ad_data is None else f"{ad_data.manufacturer_data}")
+            dpg.add_text(tag=f"{self.panel_tag}_platform_data", default_value="-" if ad_data is None else f"{ad_data.platform_data}")
+            dpg.add_text(tag=f"{self.panel_tag}_rssi", default_value="-" if ad_data is None else f"{ad_data.rssi}")
+            dpg.add_text(tag=f"{self.panel_tag}_services", default_value="-" if ad_data is None else f"{ad_data.rssi}")
 
     def on_notification(self, characteristic: BleakGATTCharacteristic, data: bytearray):
         # print(f"Notification received from {characteristic}: {data}")
-        dpg.set_item_label(self.selectable_tag, f"{self.device.name} ({self.device.address}) => {data.decode('utf-8')}")
+        self.payload = data
+        self.mark_dirty()
         self.imu_widget.update(data)
         # self.imu_widget2.update(data)
         # print(f"{characteristic.description}: {data}")
         
+    def on_rssi_update(self, data: AdvertisementData):
+        self.device.update_rssi(data)
+        self.mark_dirty()
+        if dpg.does_item_exist(f"{self.panel_tag}_rssi"):
+            dpg.set_value(f"{self.panel_tag}_rssi", f"{data.rssi}")
+
+    def on_advertisement(self, data: AdvertisementData):
+        values = self.device.capture_advertisement(data)
+        if values is not None:
+            self.imu_widget.update_values(values)
+
     def on_accepted_device(self):
-        self.update_theme()
-        for i in range(len(self.app.devices.keys())):
-            dpg.move_item_up(self.foldout_tag)  # Move ExerWatch sensors all the way to the top
+        self.update_theme()  # the table sorts ExerWatch sensors to the top
         self.add_widget()
 
     def update_theme(self):
-        # dpg.configure_item(self.selectable_tag, selected=self.device.is_selected)
         self.theme = self.themes.generic_device
         if self.device.is_selected:
             self.theme = self.themes.selected_device
         elif self.device.is_exerwatch:
             self.theme = self.themes.exer_device
-        # print(f"Updating theme for {self.device.name}: {self.theme} ")
-        dpg.bind_item_theme(self.foldout_tag, self.theme)
-        dpg.configure_item(self.button_tag, show=self.device.is_exerwatch)
+        self.mark_dirty()
 
     def add_widget(self, container: str = None):
         container = self.exer_sensors_container if container is None else container
@@ -104,13 +107,19 @@ class SensorDeviceWidget:
         # self.imu_widget2.add_widget(self.exer_sensors_container)
 
     def on_disconnect(self):
-        dpg.configure_item(self.button_tag, label="Connect")
-        dpg.set_item_label(self.selectable_tag, f"{self.device.name} ({self.device.address})")
+        self.payload = None
+        self.mark_dirty()
         self.imu_widget.on_disconnect()
 
     def on_connect(self):
-        dpg.configure_item(self.button_tag, label="Disconnect")
+        self.mark_dirty()
         self.imu_widget.on_connect()
+
+    def on_link_lost(self, disconnected_at: float):
+        self.imu_widget.on_link_lost(disconnected_at)
+
+    def on_reconnect(self, disconnected_at: float, reconnected_at: float):
+        self.imu_widget.on_reconnect(disconnected_at, reconnected_at)
         
     def on_services_discovered(self, characteristics, descriptors):
         str_data = ""
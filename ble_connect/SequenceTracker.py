@@ -0,0 +1,54 @@
+class SequenceTracker:
+    def __init__(self, modulus: int = 65536, max_gap: int = 1000, max_late: int = 3):
+        self.modulus = modulus  # the device counter wraps around at this value
+        self.max_gap = max_gap  # larger forward jumps are taken as a counter reset, not as lost samples
+        self.max_late = max_late  # consecutive samples behind the last one before the counter is taken as restarted
+        self.last_seq: int = None
+        self.late_run = 0
+        self.index = -1  # unwrapped counter of the last delivered sample, lost samples included
+        self.delivered = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.resets = 0
+
+    def resync(self):
+        # The next counter value is taken as is, e.g. after a reconnect whose gap is accounted separately
+        self.last_seq = None
+
+    def update(self, seq: float):
+        """
+        Return
+        ------
+        None for a duplicate or late sample that must be dropped, otherwise the
+        number of samples lost right before this one
+        """
+        seq = int(seq) % self.modulus
+        if self.last_seq is None:
+            self.last_seq = seq
+            self.delivered += 1
+            self.index += 1
+            return 0
+        step = (seq - self.last_seq) % self.modulus
+        if step == 0 or step > self.modulus - self.max_gap:
+            # Same counter again, or slightly behind the last one: retransmitted or reordered
+            self.late_run += 1
+            if self.late_run <= self.max_late:
+                self.duplicates += 1
+                return None
+            # Too many in a row, the device restarted its counter
+            step = self.max_gap + 1
+        self.late_run = 0
+        self.last_seq = seq
+        self.delivered += 1
+        if step > self.max_gap:
+            self.resets += 1
+            self.index += 1
+            return 0
+        self.index += step
+        self.lost += step - 1
+        return step - 1
+
+    @property
+    def loss_rate(self):
+        expected = self.delivered + self.lost
+        return self.lost / expected if expected > 0 else 0.0
@@ -0,0 +1,146 @@
+import dearpygui.dearpygui as dpg
+import os
+import json
+import time
+import datetime
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from .IMUDataWidget import IMUDataWidget
+
+
+class DeviceRecording:
+    def __init__(self, widget: IMUDataWidget, start_index: int):
+        self.widget = widget
+        self.start_index = start_index
+        self.proto_start = len(widget.exercise_prototype.data)  # exercises detected before joining are not part of the session
+        self.joined_at = time.time()
+        # Link statistics are cumulative over the connection, the manifest reports the session share
+        self.lost = widget.device.sequence.lost
+        self.duplicates = widget.device.sequence.duplicates
+        self.delivered = widget.device.sequence.delivered
+
+
+class SessionCoordinator:
+    """
+    Starts and stops recording on all the connected devices at once. Stopping
+    snapshots every device on the UI thread, then writes the device exports,
+    the synchronized frames and a manifest into one session folder from a
+    pool of writers, without blocking the UI.
+    """
+
+    def __init__(self, app, out_dir: str = "data", tag: str = "session_coordinator"):
+        self.app = app
+        self.out_dir = out_dir
+        self.tag = tag
+        self.button_tag = f"{self.tag}_button"
+        self.status_tag = f"{self.tag}_status"
+        self.is_recording = False
+        self.session_id: str = None
+        self.started_at: float = None
+        self.recordings: dict[str, DeviceRecording] = {}
+
+    def make_controls(self):
+        with dpg.group(horizontal=True):
+            dpg.add_button(tag=self.button_tag, label="Start recording", callback=self.toggle_recording, width=150, height=30)
+            dpg.add_text(tag=self.status_tag, default_value="Not recording")
+
+    def toggle_recording(self):
+        if self.is_recording:
+            self.stop()
+        else:
+            self.start()
+
+    def set_status(self, status: str):
+        try:
+            dpg.set_value(self.status_tag, status)
+        except Exception as e:
+            pass
+
+    def start(self):
+        self.session_id = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.started_at = time.time()
+        self.recordings = {}
+        self.is_recording = True
+        for device_widget in self.app.devices.values():
+            if device_widget.device.is_connected:
+                self.join(device_widget.imu_widget)
+        dpg.configure_item(self.button_tag, label="Stop recording")
+        self.set_status(f"Recording session {self.session_id} on {len(self.recordings)} devices")
+
+    def join(self, widget: IMUDataWidget):
+        # Devices connecting while recording join the session from their next sample
+        if not self.is_recording or widget.device.address in self.recordings:
+            return
+        self.recordings[widget.device.address] = DeviceRecording(widget, len(widget.accelerometer.data))
+        print(f"{widget.device.name} joined recording session {self.session_id}")
+
+    def stop(self):
+        self.is_recording = False
+        stopped_at = time.time()
+        dpg.configure_item(self.button_tag, label="Start recording")
+        session_dir = f"{self.out_dir}/session_{self.session_id}"
+        if not os.path.exists(session_dir):
+            os.makedirs(session_dir)
+        # Snapshots are taken here so that every device ends at the same moment
+        snapshots = []
+        for recording in self.recordings.values():
+            widget = recording.widget
+            widget.flush_exersense()
+            snapshots.append((recording, widget.snapshot_data(recording.start_index, proto_start=recording.proto_start)))
+        synchronized = None
+        if self.app.sync_view is not None:
+            synchronized = self.app.sync_view.snapshot_data(self.started_at, stopped_at)
+        self.set_status(f"Writing session {self.session_id}...")
+        Thread(target=self.write_session, args=(session_dir, self.session_id, self.started_at, stopped_at, snapshots, synchronized), daemon=True).start()
+
+    def write_session(self, session_dir, session_id, started_at, stopped_at, snapshots, synchronized):
+        with ThreadPoolExecutor(max_workers=max(len(snapshots), 1)) as pool:
+            futures = [pool.submit(recording.widget.write_data, data, session_dir, session_id) for recording, data in snapshots]
+            sync_file = None
+            sync_future = None
+            if synchronized is not None and len(synchronized) > 0:
+                sync_file = f"{session_dir}/synchronized_{session_id}.csv"
+                sync_future = pool.submit(synchronized.to_csv, sync_file, index=False)
+        if sync_future is not None and sync_future.exception() is not None:
+            print(f"Exception writing the synchronized session data: {sync_future.exception()}")
+            sync_file = None
+        devices = []
+        for (recording, data), future in zip(snapshots, futures):
+            device = recording.widget.device
+            try:
+                files = future.result()
+            except Exception as e:
+                print(f"Exception writing {device.name} session data: {e}")
+                files = None
+            timestamps = data['imu']['timestamp']
+            lost = device.sequence.lost - recording.lost
+            delivered = device.sequence.delivered - recording.delivered
+            devices.append({
+                "name": device.name,
+                "address": device.address,
+                "strategy": device.strategy_type,
+                "joined_at": recording.joined_at,
+                "first_timestamp": None if timestamps.isna().all() else float(timestamps.min()),
+                "last_timestamp": None if timestamps.isna().all() else float(timestamps.max()),
+                "samples": int(data['imu']['accel_x'].notna().sum()),
+                "rows": len(data['imu']),
+                "lost": lost,
+                "duplicates": device.sequence.duplicates - recording.duplicates,
+                "loss_rate": lost / (delivered + lost) if delivered + lost > 0 else 0.0,
+                "requested_rate": device.requested_rate,
+                "effective_rate": device.effective_rate,
+                "clock_drift_ppm": device.clock.drift_ppm(device.requested_rate),
+                "files": files,
+            })
+        manifest = {
+            "session": session_id,
+            "started_at": started_at,
+            "stopped_at": stopped_at,
+            "devices": devices,
+            "synchronized": sync_file,
+        }
+        manifest_file = f"{session_dir}/manifest.json"
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"Session {session_id} written to {session_dir}")
+        self.set_status(f"Last session: {manifest_file}")
@@ -0,0 +1,82 @@
+import math
+import numpy as np
+
+N_AXES = 6  # acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z
+
+
+def design_biquad(kind: str, cutoff: float, fs: float, q: float = 0.7071):
+    # RBJ audio EQ cookbook coefficients, normalized so that a0 == 1
+    w0 = 2 * math.pi * cutoff / fs
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    if kind == "lowpass":
+        b = [(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2]
+    elif kind == "highpass":
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+    elif kind == "notch":
+        b = [1.0, -2 * cos_w0, 1.0]
+    else:
+        raise ValueError(f"Unknown filter type {kind}, expected lowpass, highpass or notch")
+    a0 = 1 + alpha
+    a = [-2 * cos_w0 / a0, (1 - alpha) / a0]
+    return [c / a0 for c in b], a
+
+
+class Biquad:
+    def __init__(self, kind: str, cutoff: float, fs: float, q: float = 0.7071, n_axes: int = N_AXES):
+        self.kind = kind
+        self.cutoff = cutoff
+        self.q = q
+        (self.b0, self.b1, self.b2), (self.a1, self.a2) = design_biquad(kind, cutoff, fs, q)
+        # Transposed direct form II state, one column per axis
+        self.z1 = np.zeros(n_axes)
+        self.z2 = np.zeros(n_axes)
+        self.primed = False
+
+    def prime(self, x: np.ndarray):
+        # Start from the steady state of a constant input x instead of zero, no step transient on the first samples
+        y = x * (self.b0 + self.b1 + self.b2) / (1 + self.a1 + self.a2)
+        self.z1 = y - self.b0 * x
+        self.z2 = self.b2 * x - self.a2 * y
+        self.primed = True
+
+    def process(self, x: np.ndarray):
+        if not self.primed:
+            self.prime(x)
+        y = self.b0 * x + self.z1
+        self.z1 = self.b1 * x - self.a1 * y + self.z2
+        self.z2 = self.b2 * x - self.a2 * y
+        return y
+
+    def reset(self):
+        self.primed = False
+
+
+class SignalFilter:
+    """
+    Cascade of biquads applied to the six IMU axes at once. The state is kept
+    between calls, so samples can be fed one at a time or in batches.
+
+    stages: list of dicts like {"type": "lowpass", "cutoff": 3.0, "q": 0.7071}
+    """
+
+    def __init__(self, stages: list[dict], fs: float):
+        self.stages = stages
+        self.set_sample_rate(fs)
+
+    def set_sample_rate(self, fs: float):
+        self.fs = fs
+        # Stages at or above the Nyquist frequency of the current rate are left out
+        self.sections = [Biquad(s["type"], s["cutoff"], fs, s.get("q", 0.7071)) for s in self.stages if s["cutoff"] < fs / 2]
+
+    def reset(self):
+        for section in self.sections:
+            section.reset()
+
+    def process(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z):
+        if not self.sections:
+            return acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z
+        y = np.array([acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z], dtype=float)
+        for section in self.sections:
+            y = section.process(y)
+        return tuple(y.tolist())
@@ -0,0 +1,68 @@
+import numpy as np
+
+# Colormap anchors from low to high power, RGBA in [0, 1]
+COLORMAP_ANCHORS = np.array([
+    [0.0, 0.0, 0.0, 1.0],
+    [0.1, 0.1, 0.6, 1.0],
+    [0.7, 0.1, 0.5, 1.0],
+    [1.0, 0.6, 0.0, 1.0],
+    [1.0, 1.0, 0.6, 1.0],
+], dtype=np.float32)
+COLORMAP = np.stack([np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(COLORMAP_ANCHORS)), COLORMAP_ANCHORS[:, c]) for c in range(4)], axis=1).astype(np.float32)
+
+
+class Spectrogram:
+    """
+    Short-time Fourier transform of the three gyroscope axes, computed one hop at
+    a time. Columns are written into a preallocated float32 ring, the cost per
+    sample and per frame does not grow with the length of the session.
+    """
+
+    def __init__(self, n_fft: int = 64, hop: int = 8, columns: int = 200, db_range: tuple[float, float] = (0.0, 60.0)):
+        self.n_fft = n_fft
+        self.hop = hop
+        self.columns = columns
+        self.db_range = db_range
+        self.n_bins = n_fft // 2 + 1
+        self.window = np.hanning(n_fft)
+        self.reset()
+
+    def restart(self):
+        # New frame after a discontinuity, the columns already computed are kept.
+        # Every sample is written twice, so the last n_fft samples are always one contiguous slice
+        self.samples = np.zeros((2 * self.n_fft, 3))
+        self.pos = 0
+        self.count = 0
+
+    def reset(self):
+        self.restart()
+        self.column = 0
+        self.power_db = np.full((self.n_bins, self.columns), self.db_range[0], dtype=np.float32)
+        # Texture rows go from the highest frequency at the top to DC at the bottom
+        self.rgba = np.zeros((self.n_bins, self.columns, 4), dtype=np.float32)
+        self.rgba[..., 3] = 1.0
+
+    def add(self, x: float, y: float, z: float):
+        """Returns True when the sample completed a hop and a new column was computed"""
+        self.samples[self.pos] = self.samples[self.pos + self.n_fft] = (x, y, z)
+        self.pos = (self.pos + 1) % self.n_fft
+        self.count += 1
+        if self.count < self.n_fft or self.count % self.hop != 0:
+            return False
+        self.add_column(self.samples[self.pos:self.pos + self.n_fft])
+        return True
+
+    def add_column(self, frame: np.ndarray):
+        frame = (frame - frame.mean(axis=0)) * self.window[:, None]
+        spectrum = np.fft.rfft(frame, axis=0)
+        power = np.sum(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)
+        low, high = self.db_range
+        column_db = np.clip(10 * np.log10(power + 1e-12), low, high).astype(np.float32)
+        self.power_db[:, self.column] = column_db
+        levels = ((column_db - low) / (high - low) * 255).astype(np.int32)
+        self.rgba[:, self.column] = COLORMAP[levels[::-1]]
+        self.column = (self.column + 1) % self.columns
+
+    def texture(self):
+        # Oldest column on the left, the roll is over the fixed size ring and only happens once per hop
+        return np.roll(self.rgba, -self.column, axis=1).ravel()
@@ -0,0 +1,68 @@
+import dearpygui.dearpygui as dpg
+from .Spectrogram import Spectrogram
+from .config import FREQUENCY, SPECTROGRAM_FFT, SPECTROGRAM_HOP, SPECTROGRAM_COLUMNS, SPECTROGRAM_DB_RANGE
+
+
+class SpectrogramPlot:
+    def __init__(self, parent, tag: str = "spectrogram", title="Spectrogram"):
+        self.tag = tag
+        self.parent = parent
+        self.title = title
+        self.spectrogram = Spectrogram(SPECTROGRAM_FFT, SPECTROGRAM_HOP, SPECTROGRAM_COLUMNS, SPECTROGRAM_DB_RANGE)
+        self.sample_rate = FREQUENCY
+        self.texture_tag = f"{self.tag}_texture"
+        self.plot_tag = f"{self.tag}_plot"
+        self.xaxis = f"{self.tag}_xaxis"
+        self.yaxis = f"{self.tag}_yaxis"
+        self.series_tag = f"{self.tag}_series"
+
+    def bounds(self):
+        # The newest column is at t = 0, the x axis shows seconds in the past
+        span = self.spectrogram.columns * self.spectrogram.hop / self.sample_rate
+        return (-span, 0.0), (0.0, self.sample_rate / 2)
+
+    def make_plot(self, width=-1, height=250):
+        with dpg.texture_registry():
+            dpg.add_dynamic_texture(self.spectrogram.columns, self.spectrogram.n_bins, self.spectrogram.texture(), tag=self.texture_tag)
+        bounds_min, bounds_max = self.bounds()
+        with dpg.plot(tag=self.plot_tag, label=self.title, width=width, height=height):
+            dpg.add_plot_axis(dpg.mvXAxis, tag=self.xaxis, label="s")
+            dpg.add_plot_axis(dpg.mvYAxis, tag=self.yaxis, label="Hz")
+            dpg.add_image_series(self.texture_tag, bounds_min, bounds_max, tag=self.series_tag, parent=self.yaxis)
+        self.fit_axes()
+
+    def fit_axes(self):
+        bounds_min, bounds_max = self.bounds()
+        try:
+            dpg.set_axis_limits(self.xaxis, bounds_min[0], bounds_max[0])
+            dpg.set_axis_limits(self.yaxis, bounds_min[1], bounds_max[1])
+        except Exception as e:
+            pass
+
+    def set_sample_rate(self, sample_rate: float):
+        self.sample_rate = sample_rate
+        self.reset()
+        bounds_min, bounds_max = self.bounds()
+        try:
+            dpg.configure_item(self.series_tag, bounds_min=bounds_min, bounds_max=bounds_max)
+        except Exception as e:
+            pass
+        self.fit_axes()
+
+    def reset(self):
+        self.spectrogram.reset()
+        self.update_texture()
+
+    def restart(self):
+        self.spectrogram.restart()
+
+    def update(self, x: float, y: float, z: float):
+        # The texture is only uploaded when a hop completes a new column
+        if self.spectrogram.add(x, y, z):
+            self.update_texture()
+
+    def update_texture(self):
+        try:
+            dpg.set_value(self.texture_tag, self.spectrogram.texture())
+        except Exception as e:
+            pass
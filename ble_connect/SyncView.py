@@ -0,0 +1,126 @@
+import dearpygui.dearpygui as dpg
+import os
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from .DeviceSync import DeviceSynchronizer
+from .config import SYNC_RATE, SYNC_MAX_DELAY, SYNC_MAX_GAP, SYNC_VIEW_SECONDS, SYNC_UPDATE_INTERVAL
+
+CHANNELS = ["accel_x", "accel_y", "accel_z", "gyr_x", "gyr_y", "gyr_z"]
+
+
+class SyncViewWindow:
+    def __init__(self, app, tag: str = "sync_view_window"):
+        self.app = app
+        self.tag = tag
+        self.synchronizer = DeviceSynchronizer(SYNC_RATE, SYNC_MAX_DELAY, SYNC_MAX_GAP)
+        self.plot_tag = f"{self.tag}_plot"
+        self.xaxis = f"{self.tag}_xaxis"
+        self.yaxis = f"{self.tag}_yaxis"
+        self.status_tag = f"{self.tag}_status"
+        self.series: dict[str, str] = {}  # device address -> line series tag, the name is only its label
+        self.chunks: list[tuple[np.ndarray, list[str], list[str], np.ndarray]] = []  # everything pulled, for the joint export
+        self.view_times: list[float] = []
+        self.view_values: dict[str, list[float]] = {}  # device address -> plotted magnitudes
+        self.start_time: float = None
+        self.last_update = time.time()
+        self.frames = 0
+        self.make_window()
+
+    def make_window(self):
+        with dpg.window(label="Synchronized Devices", tag=self.tag, autosize=True):
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Export aligned", callback=lambda: self.export_data(), width=120, height=30)
+                dpg.add_button(label="Clear", callback=self.clear_data, width=100, height=30)
+                dpg.add_text(tag=self.status_tag, default_value=f"Common clock: {SYNC_RATE:g} Hz")
+            with dpg.plot(tag=self.plot_tag, label="Gyroscope magnitude on the common clock", width=-1, height=300):
+                dpg.add_plot_legend()
+                dpg.add_plot_axis(dpg.mvXAxis, tag=self.xaxis, label="s")
+                dpg.add_plot_axis(dpg.mvYAxis, tag=self.yaxis)
+
+    def push(self, device, ts: float, values: tuple):
+        self.synchronizer.push(device.address, device.name, ts, values)
+
+    def remove(self, device):
+        # A disconnected device no longer holds the common clock back, its plotted history is kept
+        self.synchronizer.remove(device.address)
+
+    def update(self):
+        # Called from the render loop, the synchronizer is only pulled every SYNC_UPDATE_INTERVAL
+        now = time.time()
+        if now - self.last_update < SYNC_UPDATE_INTERVAL:
+            return
+        self.last_update = now
+        times, keys, names, frames = self.synchronizer.pull(now)
+        if len(times) == 0:
+            return
+        self.chunks.append((times, keys, names, frames))
+        self.frames += len(times)
+        if self.start_time is None:
+            self.start_time = times[0]
+        self.update_plot(times, keys, names, frames)
+
+    def update_plot(self, times, keys, names, frames):
+        self.view_times.extend((times - self.start_time).tolist())
+        magnitude = np.linalg.norm(frames[:, :, 3:6], axis=2)
+        for d, (key, name) in enumerate(zip(keys, names)):
+            if key not in self.series:
+                self.series[key] = dpg.add_line_series([], [], label=f"{name} ({key})", parent=self.yaxis)
+                # A device joining late has no values for the frames already shown
+                self.view_values[key] = [float("nan")] * (len(self.view_times) - len(times))
+            self.view_values[key].extend(magnitude[:, d].tolist())
+        for key, values in self.view_values.items():
+            if key not in keys:
+                values.extend([float("nan")] * len(times))
+        # Only the last SYNC_VIEW_SECONDS are kept for the plot, the export uses the chunks
+        keep = int(SYNC_VIEW_SECONDS * SYNC_RATE)
+        if len(self.view_times) > keep:
+            del self.view_times[:-keep]
+            for values in self.view_values.values():
+                del values[:-keep]
+        for key, values in self.view_values.items():
+            dpg.configure_item(self.series[key], x=self.view_times, y=values)
+        dpg.fit_axis_data(self.xaxis)
+        dpg.fit_axis_data(self.yaxis)
+        dpg.set_value(self.status_tag, f"Common clock: {SYNC_RATE:g} Hz, {len(self.view_values)} devices, {self.frames} frames")
+
+    def clear_data(self):
+        self.synchronizer.reset()
+        self.chunks = []
+        self.view_times = []
+        self.view_values = {}
+        self.start_time = None
+        self.frames = 0
+        for series in self.series.values():
+            dpg.delete_item(series)
+        self.series = {}
+
+    def snapshot_data(self, start: float = None, end: float = None):
+        # One row per common clock frame between start and end, one column per device and channel.
+        # Columns are named after the address as well, two devices can advertise the same name
+        frames = []
+        for times, keys, names, chunk in self.chunks:
+            df = pd.DataFrame(chunk.reshape(len(times), -1), columns=[f"{name}_{key}_{channel}" for key, name in zip(keys, names) for channel in CHANNELS])
+            df.insert(0, "timestamp", times)
+            frames.append(df)
+        if not frames:
+            return None
+        sync_df = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            sync_df = sync_df[sync_df["timestamp"] >= start]
+        if end is not None:
+            sync_df = sync_df[sync_df["timestamp"] <= end]
+        return sync_df.reset_index(drop=True)
+
+    def export_data(self, out_dir="data"):
+        if not self.chunks:
+            return print("No synchronized frames to export")
+        export_time = datetime.datetime.now().strftime("%d-%m_%H-%M")
+        out_dir = f"{out_dir}/{export_time}"
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        sync_df = self.snapshot_data()
+        sync_file_name = f"{out_dir}/synchronized_{export_time}.csv"
+        print(f"Exporting synchronized data to: {sync_file_name}")
+        sync_df.to_csv(sync_file_name, index=False)
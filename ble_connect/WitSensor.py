@@ -1,9 +1,11 @@
 import struct
+import asyncio
 import logging
-import threading
+from collections import deque
 from enum import IntEnum
 from typing import Optional, List
 from uuid import UUID
+from .config import WIT_CHARACTERISTIC_UUID_RX, WIT_COMMAND_TIMEOUT
 
 # Constants
 class WitOp:
@@ -15,6 +17,21 @@ class WitOp:
     FIELD_CALIBRATION_0x01 = 0x01
 
 
+# RRATE register values, output rate in Hz -> register code
+WIT_RETURN_RATES = {
+    0.1: 0x01,
+    0.5: 0x02,
+    1: 0x03,
+    2: 0x04,
+    5: 0x05,
+    10: 0x06,
+    20: 0x07,
+    50: 0x08,
+    100: 0x09,
+    200: 0x0B,
+}
+
+
 class WitCalibration:
     MAG_FIELD_CALIBRATION_0x07 = 0x07
     END_0x00 = 0x00
@@ -58,17 +75,67 @@ class SensorData:
         self.mag: Optional[Point3D] = None
 
 
+class WitCommandQueue:
+    """Serializes commands sent to a Wit sensor and matches 0x71 read returns to their requests"""
+
+    def __init__(self, strategy, timeout: float = WIT_COMMAND_TIMEOUT):
+        self.strategy = strategy
+        self.timeout = timeout
+        self.write_lock: Optional[asyncio.Lock] = None
+        self.pending: dict[int, deque] = {}  # register -> futures waiting for its 0x71 return, oldest first
+
+    async def write(self, data: bytes):
+        """Send one command, writes never interleave with each other"""
+        if self.write_lock is None:
+            self.write_lock = asyncio.Lock()
+        async with self.write_lock:
+            await self.strategy.device.client.write_gatt_char(WIT_CHARACTERISTIC_UUID_RX, data)
+
+    async def read(self, register: int, timeout: float = None):
+        """Request a register and wait for its return packet.
+
+        Reads are pipelined: the request is written as soon as the previous write completed,
+        without waiting for earlier reads to be answered.
+        """
+        future = asyncio.get_running_loop().create_future()
+        waiting = self.pending.setdefault(register, deque())
+        waiting.append(future)
+        try:
+            await self.write(bytes([WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.READ_0x27, register, 0x00]))
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        finally:
+            if future in waiting:
+                waiting.remove(future)
+
+    def resolve(self, register: int, value) -> bool:
+        """Hand a decoded return to the oldest read of that register, False if nobody asked for it"""
+        waiting = self.pending.get(register)
+        while waiting:
+            future = waiting.popleft()
+            if not future.done():
+                future.set_result(value)
+                return True
+        return False
+
+    def cancel_all(self):
+        for waiting in self.pending.values():
+            for future in waiting:
+                if not future.done():
+                    future.cancel()
+            waiting.clear()
+
+
 class WitSensorStrategy:
     # Class constants
     SERVICE_UUID = UUID("0000ffe5-0000-1000-8000-00805f9a34fb")
     READ_UUID = UUID("0000ffe4-0000-1000-8000-00805f9a34fb")
     NOTIFIABLE_UUID = UUID("0000ffe4-0000-1000-8000-00805f9a34fb")
     
-    UPDATE_DELAY = 10.0  # seconds
-    
     def __init__(self):
         self.device = None
-        self.timer = None
+        self.commands = WitCommandQueue(self)
+        self.battery_level: Optional[float] = None
+        self.temperature: Optional[float] = None
         self.logger = logging.getLogger("WitSensor")
         
     @staticmethod
@@ -80,44 +147,30 @@ class WitSensorStrategy:
         return res
     
     def initialize(self, device, imu_data_repository=None, ble_repository=None, bt_adapter_name=None):
-        """Initialize the sensor strategy"""
+        """Initialize the sensor strategy, periodic polls are run by the HousekeepingScheduler"""
         self.device = device
         self.logger.info("Initializing WitMotion sensor")
-        
-        # Enable notifications
-        device.enable_notifications(self.NOTIFIABLE_UUID)
-        
-        # Start periodic updates
-        self._schedule_update(0.25)  # Initial delay of 250ms
     
-    def _schedule_update(self, delay: float):
-        """Schedule periodic sensor updates"""
-        if self.timer:
-            self.timer.cancel()
-        
-        self.timer = threading.Timer(delay, self._update_task)
-        self.timer.daemon = True
-        self.timer.start()
-    
-    def _update_task(self):
-        """Periodic update task"""
-        try:
-            self.read_battery_level()
-            self.read_config()
-            self.read_temperature()
-        except Exception as e:
-            self.logger.error(f"Error in update task: {e}")
-        finally:
-            self._schedule_update(self.UPDATE_DELAY)
+    async def housekeeping(self):
+        """Poll battery, config and temperature, the reads are pipelined by the command queue"""
+        results = await asyncio.gather(self.read_battery_level(), self.read_config(), self.read_temperature(), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                self.logger.warning(f"Housekeeping read failed: {r!r}")
+        return results
     
     def process_data(self, characteristic, data: bytes) -> Optional[SensorData]:
         """Process incoming BLE data"""
         if not data or len(data) < 2:
             return None
         
-        if characteristic.uuid != self.NOTIFIABLE_UUID:
+        if UUID(characteristic.uuid) != self.NOTIFIABLE_UUID:
             return None
-        
+
+        return self.process_bytes(data)
+
+    def process_bytes(self, data: bytes) -> Optional[SensorData]:
+        """Split a notification into packets, decode data packets and dispatch read returns"""
         bytes_list = bytearray(data)
         
         # Remove any invalid data before the first packet start
@@ -162,27 +215,35 @@ class WitSensorStrategy:
         value_type = data[2]
         separator = data[3]
         
+        value = None
         if value_type == WitField.BATTERY_0x64:
             # Parse battery level
             value = struct.unpack_from('<I', data, 4)[0]
             eq_percent = self._get_eq_percent(value / 100.0)
+            self.battery_level = eq_percent
             if self.device and hasattr(self.device, 'battery_level'):
                 self.device.battery_level = eq_percent
             self.logger.info(f"Battery level set to: {eq_percent}")
+            value = eq_percent
         
         elif value_type == WitField.TEMPERATURE_0x40:
             value = struct.unpack_from('<I', data, 4)[0]
             temperature = value / 100.0
+            self.temperature = temperature
             self.logger.info(f"Temperature set to: {temperature}")
+            value = temperature
         
         elif value_type == WitField.VERSION_NUMBER_0x2E:
             # Parse version/config data
-            pass
+            value = bytes(data[4:])
         
         else:
             if len(data) >= 8:
                 value = struct.unpack_from('<I', data, 4)[0]
                 self.logger.info(f"Received unknown return data: {value}")
+
+        if not self.commands.resolve(value_type, value):
+            self.logger.debug(f"Unsolicited return for register {value_type:#x}")
     
     def _decode_data_packet(self, data: bytes) -> Optional[SensorData]:
         """Decode a data packet containing sensor readings"""
@@ -227,76 +288,68 @@ class WitSensorStrategy:
     
     def cleanup(self):
         """Clean up resources"""
-        if self.timer:
-            self.timer.cancel()
-            self.timer = None
+        self.commands.cancel_all()
     
     # Command methods
-    def send_protocol_data(self, data: bytes):
+    async def send_protocol_data(self, data: bytes):
         """Send protocol data to the sensor"""
         if self.device:
-            self.device.write_characteristic(self.READ_UUID, data)
+            await self.commands.write(data)
     
-    def unlock_reg(self):
+    async def unlock_reg(self):
         """Unlock register for configuration"""
-        self.send_protocol_data(bytes([
+        await self.send_protocol_data(bytes([
             WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.UNLOCK_REG_0x69, 0x88, 0xB5
         ]))
     
-    def applied_calibration(self):
+    async def applied_calibration(self):
         """Apply calibration"""
-        self.send_protocol_data(bytes([
+        await self.send_protocol_data(bytes([
             WitOp.READ_0xFF, WitOp.READ_0xAA, 
             WitOp.FIELD_CALIBRATION_0x01, WitCalibration.ACCEL_CALIBRATION_0x01, 0x00
         ]))
     
-    def start_field_calibration(self):
+    async def start_field_calibration(self):
         """Start magnetic field calibration"""
-        self.send_protocol_data(bytes([
+        await self.send_protocol_data(bytes([
             WitOp.READ_0xFF, WitOp.READ_0xAA,
             WitOp.FIELD_CALIBRATION_0x01, WitCalibration.MAG_FIELD_CALIBRATION_0x07, 0x00
         ]))
     
-    def end_field_calibration(self):
+    async def end_field_calibration(self):
         """End magnetic field calibration"""
-        self.send_protocol_data(bytes([
+        await self.send_protocol_data(bytes([
             WitOp.READ_0xFF, WitOp.READ_0xAA,
             WitOp.FIELD_CALIBRATION_0x01, WitCalibration.END_0x00, 0x00
         ]))
     
-    def set_return_rate(self, rate: int):
+    async def set_return_rate(self, rate: int):
         """Set the sensor return rate"""
-        self.send_protocol_data(bytes([
+        await self.send_protocol_data(bytes([
             WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.SET_RETURN_RATE_0x03, rate, 0x00
         ]))
     
-    def read_config(self):
-        """Read sensor configuration"""
-        self.send_protocol_data(bytes([
-            WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.READ_0x27, 
-            WitField.VERSION_NUMBER_0x2E, 0x00
-        ]))
+    @staticmethod
+    def return_rate_code(rate_hz: float) -> int:
+        """Closest supported RRATE code for an output rate in Hz"""
+        closest = min(WIT_RETURN_RATES.keys(), key=lambda r: abs(r - rate_hz))
+        return WIT_RETURN_RATES[closest]
+
+    async def read_config(self, timeout: float = None) -> bytes:
+        """Read sensor configuration, returns the decoded value of the matching 0x71 packet"""
+        return await self.commands.read(WitField.VERSION_NUMBER_0x2E, timeout)
     
-    def read_battery_level(self):
-        """Read battery level"""
-        self.send_protocol_data(bytes([
-            WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.READ_0x27, 
-            WitField.BATTERY_0x64, 0x00
-        ]))
+    async def read_battery_level(self, timeout: float = None) -> float:
+        """Read battery level, returns the decoded value of the matching 0x71 packet"""
+        return await self.commands.read(WitField.BATTERY_0x64, timeout)
     
-    def read_temperature(self):
-        """Read temperature"""
-        self.send_protocol_data(bytes([
-            WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.READ_0x27, 
-            WitField.TEMPERATURE_0x40, 0x00
-        ]))
+    async def read_temperature(self, timeout: float = None) -> float:
+        """Read temperature, returns the decoded value of the matching 0x71 packet"""
+        return await self.commands.read(WitField.TEMPERATURE_0x40, timeout)
     
-    def read_mag_type(self):
-        """Read magnetometer type"""
-        self.send_protocol_data(bytes([
-            WitOp.READ_0xFF, WitOp.READ_0xAA, WitOp.READ_0x27, 
-            WitField.MAGNETOMETER, 0x00
-        ]))
+    async def read_mag_type(self, timeout: float = None) -> int:
+        """Read magnetometer type, returns the decoded value of the matching 0x71 packet"""
+        return await self.commands.read(WitField.MAGNETOMETER, timeout)
     
     @staticmethod
     def _get_eq_percent(eq: float) -> float:
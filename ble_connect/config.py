@@ -1,6 +1,50 @@
 import asyncio
 
-FREQUENCY = 10 # Hz
+FREQUENCY = 10 # Hz, default output rate, can be changed per device at runtime
+SAMPLE_RATES = [1, 5, 10, 20, 50, 100]  # Hz, choices offered in the IMU widget
+RATE_TOLERANCE = 0.2  # relative difference between requested and measured rate flagged in the UI
+REQUEST_MTU = True
+ORIENTATION_ENABLED = True  # Per-device sensor fusion of the live accel/gyro stream
+ORIENTATION_MAX_DT = 0.5  # seconds, longer gaps between samples are clamped before being fed to the filter
+ORIENTATION_PLOT_EVERY = 5  # samples between two refreshes of the orientation plot
+DEFAULT_FUSION_FILTER = "madgwick"  # One of quaternion.FUSION_FILTERS: "madgwick", "mahony" or "complementary"
+ROLLING_STATS_WINDOW = 5.0  # seconds covered by the mean/RMS/min/max/std columns of the plot data tables
+PERIODICITY_WINDOW = 128  # samples in the sliding DFT window used to estimate the repetition period of an exercise
+SPECTROGRAM_ENABLED = True  # Gyroscope spectrogram panel in the IMU widget
+SPECTROGRAM_FFT = 64  # samples per STFT frame
+SPECTROGRAM_HOP = 8  # samples between two spectrogram columns
+SPECTROGRAM_COLUMNS = 200  # columns kept in the spectrogram ring
+SPECTROGRAM_DB_RANGE = (0.0, 60.0)  # dB mapped to the ends of the colormap
+PROTOTYPE_LIBRARY = "data/*/*_proto_*.csv"  # exported prototypes loaded into the DTW matcher at startup
+PROTOTYPE_MATCH_LENGTH = 32  # samples every prototype and repetition is resampled to before matching
+PROTOTYPE_MATCH_BAND = 3  # Sakoe-Chiba band half width of the DTW, in resampled samples
+EXERSENSE_BATCH_SIZE = 4  # samples handed to the online tracker per receive_data call
+EXERSENSE_MAX_BATCH_DELAY = 0.25  # seconds, a partial batch older than this is flushed anyway
+SEQUENCE_TRACKING = True  # Detect lost and duplicate samples from the leading counter of Exer payloads
+SEQUENCE_MODULUS = 65536  # the leading sample counter of Exer payloads wraps around at this value
+SEQUENCE_MAX_GAP = 1000  # counter jumps above this are taken as a device reset, not as lost samples
+SEQUENCE_MAX_NAN_FILL = 100  # at most this many NaN rows are inserted in the plots for one gap
+CLOCK_MODEL_WINDOW = 3000  # samples in the host/device clock regression, a longer window resolves smaller drifts
+SYNC_ENABLED = True  # Resample all the connected devices onto one clock in the Synchronized Devices window
+SYNC_RATE = 50.0  # Hz of the common clock
+SYNC_MAX_DELAY = 0.5  # seconds a lagging device may hold the synchronized output back
+SYNC_MAX_GAP = 0.5  # seconds, longer gaps in a device stream are left as NaN instead of interpolated
+SYNC_VIEW_SECONDS = 20.0  # seconds shown in the synchronized plot
+SYNC_UPDATE_INTERVAL = 0.1  # seconds between two pulls of the synchronizer from the render loop
+FRAME_MIN_FPS = 4.0  # the render loop refreshes at least this often when no data or input arrives
+FRAME_MAX_FPS = 60.0  # cap of the render loop, reached while streaming fast or interacting with the UI
+FRAME_INPUT_HOLD = 1.0  # seconds the loop keeps running at FRAME_MAX_FPS after mouse or keyboard input
+FRAME_STATS_WINDOW = 120  # frames in the frame time statistics
+DEVICE_TABLE_ROWS = 25  # rows created for the devices list, scrolling rewrites them with the visible devices
+DEVICE_TABLE_UPDATE_INTERVAL = 0.25  # seconds between two redraws of the devices list
+OUTPUT_LOG_MAX_EVENTS = 1000  # exersense outputs kept per device, older ones are dropped from the log and its export
+OUTPUT_LOG_MAX_LINES = 5000  # wrapped lines kept for display
+OUTPUT_LOG_VISIBLE_LINES = 20  # text rows created for the log, scrolling rewrites them
+OUTPUT_LOG_WRAP = 72  # characters per log line
+SIGNAL_FILTER_ENABLED = True  # Plots, spectrogram, period estimate and exersense get the filtered samples, stored, exported and fused samples stay raw; can be toggled per device in the IMU widget
+SIGNAL_FILTER_STAGES = [  # Biquads applied in order to all six axes, type is "lowpass", "highpass" or "notch", cutoff in Hz
+    {"type": "lowpass", "cutoff": 3.0, "q": 0.7071},
+]
 
 EXER_BLE_SERVICE_UUID = "EC4D35AE-96DC-4385-81B2-64A17E67B13D".upper()
 EXER_CHARACTERISTIC_UUID_RX: str = "6e400002-b5a3-f393-e0a9-e50e24dcca9e".upper()  # Writable
@@ -9,6 +53,12 @@ EXER_CHARACTERISTIC_UUID_TX: str = "6e400003-b5a3-f393-e0a9-e50e24dcca9e".upper(
 WIT_BLE_SERVICE_UUID = "0000ffe5-0000-1000-8000-00805f9a34fb".upper()
 WIT_CHARACTERISTIC_UUID_RX: str = "0000ffe9-0000-1000-8000-00805f9a34fb".upper()  # Writable
 WIT_CHARACTERISTIC_UUID_TX: str = "0000ffe4-0000-1000-8000-00805f9a34fb".upper()  # Notifiable
+WIT_COMMAND_TIMEOUT = 1.0  # seconds to wait for the 0x71 return of a register read
+
+HOUSEKEEPING_INTERVALS = {"wit": 10.0}  # seconds between housekeeping polls per strategy type, types not listed are never polled
+HOUSEKEEPING_JITTER = 0.2  # +/- fraction of the interval added to every poll so devices drift apart
+HOUSEKEEPING_BUSY_RATE = 50.0  # Hz, polls are skipped while a device streams faster than this...
+HOUSEKEEPING_MAX_SKIPS = 5  # ...but never more than this many times in a row
 
 WATCH_SERVICE_UUID: str = "A12FAB51-359D-4ADF-B276-D2AD84B20134"
 WATCH_CHARACTERISTIC_UUID_RX: str = "6E400010-B5A3-F393-E0A9-E50E24DCCA9E"
@@ -25,7 +75,26 @@ FILTERED_DEVICES = []
 # FILTERED_DEVICES.append("ExerWatchccec")
 
 FILTERED_DEVICES = [x.upper() for x in FILTERED_DEVICES]
+KNOWN_DEVICES_FILE = "known_devices.json"  # Sensors connected in previous sessions, reconnected straight away at startup
+CONNECT_KNOWN_DEVICES = True
 AUTO_CONNECT = True
+
+# Connectionless capture: decode low-rate IMU samples from advertisements instead of connecting to the sensors
+ADV_CAPTURE_MODE = False
+EXER_ADV_MANUFACTURER_ID = 0xFFFF  # Payload may come in the Exer service data or under this manufacturer id
+EXER_ADV_PAYLOAD_FORMAT = "<H6h"  # seq, acc_x, acc_y, acc_z (mg), gyr_x, gyr_y, gyr_z (0.1 deg/s)
+EXER_ADV_ACC_SCALE = 1.0 / 1000.0
+EXER_ADV_GYR_SCALE = 1.0 / 10.0
+AUTO_RECONNECT = True
+RECONNECT_BACKOFF = 0.5  # seconds, doubled after every failed attempt
+RECONNECT_MAX_BACKOFF = 10.0  # seconds
+
+SCAN_FILTER_SERVICES = True  # Only report advertisers exposing the Exer/Wit services
+RSSI_UPDATE_INTERVAL = 1.0  # seconds between two RSSI refreshes of an already classified device
+SCAN_ACTIVE_WINDOW = 5.0  # seconds of continuous active scanning while some targets are not connected
+SCAN_PASSIVE_WINDOW = 2.0  # seconds of passive scanning once every target is connected...
+SCAN_IDLE_INTERVAL = 8.0  # ...followed by this many seconds with the radio idle
+
 BG_LOOP = asyncio.new_event_loop()
 
 
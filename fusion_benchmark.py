@@ -0,0 +1,159 @@
+"""
+Fusion benchmark
+----------------
+
+Checks that the optimized fusion filters in quaternion.py give the same
+orientation as the reference Madgwick implementation, with the reference
+gyroscope frame (legacyFrame=True), and measures the cost of a single
+update.
+
+Then compares all the FUSION_FILTERS: cost per sample and tilt error,
+against the accelerometer on the quasi-static samples of the recorded
+sessions (after removing their gyroscope bias) and against the ground
+truth of a simulated session.
+
+Usage: python fusion_benchmark.py [IMU csv export ...]
+
+"""
+import sys
+import glob
+import time
+import numpy as np
+import pandas as pd
+from quaternion import Madgwick, FastMadgwick, FUSION_FILTERS, makeFusionFilter, fuseBatch, fuseBatchMulti
+
+TOLERANCE = 1e-9
+DT = 0.1
+STATIC_ACC_TOLERANCE = 0.05  # g, |acc| must be this close to 1g...
+STATIC_GYR_STD = 2.0  # deg/s, ...and the gyroscope std of every axis around the sample below this for it to count as quasi-static
+STATIC_WINDOW = 10  # samples, centered window of the stillness test
+
+
+def load_sessions(paths):
+    sessions = {}
+    for path in paths:
+        df = pd.read_csv(path)
+        sessions[path] = (df[["accel_x", "accel_y", "accel_z"]].to_numpy(), df[["gyr_x", "gyr_y", "gyr_z"]].to_numpy())
+    if len(sessions) == 0:
+        rng = np.random.default_rng(0)
+        sessions["random"] = (rng.normal(0, 1, (1000, 3)) + [0, 0, 1], rng.normal(0, 50, (1000, 3)))
+    return sessions
+
+
+def run_filter(fusion, acc, gyr, mag=None):
+    # Plain python floats, as they come out of the BLE decoders
+    samples = np.hstack([acc, gyr] if mag is None else [acc, gyr, mag]).tolist()
+    update = fusion.updateRollAndPitch if mag is None else fusion.updateRollPitchYaw
+    out = []
+    elapsed = 0
+    for sample in samples:
+        start = time.perf_counter()
+        update(*sample, DT)
+        elapsed += time.perf_counter() - start
+        out.append(fusion.q)
+    return np.array(out), elapsed / len(samples)
+
+
+def check_equivalence(name, acc, gyr, mag=None):
+    # The reference multiplies the gyroscope in the wrong order, only the legacy frame can match it
+    reference, fast = Madgwick(), FastMadgwick(legacyFrame=True)
+    ref, ref_cost = run_filter(reference, acc, gyr, mag)
+    fast_q, fast_cost = run_filter(fast, acc, gyr, mag)
+    error = np.max(np.abs(ref - fast_q))
+    euler_error = np.max(np.abs(np.array([reference.roll, reference.pitch, reference.yaw]) - [fast.roll, fast.pitch, fast.yaw]))
+    if euler_error > TOLERANCE:
+        raise AssertionError(f"FastMadgwick euler angles diverged from Madgwick on {name}: {euler_error}")
+    label = "MARG" if mag is not None else "IMU"
+    print(f"{name} [{label}]: max |dq| = {error:.2e}, Madgwick {ref_cost*1e6:.1f} us/sample, FastMadgwick {fast_cost*1e6:.1f} us/sample ({ref_cost/fast_cost:.1f}x)")
+    if error > TOLERANCE:
+        raise AssertionError(f"FastMadgwick diverged from Madgwick on {name}: {error}")
+
+
+def check_batch(name, acc, gyr, sessions=16):
+    reference, _ = run_filter(FastMadgwick(), acc, gyr)
+    start = time.perf_counter()
+    quaternions, _ = fuseBatch(acc, gyr, DT)
+    batch_cost = (time.perf_counter() - start) / len(acc)
+    start = time.perf_counter()
+    multi, _ = fuseBatchMulti(np.repeat(acc[np.newaxis], sessions, axis=0), np.repeat(gyr[np.newaxis], sessions, axis=0), DT)
+    multi_cost = (time.perf_counter() - start) / (len(acc) * sessions)
+    error = max(np.max(np.abs(reference - quaternions)), np.max(np.abs(reference - multi)))
+    print(f"{name} [batch]: max |dq| = {error:.2e}, fuseBatch {batch_cost*1e6:.1f} us/sample, fuseBatchMulti x{sessions} {multi_cost*1e6:.1f} us/sample")
+    if error > TOLERANCE:
+        raise AssertionError(f"Batch fusion diverged on {name}: {error}")
+
+
+def gravity(quaternions):
+    """Gravity direction in the sensor frame for an (N, 4) array of quaternions"""
+    q0, q1, q2, q3 = quaternions.T
+    return np.stack([2*(q1*q3 - q0*q2), 2*(q0*q1 + q2*q3), q0*q0 - q1*q1 - q2*q2 + q3*q3], axis=1)
+
+
+def tilt_error(quaternions, acc):
+    """Angle in degrees between the estimated and the measured gravity direction"""
+    measured = acc / np.linalg.norm(acc, axis=1, keepdims=True)
+    return np.degrees(np.arccos(np.clip(np.sum(gravity(quaternions) * measured, axis=1), -1.0, 1.0)))
+
+
+def simulated_session(n=3000, dt=0.01):
+    """Smooth random rotation, the gravity in the sensor frame is the exact accelerometer reading"""
+    t = np.arange(n) * dt
+    gyr = np.stack([60*np.sin(t), 40*np.cos(1.3*t), 30*np.sin(0.7*t)], axis=1)
+    truth = np.empty((n, 4))
+    q = np.array([1.0, 0.0, 0.0, 0.0])
+    for i in range(n):
+        w = np.radians(gyr[i])
+        q = q + 0.5*dt*np.array([-q[1]*w[0] - q[2]*w[1] - q[3]*w[2], q[0]*w[0] + q[2]*w[2] - q[3]*w[1], q[0]*w[1] - q[1]*w[2] + q[3]*w[0], q[0]*w[2] + q[1]*w[1] - q[2]*w[0]])
+        q = q / np.linalg.norm(q)
+        truth[i] = q
+    return gravity(truth), gyr, dt
+
+
+def quasi_static(acc, gyr, window=STATIC_WINDOW):
+    """
+    Samples where the sensor is still. The gyroscope bias of the sensors is
+    tens of deg/s, so stillness is detected from the gyroscope variance
+    rather than from its magnitude
+    """
+    gyr_std = pd.DataFrame(gyr).rolling(window, center=True, min_periods=window // 2).std().max(axis=1).to_numpy()
+    return (np.abs(np.linalg.norm(acc, axis=1) - 1.0) < STATIC_ACC_TOLERANCE) & (gyr_std < STATIC_GYR_STD)
+
+
+def remove_gyro_bias(gyr, static):
+    """Subtracts the median gyroscope reading of the quasi-static samples, the per session bias"""
+    if not np.any(static):
+        return gyr, np.zeros(3)
+    bias = np.median(gyr[static], axis=0)
+    return gyr - bias, bias
+
+
+def compare_filters(name, acc, gyr, dt, static=None):
+    for filter_name in FUSION_FILTERS:
+        start = time.perf_counter()
+        quaternions, _ = fuseBatch(acc, gyr, dt, fusion=makeFusionFilter(filter_name))
+        cost = (time.perf_counter() - start) / len(acc)
+        if static is not None and not np.any(static):
+            # While moving the accelerometer is not a gravity reference, there is no tilt error to report
+            print(f"{name} [{filter_name}]: {cost*1e6:.1f} us/sample, no quasi-static samples, tilt error not measured")
+            continue
+        errors = tilt_error(quaternions, acc)
+        if static is not None:
+            errors = errors[static]
+        print(f"{name} [{filter_name}]: {cost*1e6:.1f} us/sample, tilt error mean {np.mean(errors):.2f} deg, max {np.max(errors):.2f} deg over {len(errors)} samples")
+
+
+def main(paths):
+    rng = np.random.default_rng(1)
+    for name, (acc, gyr) in load_sessions(paths).items():
+        check_equivalence(name, acc, gyr)
+        check_equivalence(name, acc, gyr, mag=rng.normal(0, 1, acc.shape) + [0.3, 0, -0.5])
+        check_batch(name, acc, gyr)
+        static = quasi_static(acc, gyr)
+        unbiased, bias = remove_gyro_bias(gyr, static)
+        print(f"{name}: {np.count_nonzero(static)} quasi-static samples, gyroscope bias [{bias[0]:.2f}, {bias[1]:.2f}, {bias[2]:.2f}] deg/s removed")
+        compare_filters(name, acc, unbiased, DT, static)
+    compare_filters("simulated", *simulated_session())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] if len(sys.argv) > 1 else glob.glob("data/*/*_IMU_*.csv"))
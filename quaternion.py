@@ -1,5 +1,11 @@
+import math
+from math import sqrt
+from abc import ABC, abstractmethod
 import numpy as np
 
+DEG_TO_RAD = math.pi/180.0
+HALF_DEG_TO_RAD = 0.5*DEG_TO_RAD
+
 
 class Madgwick:
     """
@@ -11,18 +17,24 @@ class Madgwick:
     refer to examples of the git repo
 
     """
-    def __init__(self, b = 0.1):
+    def __init__(self, b = None):
         """
         Initialises all the variables.
 
         The option of setting your own values is given in the form of
         set functions
 
+        Parameter
+        ---------
+        b: optional filter gain beta, derived from the gyroscope
+            measurement error (40 deg/s) when not given
+
         """
 
         GyroMeasError = np.pi * (40.0 / 180.0)
         self.beta = np.sqrt(3.0 / 4.0) * GyroMeasError
-        # self.beta = b
+        if b is not None:
+            self.beta = b
         self.q = np.array([1.0, 0.0, 0.0, 0.0])
         self.roll = 0
         self.pitch = 0
@@ -275,3 +287,650 @@ class Madgwick:
             self._q = q
         else:
             raise Exception("q has to be a numpy array of 4 elements")
+
+
+class FusionFilter(ABC):
+    """
+    Common interface of the orientation filters
+
+    Every filter keeps its quaternion as four python floats, takes the
+    gyroscope in degrees/s and computes euler angles only when roll,
+    pitch or yaw are read.
+
+    """
+    def __init__(self):
+        self._q0, self._q1, self._q2, self._q3 = 1.0, 0.0, 0.0, 0.0
+        self._roll = 0
+        self._pitch = 0
+        self._yaw = 0
+        self._euler_dirty = False
+
+    @abstractmethod
+    def updateRollAndPitch(self, ax, ay, az, gx, gy, gz, dt):
+        """Fuses one accelerometer and gyroscope sample, gyroscope in degrees/s"""
+
+    @abstractmethod
+    def updateRollPitchYaw(self, ax, ay, az, gx, gy, gz, mx, my, mz, dt):
+        """Fuses one accelerometer, gyroscope and magnetometer sample"""
+
+    def computeOrientation(self, q):
+        """
+        Computes euler angles from quaternion
+
+        Parameter
+        ---------
+        q: sequence containing quaternion vals
+
+        """
+        q0, q1, q2, q3 = q
+        self._yaw = math.degrees(math.atan2(2*q1*q2 + 2*q0*q3, q0*q0 + q1*q1 - q2*q2 - q3*q3))
+        self._pitch = math.degrees(-1*math.asin(max(-1.0, min(1.0, 2*(q1*q3 - q0*q2)))))
+        self._roll = math.degrees(math.atan2(2*q0*q1 + 2*q2*q3, q0*q0 + q3*q3 - q1*q1 - q2*q2))
+        self._euler_dirty = False
+
+    def _euler(self):
+        if self._euler_dirty:
+            self.computeOrientation((self._q0, self._q1, self._q2, self._q3))
+
+    @property
+    def roll(self):
+        self._euler()
+        return self._roll
+
+    @roll.setter
+    def roll(self, roll):
+        self._roll = roll
+
+    @property
+    def pitch(self):
+        self._euler()
+        return self._pitch
+
+    @pitch.setter
+    def pitch(self, pitch):
+        self._pitch = pitch
+
+    @property
+    def yaw(self):
+        self._euler()
+        return self._yaw
+
+    @yaw.setter
+    def yaw(self, yaw):
+        self._yaw = yaw
+
+    @property
+    def quaternion(self):
+        """Current quaternion as a (w, x, y, z) tuple of floats, without allocating an array"""
+        return self._q0, self._q1, self._q2, self._q3
+
+    @property
+    def q(self):
+        return np.array([self._q0, self._q1, self._q2, self._q3])
+
+    @q.setter
+    def q(self, q):
+        if q is not None and q.shape[0] == 4:
+            self._q0, self._q1, self._q2, self._q3 = (float(v) for v in q)
+            self._euler_dirty = True
+        else:
+            raise Exception("q has to be a numpy array of 4 elements")
+
+
+class FastMadgwick(FusionFilter, Madgwick):
+    """
+    Drop-in replacement of Madgwick for per-sample fusion
+
+    The quaternion is kept as four python floats and every update is
+    written out in scalar form, so no numpy array is allocated per
+    sample. Euler angles are only computed when roll, pitch or yaw
+    are read.
+
+    The gyroscope is integrated as qDot = 0.5 * q x w, with w in the
+    sensor frame. Madgwick.quaternionMul(q, g) computes g x q instead,
+    which rotates the gyroscope in the wrong frame as soon as the sensor
+    is tilted. legacyFrame=True reproduces that order, the results then
+    match Madgwick up to floating point rounding.
+
+    """
+    def __init__(self, b = None, legacyFrame = False):
+        FusionFilter.__init__(self)
+        Madgwick.__init__(self, b)
+        self.legacyFrame = legacyFrame
+
+    def updateRollAndPitch(self, ax, ay, az, gx, gy, gz, dt):
+        """
+        Computes roll and pitch, same parameters as Madgwick.updateRollAndPitch
+
+        """
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        aNorm = 1.0/sqrt(ax*ax + ay*ay + az*az)
+        ax = ax*aNorm
+        ay = ay*aNorm
+        az = az*aNorm
+
+        _2q0 = 2.0*q0
+        _2q1 = 2.0*q1
+        _2q2 = 2.0*q2
+        _2q3 = 2.0*q3
+        f0 = 2.0*(q1*q3 - q0*q2) - ax
+        f1 = 2.0*(q0*q1 + q2*q3) - ay
+        f2 = 2.0*(0.5 - q1*q1 - q2*q2) - az
+
+        s0 = -_2q2*f0 + _2q1*f1
+        s1 = _2q3*f0 + _2q0*f1 - 4.0*q1*f2
+        s2 = -_2q0*f0 + _2q3*f1 - 4.0*q2*f2
+        s3 = _2q1*f0 + _2q2*f1
+        sLength = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+        # A zero gradient (accelerometer exactly matching the estimate) makes Madgwick return NaN, skip the correction instead
+        step = self._beta/sLength if sLength > 0 else 0.0
+
+        # Half angular rate in rad/s, the 0.5 of qDot = 0.5 * q x w is folded in
+        gx = gx*HALF_DEG_TO_RAD
+        gy = gy*HALF_DEG_TO_RAD
+        gz = gz*HALF_DEG_TO_RAD
+        if self.legacyFrame:
+            n0 = q0 + (-q1*gx - q2*gy - q3*gz - step*s0)*dt
+            n1 = q1 + (q0*gx + q3*gy - q2*gz - step*s1)*dt
+            n2 = q2 + (-q3*gx + q0*gy + q1*gz - step*s2)*dt
+            n3 = q3 + (q2*gx - q1*gy + q0*gz - step*s3)*dt
+        else:
+            n0 = q0 + (-q1*gx - q2*gy - q3*gz - step*s0)*dt
+            n1 = q1 + (q0*gx + q2*gz - q3*gy - step*s1)*dt
+            n2 = q2 + (q0*gy - q1*gz + q3*gx - step*s2)*dt
+            n3 = q3 + (q0*gz + q1*gy - q2*gx - step*s3)*dt
+        qNorm = 1.0/sqrt(n0*n0 + n1*n1 + n2*n2 + n3*n3)
+        self._q0 = n0*qNorm
+        self._q1 = n1*qNorm
+        self._q2 = n2*qNorm
+        self._q3 = n3*qNorm
+        self._euler_dirty = True
+
+    def updateRollPitchYaw(self, ax, ay, az, gx, gy, gz, mx, my, mz, dt):
+        """
+        Computes roll, pitch and yaw, same parameters as Madgwick.updateRollPitchYaw
+
+        """
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        aNorm = 1.0/sqrt(ax*ax + ay*ay + az*az)
+        ax = ax*aNorm
+        ay = ay*aNorm
+        az = az*aNorm
+
+        mNorm = 1.0/sqrt(mx*mx + my*my + mz*mz)
+        mx = mx*mNorm
+        my = my*mNorm
+        mz = mz*mNorm
+
+        # Earth magnetic field direction in the sensor frame
+        hx = (2*q0*q0 -1 + 2*q1*q1)*mx + 2*(q1*q2 - q0*q3)*my + 2*(q1*q3 + q0*q2)*mz
+        hy = 2*(q1*q2 + q0*q3)*mx + (2*q0*q0 -1 + 2*q2*q2)*my + 2*(q2*q3 - q0*q1)*mz
+        hz = 2*(q1*q3 - q0*q2)*mx + 2*(q2*q3 + q0*q1)*my + (2*q0*q0 -1 +2*q3*q3)*mz
+        bx = sqrt(hx*hx + hy*hy)
+        bz = hz
+
+        f0 = 2.0*(q1*q3 - q0*q2) - ax
+        f1 = 2.0*(q0*q1 + q2*q3) - ay
+        f2 = 2.0*(0.5 - q1*q1 - q2*q2) - az
+        f3 = 2*bx*(0.5 - q2*q2 - q3*q3) +2*bz*(q1*q3 - q0*q2) - mx
+        f4 = 2*bx*(q1*q2 - q0*q3) +2*bz*(q0*q1 + q2*q3) - my
+        f5 = 2*bx*(q0*q2 + q1*q3) +2*bz*(0.5 - q1*q1 -q2*q2) - mz
+
+        s0 = -2.0*q2*f0 + 2.0*q1*f1 - 2*bz*q2*f3 + (-2*bx*q3 + 2*bz*q1)*f4 + 2*bx*q2*f5
+        s1 = 2.0*q3*f0 + 2.0*q0*f1 - 4.0*q1*f2 + 2*bz*q3*f3 + (2*bx*q2 + 2*bz*q0)*f4 + (2*bx*q3 - 4*bz*q1)*f5
+        s2 = -2.0*q0*f0 + 2.0*q3*f1 - 4.0*q2*f2 + (-4*bx*q2 - 2*bz*q0)*f3 + (2*bx*q1 + 2*bz*q3)*f4 + (2*bx*q0 - 4*bz*q2)*f5
+        s3 = 2.0*q1*f0 + 2.0*q2*f1 + (-4*bx*q3 + 2*bz*q1)*f3 + (-2*bx*q0 + 2*bz*q2)*f4 + 2*bx*q1*f5
+        sLength = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+        # A zero gradient (accelerometer exactly matching the estimate) makes Madgwick return NaN, skip the correction instead
+        step = self._beta/sLength if sLength > 0 else 0.0
+
+        # Half angular rate in rad/s, the 0.5 of qDot = 0.5 * q x w is folded in
+        gx = gx*HALF_DEG_TO_RAD
+        gy = gy*HALF_DEG_TO_RAD
+        gz = gz*HALF_DEG_TO_RAD
+        if self.legacyFrame:
+            n0 = q0 + (-q1*gx - q2*gy - q3*gz - step*s0)*dt
+            n1 = q1 + (q0*gx + q3*gy - q2*gz - step*s1)*dt
+            n2 = q2 + (-q3*gx + q0*gy + q1*gz - step*s2)*dt
+            n3 = q3 + (q2*gx - q1*gy + q0*gz - step*s3)*dt
+        else:
+            n0 = q0 + (-q1*gx - q2*gy - q3*gz - step*s0)*dt
+            n1 = q1 + (q0*gx + q2*gz - q3*gy - step*s1)*dt
+            n2 = q2 + (q0*gy - q1*gz + q3*gx - step*s2)*dt
+            n3 = q3 + (q0*gz + q1*gy - q2*gx - step*s3)*dt
+        qNorm = 1.0/sqrt(n0*n0 + n1*n1 + n2*n2 + n3*n3)
+        self._q0 = n0*qNorm
+        self._q1 = n1*qNorm
+        self._q2 = n2*qNorm
+        self._q3 = n3*qNorm
+        self._euler_dirty = True
+
+    @property
+    def beta(self):
+        return self._beta
+
+    @beta.setter
+    def beta(self, beta):
+        # Plain float, a numpy scalar here would turn every scalar operation into a numpy one
+        if beta >= 0 and beta <= 1:
+            self._beta = float(beta)
+        else:
+            raise Exception("Please put beta value between 0 and 1")
+
+
+class Mahony(FusionFilter):
+    """
+    Mahony filter for sensor fusion of IMU
+
+    Cheaper than Madgwick: the error between measured and estimated
+    gravity (and magnetic field) directions is fed back to the gyroscope
+    through a proportional-integral controller.
+    reference article : https://hal.science/hal-00488376/document
+
+    """
+    def __init__(self, kp = 1.0, ki = 0.0):
+        """
+        Parameters
+        ----------
+        kp: float
+            proportional gain
+        ki: float
+            integral gain, 0 disables gyroscope bias estimation
+
+        """
+        FusionFilter.__init__(self)
+        self.kp = float(kp)
+        self.ki = float(ki)
+        self._ix = 0.0
+        self._iy = 0.0
+        self._iz = 0.0
+
+    def _feedback(self, ex, ey, ez, gx, gy, gz, dt):
+        """
+        Applies the PI correction to the angular velocity (rad/s) and integrates it
+
+        """
+        if self.ki > 0:
+            self._ix += self.ki*ex*dt
+            self._iy += self.ki*ey*dt
+            self._iz += self.ki*ez*dt
+            gx += self._ix
+            gy += self._iy
+            gz += self._iz
+        gx = 0.5*(gx + self.kp*ex)
+        gy = 0.5*(gy + self.kp*ey)
+        gz = 0.5*(gz + self.kp*ez)
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        n0 = q0 + (-q1*gx - q2*gy - q3*gz)*dt
+        n1 = q1 + (q0*gx + q2*gz - q3*gy)*dt
+        n2 = q2 + (q0*gy - q1*gz + q3*gx)*dt
+        n3 = q3 + (q0*gz + q1*gy - q2*gx)*dt
+        qNorm = 1.0/sqrt(n0*n0 + n1*n1 + n2*n2 + n3*n3)
+        self._q0 = n0*qNorm
+        self._q1 = n1*qNorm
+        self._q2 = n2*qNorm
+        self._q3 = n3*qNorm
+        self._euler_dirty = True
+
+    def updateRollAndPitch(self, ax, ay, az, gx, gy, gz, dt):
+        """
+        Computes roll and pitch, same parameters as Madgwick.updateRollAndPitch
+
+        """
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        aNorm = 1.0/sqrt(ax*ax + ay*ay + az*az)
+        ax = ax*aNorm
+        ay = ay*aNorm
+        az = az*aNorm
+
+        # Estimated direction of gravity
+        vx = 2.0*(q1*q3 - q0*q2)
+        vy = 2.0*(q0*q1 + q2*q3)
+        vz = q0*q0 - q1*q1 - q2*q2 + q3*q3
+
+        ex = ay*vz - az*vy
+        ey = az*vx - ax*vz
+        ez = ax*vy - ay*vx
+        self._feedback(ex, ey, ez, gx*DEG_TO_RAD, gy*DEG_TO_RAD, gz*DEG_TO_RAD, dt)
+
+    def updateRollPitchYaw(self, ax, ay, az, gx, gy, gz, mx, my, mz, dt):
+        """
+        Computes roll, pitch and yaw, same parameters as Madgwick.updateRollPitchYaw
+
+        """
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        aNorm = 1.0/sqrt(ax*ax + ay*ay + az*az)
+        ax = ax*aNorm
+        ay = ay*aNorm
+        az = az*aNorm
+        mNorm = 1.0/sqrt(mx*mx + my*my + mz*mz)
+        mx = mx*mNorm
+        my = my*mNorm
+        mz = mz*mNorm
+
+        # Reference direction of the earth magnetic field
+        hx = 2.0*(mx*(0.5 - q2*q2 - q3*q3) + my*(q1*q2 - q0*q3) + mz*(q1*q3 + q0*q2))
+        hy = 2.0*(mx*(q1*q2 + q0*q3) + my*(0.5 - q1*q1 - q3*q3) + mz*(q2*q3 - q0*q1))
+        bx = sqrt(hx*hx + hy*hy)
+        bz = 2.0*(mx*(q1*q3 - q0*q2) + my*(q2*q3 + q0*q1) + mz*(0.5 - q1*q1 - q2*q2))
+
+        # Estimated direction of gravity and magnetic field
+        vx = 2.0*(q1*q3 - q0*q2)
+        vy = 2.0*(q0*q1 + q2*q3)
+        vz = q0*q0 - q1*q1 - q2*q2 + q3*q3
+        wx = 2.0*(bx*(0.5 - q2*q2 - q3*q3) + bz*(q1*q3 - q0*q2))
+        wy = 2.0*(bx*(q1*q2 - q0*q3) + bz*(q0*q1 + q2*q3))
+        wz = 2.0*(bx*(q0*q2 + q1*q3) + bz*(0.5 - q1*q1 - q2*q2))
+
+        ex = (ay*vz - az*vy) + (my*wz - mz*wy)
+        ey = (az*vx - ax*vz) + (mz*wx - mx*wz)
+        ez = (ax*vy - ay*vx) + (mx*wy - my*wx)
+        self._feedback(ex, ey, ez, gx*DEG_TO_RAD, gy*DEG_TO_RAD, gz*DEG_TO_RAD, dt)
+
+
+class Complementary(FusionFilter):
+    """
+    Complementary filter for sensor fusion of IMU
+
+    The cheapest option: roll, pitch and yaw are integrated from the
+    gyroscope and pulled towards the accelerometer tilt (and the
+    tilt compensated magnetometer heading) with a fixed weight.
+
+    """
+    def __init__(self, alpha = 0.98):
+        """
+        Parameter
+        ---------
+        alpha: float
+            weight of the gyroscope integration, 1 - alpha goes to the
+            accelerometer/magnetometer angles
+
+        """
+        FusionFilter.__init__(self)
+        self.alpha = float(alpha)
+        self._r, self._p, self._y = 0.0, 0.0, 0.0
+
+    def _integrate(self, gx, gy, gz, dt):
+        """
+        Integrates the angular velocity (rad/s) into roll, pitch and yaw (rad)
+
+        """
+        roll, pitch = self._r, self._p
+        sr, cr = math.sin(roll), math.cos(roll)
+        cp = math.cos(pitch)
+        if abs(cp) < 1e-6:
+            cp = 1e-6
+        tp = math.sin(pitch)/cp
+        rollDot = gx + sr*tp*gy + cr*tp*gz
+        pitchDot = cr*gy - sr*gz
+        yawDot = (sr*gy + cr*gz)/cp
+        return roll + rollDot*dt, pitch + pitchDot*dt, self._y + yawDot*dt
+
+    def _setEuler(self, roll, pitch, yaw):
+        self._r, self._p, self._y = roll, pitch, yaw
+        cr, sr = math.cos(0.5*roll), math.sin(0.5*roll)
+        cp, sp = math.cos(0.5*pitch), math.sin(0.5*pitch)
+        cy, sy = math.cos(0.5*yaw), math.sin(0.5*yaw)
+        self._q0 = cr*cp*cy + sr*sp*sy
+        self._q1 = sr*cp*cy - cr*sp*sy
+        self._q2 = cr*sp*cy + sr*cp*sy
+        self._q3 = cr*cp*sy - sr*sp*cy
+        self._roll = math.degrees(roll)
+        self._pitch = math.degrees(pitch)
+        self._yaw = math.degrees(yaw)
+        self._euler_dirty = False
+
+    @property
+    def q(self):
+        return np.array([self._q0, self._q1, self._q2, self._q3])
+
+    @q.setter
+    def q(self, q):
+        FusionFilter.q.fset(self, q)
+        self.computeOrientation((self._q0, self._q1, self._q2, self._q3))
+        self._r, self._p, self._y = math.radians(self._roll), math.radians(self._pitch), math.radians(self._yaw)
+
+    @staticmethod
+    def _blendAngle(a, b, alpha):
+        # Blend through the shortest arc so that +-180 degrees does not jump
+        return a + (1.0 - alpha)*math.atan2(math.sin(b - a), math.cos(b - a))
+
+    def updateRollAndPitch(self, ax, ay, az, gx, gy, gz, dt):
+        """
+        Computes roll and pitch, same parameters as Madgwick.updateRollAndPitch
+
+        """
+        roll, pitch, yaw = self._integrate(gx*DEG_TO_RAD, gy*DEG_TO_RAD, gz*DEG_TO_RAD, dt)
+        rollAcc = math.atan2(ay, az)
+        pitchAcc = math.atan2(-ax, sqrt(ay*ay + az*az))
+        self._setEuler(self._blendAngle(roll, rollAcc, self.alpha), self._blendAngle(pitch, pitchAcc, self.alpha), yaw)
+
+    def updateRollPitchYaw(self, ax, ay, az, gx, gy, gz, mx, my, mz, dt):
+        """
+        Computes roll, pitch and yaw, same parameters as Madgwick.updateRollPitchYaw
+
+        """
+        roll, pitch, yaw = self._integrate(gx*DEG_TO_RAD, gy*DEG_TO_RAD, gz*DEG_TO_RAD, dt)
+        rollAcc = math.atan2(ay, az)
+        pitchAcc = math.atan2(-ax, sqrt(ay*ay + az*az))
+        roll = self._blendAngle(roll, rollAcc, self.alpha)
+        pitch = self._blendAngle(pitch, pitchAcc, self.alpha)
+        # Tilt compensated heading
+        sr, cr = math.sin(roll), math.cos(roll)
+        sp, cp = math.sin(pitch), math.cos(pitch)
+        xh = mx*cp + my*sr*sp + mz*cr*sp
+        yh = my*cr - mz*sr
+        yawMag = math.atan2(-yh, xh)
+        self._setEuler(roll, pitch, self._blendAngle(yaw, yawMag, self.alpha))
+
+
+FUSION_FILTERS = {
+    "madgwick": FastMadgwick,
+    "mahony": Mahony,
+    "complementary": Complementary,
+}
+
+
+def makeFusionFilter(name = "madgwick", **kwargs):
+    """
+    Builds one of the FUSION_FILTERS by name, kwargs go to its constructor
+
+    """
+    if name not in FUSION_FILTERS:
+        raise Exception(f"Unknown fusion filter '{name}', available: {list(FUSION_FILTERS.keys())}")
+    return FUSION_FILTERS[name](**kwargs)
+
+def quaternionToEuler(q):
+    """
+    Computes euler angles from an array of quaternions
+
+    Parameter
+    ---------
+    q: array of shape (..., 4)
+
+    Return
+    ------
+    euler: array of shape (..., 3) with roll, pitch and yaw in degrees,
+        same convention as Madgwick.computeOrientation
+
+    """
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    euler = np.empty(q.shape[:-1] + (3,))
+    euler[..., 0] = np.degrees(np.arctan2(2*q0*q1 + 2*q2*q3, q0*q0 + q3*q3 - q1*q1 - q2*q2))
+    euler[..., 1] = np.degrees(-1*np.arcsin(np.clip(2*(q1*q3 - q0*q2), -1.0, 1.0)))
+    euler[..., 2] = np.degrees(np.arctan2(2*q1*q2 + 2*q0*q3, q0*q0 + q1*q1 - q2*q2 - q3*q3))
+    return euler
+
+
+def fuseBatch(acc, gyr, dt, mag=None, beta=None, q=None, fusion=None):
+    """
+    Runs the Madgwick filter (or any other FusionFilter) over a whole recording
+
+    Parameters
+    ----------
+    acc: array of shape (N, 3)
+    gyr: array of shape (N, 3), degrees/s
+    dt: float or array of shape (N,) with the interval before each sample
+    mag: optional array of shape (N, 3), yaw is only meaningful with it
+    beta: optional filter gain, Madgwick default otherwise
+    q: optional initial quaternion
+    fusion: optional FusionFilter instance to run instead of FastMadgwick
+
+    Return
+    ------
+    quaternions: array of shape (N, 4), NaN for the rows that cannot be
+        fused (NaN values or zero acceleration), the filter keeps its state
+        across them
+    euler: array of shape (N, 3) with roll, pitch and yaw in degrees
+
+    """
+    n = len(acc)
+    fusion = FastMadgwick() if fusion is None else fusion
+    if beta is not None:
+        fusion.beta = beta
+    if q is not None:
+        fusion.q = np.asarray(q, dtype=float)
+    dts = np.broadcast_to(np.asarray(dt, dtype=float), (n,)).tolist()
+    # Python floats, indexing numpy arrays element by element would be slower than the update itself
+    samples = np.hstack([acc, gyr] if mag is None else [acc, gyr, mag])
+    valid = validSamples(samples, acc, mag).tolist()
+    samples = samples.tolist()
+    update = fusion.updateRollAndPitch if mag is None else fusion.updateRollPitchYaw
+    quaternions = np.full((n, 4), np.nan)
+    for i in range(n):
+        if not valid[i]:
+            continue
+        update(*samples[i], dts[i])
+        quaternions[i] = (fusion._q0, fusion._q1, fusion._q2, fusion._q3)
+    return quaternions, quaternionToEuler(quaternions)
+
+
+def validSamples(samples, acc, mag=None):
+    """
+    Rows the filters can fuse: no NaN (lost samples in the exports) and a
+    non zero accelerometer (and magnetometer) norm
+
+    """
+    valid = np.all(np.isfinite(samples), axis=-1) & np.any(np.asarray(acc) != 0, axis=-1)
+    if mag is not None:
+        valid &= np.any(np.asarray(mag) != 0, axis=-1)
+    return valid
+
+
+def fuseBatchMulti(acc, gyr, dt, mag=None, beta=None, q=None):
+    """
+    Runs one Madgwick filter per session side by side, the state is a
+    (sessions x 4) array and every step is vectorized across sessions
+
+    Parameters
+    ----------
+    acc: array of shape (D, N, 3)
+    gyr: array of shape (D, N, 3), degrees/s
+    dt: float, array of shape (N,) or (D, N)
+    mag: optional array of shape (D, N, 3)
+    beta: optional filter gain, Madgwick default otherwise
+    q: optional initial quaternions of shape (D, 4)
+
+    Return
+    ------
+    quaternions: array of shape (D, N, 4)
+    euler: array of shape (D, N, 3) with roll, pitch and yaw in degrees
+
+    """
+    acc = np.asarray(acc, dtype=float)
+    gyr = np.asarray(gyr, dtype=float)
+    d, n = acc.shape[0], acc.shape[1]
+    beta = Madgwick().beta if beta is None else beta
+    dts = np.broadcast_to(np.asarray(dt, dtype=float), (d, n)).T
+    state = np.tile([1.0, 0.0, 0.0, 0.0], (d, 1)) if q is None else np.array(q, dtype=float)
+    quaternions = np.empty((d, n, 4))
+
+    # Invalid rows keep the previous state and give NaN quaternions, as in fuseBatch
+    valid = validSamples(np.concatenate([acc, gyr] if mag is None else [acc, gyr, np.asarray(mag, dtype=float)], axis=2), acc, mag).T
+    acc = np.where(valid.T[..., np.newaxis], acc, [0.0, 0.0, 1.0])
+    gyr = np.where(valid.T[..., np.newaxis], gyr, 0.0)
+    a = acc / np.linalg.norm(acc, axis=2, keepdims=True)
+    g = np.transpose(gyr, (1, 0, 2)) * HALF_DEG_TO_RAD
+    a = np.transpose(a, (1, 0, 2))
+    if mag is not None:
+        m = np.where(valid.T[..., np.newaxis], np.asarray(mag, dtype=float), [1.0, 0.0, 0.0])
+        m = np.transpose(m / np.linalg.norm(m, axis=2, keepdims=True), (1, 0, 2))
+
+    for i in range(n):
+        q0, q1, q2, q3 = state[:, 0], state[:, 1], state[:, 2], state[:, 3]
+        ax, ay, az = a[i, :, 0], a[i, :, 1], a[i, :, 2]
+        f0 = 2.0*(q1*q3 - q0*q2) - ax
+        f1 = 2.0*(q0*q1 + q2*q3) - ay
+        f2 = 2.0*(0.5 - q1*q1 - q2*q2) - az
+        s0 = -2.0*q2*f0 + 2.0*q1*f1
+        s1 = 2.0*q3*f0 + 2.0*q0*f1 - 4.0*q1*f2
+        s2 = -2.0*q0*f0 + 2.0*q3*f1 - 4.0*q2*f2
+        s3 = 2.0*q1*f0 + 2.0*q2*f1
+        if mag is not None:
+            mx, my, mz = m[i, :, 0], m[i, :, 1], m[i, :, 2]
+            hx = (2*q0*q0 -1 + 2*q1*q1)*mx + 2*(q1*q2 - q0*q3)*my + 2*(q1*q3 + q0*q2)*mz
+            hy = 2*(q1*q2 + q0*q3)*mx + (2*q0*q0 -1 + 2*q2*q2)*my + 2*(q2*q3 - q0*q1)*mz
+            bz = 2*(q1*q3 - q0*q2)*mx + 2*(q2*q3 + q0*q1)*my + (2*q0*q0 -1 +2*q3*q3)*mz
+            bx = np.sqrt(hx*hx + hy*hy)
+            f3 = 2*bx*(0.5 - q2*q2 - q3*q3) +2*bz*(q1*q3 - q0*q2) - mx
+            f4 = 2*bx*(q1*q2 - q0*q3) +2*bz*(q0*q1 + q2*q3) - my
+            f5 = 2*bx*(q0*q2 + q1*q3) +2*bz*(0.5 - q1*q1 -q2*q2) - mz
+            s0 = s0 - 2*bz*q2*f3 + (-2*bx*q3 + 2*bz*q1)*f4 + 2*bx*q2*f5
+            s1 = s1 + 2*bz*q3*f3 + (2*bx*q2 + 2*bz*q0)*f4 + (2*bx*q3 - 4*bz*q1)*f5
+            s2 = s2 + (-4*bx*q2 - 2*bz*q0)*f3 + (2*bx*q1 + 2*bz*q3)*f4 + (2*bx*q0 - 4*bz*q2)*f5
+            s3 = s3 + (-4*bx*q3 + 2*bz*q1)*f3 + (-2*bx*q0 + 2*bz*q2)*f4 + 2*bx*q1*f5
+        sLength = np.sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+        step = np.divide(beta, sLength, out=np.zeros_like(sLength), where=sLength > 0)
+        gx, gy, gz = g[i, :, 0], g[i, :, 1], g[i, :, 2]
+        dt_i = dts[i]
+        previous = state
+        state = np.stack([
+            q0 + (-q1*gx - q2*gy - q3*gz - step*s0)*dt_i,
+            q1 + (q0*gx + q2*gz - q3*gy - step*s1)*dt_i,
+            q2 + (q0*gy - q1*gz + q3*gx - step*s2)*dt_i,
+            q3 + (q0*gz + q1*gy - q2*gx - step*s3)*dt_i,
+        ], axis=1)
+        state /= np.linalg.norm(state, axis=1, keepdims=True)
+        state = np.where(valid[i][:, np.newaxis], state, previous)
+        quaternions[:, i] = np.where(valid[i][:, np.newaxis], state, np.nan)
+    return quaternions, quaternionToEuler(quaternions)
+
+
+def exportIntervals(timestamps, dt=0.1, maxDt=0.5):
+    """
+    Interval before each sample from the export timestamps, dt where they
+    are unknown or not increasing, clamped to maxDt like the live filter
+    (ORIENTATION_MAX_DT) so that a gap does not throw the filter off
+
+    """
+    dts = np.full(len(timestamps), float(dt))
+    if len(timestamps) > 1:
+        steps = np.diff(np.asarray(timestamps, dtype=float))
+        dts[1:] = np.where(np.isfinite(steps) & (steps > 0), steps, dt)
+    return np.minimum(dts, maxDt)
+
+
+def orientationFromExport(file_path, dt=0.1, beta=None, maxDt=0.5):
+    """
+    Computes the orientation of an IMU csv export (the *_IMU_*.csv files written by BLE-Connect)
+
+    The intervals come from the timestamp column when the export has one,
+    dt is only used for the rows without a usable timestamp.
+
+    Return
+    ------
+    df: the export with q0..q3, roll, pitch and yaw columns added, NaN on
+        the lost sample rows
+
+    """
+    import pandas as pd
+    df = pd.read_csv(file_path)
+    if "timestamp" in df.columns:
+        dt = exportIntervals(df["timestamp"].to_numpy(), dt, maxDt)
+    quaternions, euler = fuseBatch(df[["accel_x", "accel_y", "accel_z"]].to_numpy(), df[["gyr_x", "gyr_y", "gyr_z"]].to_numpy(), dt, beta=beta)
+    for i in range(4):
+        df[f"q{i}"] = quaternions[:, i]
+    df["roll"] = euler[:, 0]
+    df["pitch"] = euler[:, 1]
+    df["yaw"] = euler[:, 2]
+    return df
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# quaternion.py and fusion_benchmark.py are top level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
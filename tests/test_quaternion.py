@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from quaternion import Madgwick, FastMadgwick
+
+DT = 0.01
+
+
+def seeded_session(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    acc = np.array([0.0, 0.0, 1.0]) + 0.1 * rng.standard_normal((n, 3))
+    gyr = 50.0 * rng.standard_normal((n, 3))
+    mag = np.array([0.3, 0.0, 0.4]) + 0.05 * rng.standard_normal((n, 3))
+    return acc, gyr, mag
+
+
+def run(fusion, acc, gyr, mag=None):
+    update = fusion.updateRollAndPitch if mag is None else fusion.updateRollPitchYaw
+    out = []
+    for sample in np.hstack([acc, gyr] if mag is None else [acc, gyr, mag]).tolist():
+        update(*sample, DT)
+        out.append(fusion.q)
+    return np.array(out)
+
+
+def axis_angle(axis, degrees):
+    half = np.radians(degrees) / 2
+    return np.concatenate([[np.cos(half)], np.sin(half) * np.asarray(axis, dtype=float)])
+
+
+def multiply(p, q):
+    return np.array([
+        p[0]*q[0] - p[1]*q[1] - p[2]*q[2] - p[3]*q[3],
+        p[0]*q[1] + p[1]*q[0] + p[2]*q[3] - p[3]*q[2],
+        p[0]*q[2] - p[1]*q[3] + p[2]*q[0] + p[3]*q[1],
+        p[0]*q[3] + p[1]*q[2] - p[2]*q[1] + p[3]*q[0],
+    ])
+
+
+def rotate(fusion, axis, degrees, steps=1000):
+    # Pure gyroscope integration, the accelerometer correction is disabled by a zero beta
+    rate = np.asarray(axis, dtype=float) * degrees / (steps * DT)
+    for _ in range(steps):
+        fusion.updateRollAndPitch(0.0, 0.0, 1.0, *rate, DT)
+    return fusion.q
+
+
+def assert_same_rotation(q, expected, atol=1e-4):
+    # q and -q are the same rotation
+    assert min(np.abs(q - expected).max(), np.abs(q + expected).max()) < atol
+
+
+@pytest.mark.parametrize("use_mag", [False, True])
+def test_legacy_frame_matches_madgwick(use_mag):
+    acc, gyr, mag = seeded_session()
+    mag = mag if use_mag else None
+    np.testing.assert_allclose(run(FastMadgwick(legacyFrame=True), acc, gyr, mag), run(Madgwick(), acc, gyr, mag), atol=1e-9)
+
+
+@pytest.mark.parametrize("use_mag", [False, True])
+def test_default_frame_no_longer_matches_madgwick(use_mag):
+    # The default FastMadgwick integrates the gyroscope in the sensor frame, Madgwick does not,
+    # so the two drift apart as soon as the sensor is tilted
+    acc, gyr, mag = seeded_session()
+    mag = mag if use_mag else None
+    assert np.abs(run(FastMadgwick(), acc, gyr, mag) - run(Madgwick(), acc, gyr, mag)).max() > 1e-3
+
+
+def test_sensor_frame_rotation():
+    # 90 deg about x, then 90 deg about the rotated y axis of the sensor: q = qx * qy
+    fusion = FastMadgwick(b=0.0)
+    rotate(fusion, [1, 0, 0], 90)
+    assert_same_rotation(rotate(fusion, [0, 1, 0], 90), multiply(axis_angle([1, 0, 0], 90), axis_angle([0, 1, 0], 90)))
+
+
+def test_legacy_frame_rotation_order():
+    # Madgwick's order composes the same rotations the other way round, qy * qx
+    fusion = FastMadgwick(b=0.0, legacyFrame=True)
+    rotate(fusion, [1, 0, 0], 90)
+    assert_same_rotation(rotate(fusion, [0, 1, 0], 90), multiply(axis_angle([0, 1, 0], 90), axis_angle([1, 0, 0], 90)))